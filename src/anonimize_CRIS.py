@@ -1,48 +1,97 @@
 #!/usr/bin/env python
 
-import json
 from pathlib import Path
-from uuid import uuid4
-from copy import deepcopy
-from tqdm import tqdm
+from typing import Optional
 import sys
 
-def main(input_stream):
-    data = json.load(input_stream)
+# The digest helpers live with the other preparsing scripts
+sys.path.append(str(Path(__file__).parent / "data_preparsing"))
 
-    new_ids = {}
-    new_authors = []
+from digest import DigestFormat, open_digest_reader, open_digest_writer
+from instrumentation import (
+    Instruments,
+    add_instrumentation_arguments,
+    instruments_from_args,
+)
+from lazy import lazy_import
+from pseudonyms import SECRET_ENV_VAR, make_pseudonyms
 
-    for author in tqdm(data["authors"], desc="Making new authors..."):
-        if not new_ids.get(author["id"]):
-            new_ids[author["id"]] = str(uuid4())
-        new_author = deepcopy(author)
-        new_author["id"] = new_ids[author["id"]]
-        new_authors.append(new_author)
+tqdm = lazy_import("tqdm")
 
-    assert len(list(new_ids.values())) == len(set(new_ids.values()))
 
-    new_papers = []
-    for paper in tqdm(data["papers"], desc="Replacing paper IDs..."):
-        new_paper = deepcopy(paper)
-        new_paper["authors"] = [new_ids[id] for id in paper["authors"]]
-        new_papers.append(new_paper)
+def main(
+    input_path: Optional[Path],
+    output_path: Optional[Path],
+    format: DigestFormat,
+    secret_file: Optional[Path] = None,
+    instruments: Optional[Instruments] = None,
+):
+    instruments = instruments or Instruments("anonimize_CRIS")
+    pseudonym = make_pseudonyms(secret_file)
 
-    return {"authors": new_authors, "papers": new_papers}
+    # The records are streamed through, and we just change their IDs
+    with open_digest_reader(input_path) as reader, open_digest_writer(
+        output_path, format
+    ) as writer:
+        with instruments.stage("authors") as stage:
+            for author in tqdm.tqdm(reader.authors(), desc="Making new authors..."):
+                author["id"] = pseudonym(author["id"])
+                writer.write_author(author)
+                stage.count(authors=1)
 
-if __name__ == "__main__":
+        with instruments.stage("papers") as stage:
+            for paper in tqdm.tqdm(reader.papers(), desc="Replacing paper IDs..."):
+                paper["authors"] = [pseudonym(id) for id in paper["authors"]]
+                writer.write_paper(paper)
+                stage.count(papers=1, authorships=len(paper["authors"]))
+
+    instruments.flush()
+
+
+def cli(argv: Optional[list[str]] = None) -> None:
+    """Run the script with these command line arguments (or sys.argv)"""
     import argparse
 
     parser = argparse.ArgumentParser()
 
-    parser.add_argument("--input_path", type=Path, default=None, help="JSON data to anonimize")
-    parser.add_argument("--output_path", type=Path, default=None, help="Output path to write")
+    parser.add_argument(
+        "--input_path", type=Path, default=None, help="JSON data to anonimize"
+    )
+    parser.add_argument(
+        "--output_path", type=Path, default=None, help="Output path to write"
+    )
+    parser.add_argument(
+        "--format",
+        choices=[x.value for x in DigestFormat],
+        default="json",
+        help="Format of the output digest",
+    )
+    parser.add_argument(
+        "--secret_file",
+        type=Path,
+        default=None,
+        help=(
+            "File with a secret key, to make stable pseudonyms. Defaults to "
+            f"the {SECRET_ENV_VAR} environment variable. If neither is given, "
+            "the pseudonyms are random."
+        ),
+    )
 
-    args = parser.parse_args()
-    
-    result = main(args.input_path.open("r") if args.input_path else sys.stdin)
+    add_instrumentation_arguments(parser)
 
-    stream = args.output_path.open("w+") if args.output_path else sys.stdout
+    args = parser.parse_args(argv)
 
-    json.dump(result, stream)
+    if args.format == "columnar" and args.output_path is None:
+        parser.error("Columnar output needs an --output_path folder")
 
+    main(
+        args.input_path,
+        args.output_path,
+        DigestFormat(args.format),
+        args.secret_file,
+        instruments=instruments_from_args(args, "anonimize_CRIS"),
+    )
+
+
+if __name__ == "__main__":
+    cli()
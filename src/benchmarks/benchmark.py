@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+
+"""Time and memory benchmarks of the preparsing, on synthetic IRIS data.
+
+For each scale, we make synthetic IRIS files with `synthetic_iris.py`, and
+measure the main stages of the preparsing on them:
+    - `read_iris_data` on each file;
+    - `parse_file_simple` on each (already read) file;
+    - `filter_records` (what `filter_json.py` does) on the whole digest;
+    - `make_edgelist` on the filtered papers;
+    - `anonimize_CRIS.main` on the digest, from file to file.
+
+Each stage is timed (the best of some runs), and its peak memory is taken
+with tracemalloc in a separate run, since tracing slows everything down.
+
+The results are compared with a stored baseline, and the stages that got
+slower (or bigger) than the tolerance are reported as regressions. Timings
+depend on the machine, so save a baseline (`--save_baseline`) on the same
+machine before comparing.
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable, Optional
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import tracemalloc
+
+# anonimize_CRIS shows progress bars, that would only get in the way here.
+# This has to be set before tqdm is imported.
+os.environ.setdefault("TQDM_DISABLE", "1")
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent / "data_preparsing"))
+sys.path.append(str(Path(__file__).parent.parent))
+
+import anonimize_CRIS
+from digest import DigestFormat
+from filter_json import DEFAULT_FILTERS, filter_records
+from iris_to_json import (
+    AuthorGlobber,
+    ParsedFile,
+    digest_records,
+    merge_parsed_files,
+    parse_file_simple,
+    read_iris_data,
+    write_digest,
+)
+from json_to_network import WeightStrategy, make_edgelist
+from synthetic_iris import SyntheticConfig, generate
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+
+# Changes smaller than these are just noise, whatever the ratio
+NOISE = {"seconds": 0.05, "peak_mib": 1.0}
+
+# Papers per year are about as many as the authors in the real data
+SCALES = {
+    "small": SyntheticConfig(num_authors=2_000, papers_per_year=2_000),
+    "medium": SyntheticConfig(num_authors=10_000, papers_per_year=10_000),
+    "large": SyntheticConfig(num_authors=50_000, papers_per_year=40_000),
+}
+
+
+@dataclass
+class Workload:
+    """The inputs of each stage, made ahead of time"""
+
+    paths: list[str]
+    tables: list[pd.DataFrame]
+    authors: list[dict]
+    papers: list[dict]
+    filtered_papers: list[dict]
+    digest_path: Path
+    output_dir: Path
+
+
+def prepare(config: SyntheticConfig, folder: Path) -> Workload:
+    metadata = json.loads(generate(config, folder).read_text())
+    paths = [x["path"] for x in metadata["files"]]
+
+    tables = []
+    for path in paths:
+        with open(path, "r") as stream:
+            tables.append(read_iris_data(stream))
+
+    gobbler, papers = merge_parsed_files(
+        ParsedFile(gobbler, parse_file_simple(gobbler, table))
+        for gobbler, table in ((AuthorGlobber(), x) for x in tables)
+    )
+    digest_path = Path(folder) / "digest.jsonl"
+    write_digest(gobbler, papers, digest_path, DigestFormat.JSONL)
+
+    authors, papers = (list(x) for x in digest_records(gobbler, papers))
+    _, filtered_papers = filter_records(authors, papers, DEFAULT_FILTERS)
+
+    return Workload(
+        paths=paths,
+        tables=tables,
+        authors=authors,
+        papers=papers,
+        filtered_papers=list(filtered_papers),
+        digest_path=digest_path,
+        output_dir=Path(folder),
+    )
+
+
+def run_read_iris_data(workload: Workload) -> None:
+    for path in workload.paths:
+        with open(path, "r") as stream:
+            read_iris_data(stream)
+
+
+def run_parse_file_simple(workload: Workload) -> None:
+    for table in workload.tables:
+        parse_file_simple(AuthorGlobber(), table)
+
+
+def run_filter_records(workload: Workload) -> None:
+    authors, papers = filter_records(workload.authors, workload.papers, DEFAULT_FILTERS)
+    list(authors), list(papers)
+
+
+def run_make_edgelist(workload: Workload) -> None:
+    make_edgelist(workload.filtered_papers, WeightStrategy.PAPER_SIZE_MODERATED)
+
+
+def run_anonimize_CRIS(workload: Workload) -> None:
+    anonimize_CRIS.main(
+        workload.digest_path,
+        workload.output_dir / "anonymized.jsonl",
+        DigestFormat.JSONL,
+    )
+
+
+STAGES: dict[str, Callable[[Workload], None]] = {
+    "read_iris_data": run_read_iris_data,
+    "parse_file_simple": run_parse_file_simple,
+    "filter_records": run_filter_records,
+    "make_edgelist": run_make_edgelist,
+    "anonimize_CRIS.main": run_anonimize_CRIS,
+}
+
+
+def measure(stage: Callable[[Workload], None], workload: Workload, repeat: int) -> dict:
+    """The best time of `repeat` runs, and the peak traced memory of one"""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = perf_counter()
+        stage(workload)
+        times.append(perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    stage(workload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"seconds": min(times), "peak_mib": peak / 2**20}
+
+
+def run_benchmarks(scales: list[str], repeat: int) -> dict:
+    results = {}
+    for scale in scales:
+        with TemporaryDirectory() as folder:
+            log.info(f"Making the {scale} dataset...")
+            workload = prepare(SCALES[scale], Path(folder))
+            log.info(
+                f"{scale}: {len(workload.authors)} authors, "
+                f"{len(workload.papers)} papers, "
+                f"{sum(len(x['authors']) for x in workload.papers)} authorships"
+            )
+            results[scale] = {}
+            for name, stage in STAGES.items():
+                results[scale][name] = measure(stage, workload, repeat)
+                log.info(f"{scale} {name}: {results[scale][name]}")
+    return results
+
+
+@dataclass
+class Comparison:
+    scale: str
+    stage: str
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline if self.baseline else float("inf")
+
+
+def compare(results: dict, baseline: dict) -> list[Comparison]:
+    """Compare the results with the stages and scales that are in the baseline"""
+    comparisons = []
+    for scale, stages in results.items():
+        for stage, metrics in stages.items():
+            old = baseline.get(scale, {}).get(stage)
+            if old is None:
+                continue
+            for metric, value in metrics.items():
+                if metric in old:
+                    comparisons.append(
+                        Comparison(scale, stage, metric, old[metric], value)
+                    )
+    return comparisons
+
+
+def report(comparisons: list[Comparison], tolerance: float) -> list[Comparison]:
+    """Print the comparisons, and return the regressions"""
+    regressions = []
+    print(f"{'scale':<8}{'stage':<22}{'metric':<10}{'baseline':>10}{'now':>10}")
+    for x in comparisons:
+        flag = ""
+        if abs(x.current - x.baseline) < NOISE.get(x.metric, 0):
+            pass
+        elif x.ratio > 1 + tolerance:
+            flag = "  REGRESSION"
+            regressions.append(x)
+        elif x.ratio < 1 - tolerance:
+            flag = "  improved"
+        print(
+            f"{x.scale:<8}{x.stage:<22}{x.metric:<10}"
+            f"{x.baseline:>10.3f}{x.current:>10.3f}  x{x.ratio:.2f}{flag}"
+        )
+    return regressions
+
+
+def main(
+    scales: list[str],
+    repeat: int,
+    baseline_path: Path,
+    tolerance: float,
+    save_baseline: bool = False,
+    output_path: Optional[Path] = None,
+) -> int:
+    """Run the benchmarks. Returns 1 if there are regressions, 0 otherwise"""
+    results = run_benchmarks(scales, repeat)
+    record = {
+        "machine": {"python": platform.python_version(), "node": platform.node()},
+        "results": results,
+    }
+
+    if output_path:
+        Path(output_path).write_text(json.dumps(record, indent=4))
+
+    if save_baseline:
+        # We keep the other scales of the old baseline, if any
+        if baseline_path.exists():
+            old = json.loads(baseline_path.read_text())
+            record["results"] = {**old["results"], **results}
+        baseline_path.write_text(json.dumps(record, indent=4))
+        log.info(f"Saved the baseline to {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        log.warning(f"No baseline in {baseline_path}: run with --save_baseline")
+        print(json.dumps(results, indent=4))
+        return 0
+
+    baseline = json.loads(baseline_path.read_text())
+    if baseline["machine"] != record["machine"]:
+        log.warning(f"The baseline was made on {baseline['machine']}")
+
+    regressions = report(compare(results, baseline["results"]), tolerance)
+    if regressions:
+        log.warning(f"{len(regressions)} regression(s) over x{1 + tolerance:.2f}")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--scales",
+        help="Scales to run",
+        nargs="+",
+        choices=list(SCALES),
+        default=["small", "medium"],
+    )
+    parser.add_argument(
+        "--repeat", help="Runs to take the best time of", type=int, default=3
+    )
+    parser.add_argument(
+        "--baseline",
+        help="Baseline to compare with (or to save to)",
+        type=Path,
+        default=DEFAULT_BASELINE,
+    )
+    parser.add_argument(
+        "--tolerance",
+        help="How much slower (or bigger) a stage can get, e.g. 0.2 for 20%%",
+        type=float,
+        default=0.2,
+    )
+    parser.add_argument(
+        "--save_baseline",
+        action="store_true",
+        help="Save the results as the new baseline, instead of comparing",
+    )
+    parser.add_argument(
+        "--output", help="Also write the results here", type=Path, default=None
+    )
+
+    args = parser.parse_args()
+
+    for name in ("iris_to_json", "filter_json", "synthetic_iris"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    sys.exit(
+        main(
+            args.scales,
+            args.repeat,
+            args.baseline,
+            args.tolerance,
+            save_baseline=args.save_baseline,
+            output_path=args.output,
+        )
+    )
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""Check how long it takes to import each of the preparsing scripts.
+
+Each script is imported in a fresh interpreter with `python -X importtime`,
+and its cumulative import time (the best of some runs) is compared with its
+budget. The heavy modules (numpy, pandas, ...) must not be imported at all:
+they are imported lazily, when they are first used (see `lazy.py`).
+
+The budgets are for a reasonably fast machine. On a slower one, scale them
+with --budget_factor.
+"""
+from pathlib import Path
+import json
+import logging
+import subprocess
+import sys
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+SRC = Path(__file__).parent.parent
+
+# Import time budgets, in milliseconds, and the folder of each script
+BUDGETS_MS = {
+    "filter_json": 80,
+    "group_files": 80,
+    "json_to_network": 100,
+    "digest_index": 150,
+    "iris_to_json": 150,
+    "pipeline": 160,
+    "temporal_edges": 100,
+    "anonimize_CRIS": 80,
+}
+FOLDERS = {"anonimize_CRIS": SRC}
+
+HEAVY_MODULES = ("numpy", "pandas", "scipy", "jellyfish", "tqdm")
+
+
+def import_time_ms(module: str) -> float:
+    """The cumulative import time of a module, in a fresh interpreter"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=FOLDERS.get(module, SRC / "data_preparsing"),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    for line in reversed(result.stderr.splitlines()):
+        # "import time: self [us] | cumulative | imported package"
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]) / 1000
+    raise ValueError(f"No import time for {module} in:\n{result.stderr}")
+
+
+def heavy_imports(module: str) -> list[str]:
+    """The heavy modules that importing a module also imports"""
+    code = (
+        f"import sys, json, {module}; "
+        f"print(json.dumps([x for x in {HEAVY_MODULES} if x in sys.modules]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=FOLDERS.get(module, SRC / "data_preparsing"),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main(modules: list[str], repeat: int, budget_factor: float) -> int:
+    """Check the modules. Returns 1 if any is over budget, 0 otherwise"""
+    failures = 0
+    print(f"{'module':<18}{'ms':>8}{'budget':>8}  heavy imports")
+    for module in modules:
+        ms = min(import_time_ms(module) for _ in range(repeat))
+        budget = BUDGETS_MS[module] * budget_factor
+        heavy = heavy_imports(module)
+        flag = ""
+        if ms > budget or heavy:
+            flag = "  OVER BUDGET"
+            failures += 1
+        print(f"{module:<18}{ms:>8.1f}{budget:>8.0f}  {', '.join(heavy) or '-'}{flag}")
+
+    if failures:
+        log.warning(f"{failures} module(s) over budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--modules",
+        help="Modules to check",
+        nargs="+",
+        choices=list(BUDGETS_MS),
+        default=list(BUDGETS_MS),
+    )
+    parser.add_argument(
+        "--repeat", help="Runs to take the best time of", type=int, default=5
+    )
+    parser.add_argument(
+        "--budget_factor",
+        help="Multiply the budgets by this, e.g. 2 on a slow machine",
+        type=float,
+        default=1.0,
+    )
+
+    args = parser.parse_args()
+
+    sys.exit(main(args.modules, args.repeat, args.budget_factor))
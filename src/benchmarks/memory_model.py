@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+"""Measure the memory used by the in-memory model of iris_to_json.py
+
+We make a synthetic dataset with about a million authorships, and load it
+both in the current (slotted, array-backed) model and in a copy of the old
+one (plain classes, papers with lists of ID strings), measuring each with
+tracemalloc.
+"""
+import random
+from array import array
+import sys
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from uuid import UUID
+
+sys.path.append(str(Path(__file__).parent.parent / "data_preparsing"))
+
+from iris_to_json import Author, Paper, intern
+
+DEPARTMENTS = [f"department of things number {i}" for i in range(60)]
+
+
+class LegacyAuthor:
+    """The old Author: a plain class, with an instance __dict__"""
+
+    def __init__(self, name, surname, affiliation, department, id) -> None:
+        self.name = name
+        self.surname = surname
+        self.affiliation = affiliation
+        self.department = department
+        self.id = id
+
+
+@dataclass
+class LegacyPaper:
+    """The old Paper: the authors are a list of ID strings"""
+
+    id: str
+    title: str
+    year: int
+    authors: list[str]
+
+
+def make_rows(authorships: int, num_authors: int, seed: int = 42):
+    """Make synthetic (paper, authors) rows, with heavy-tailed paper sizes"""
+    rng = random.Random(seed)
+    authors = [
+        (
+            f"name{i}",
+            f"surname{i}",
+            rng.choice(DEPARTMENTS),
+            str(UUID(int=rng.getrandbits(128))),
+        )
+        for i in range(num_authors)
+    ]
+
+    papers = []
+    total = 0
+    while total < authorships:
+        size = min(int(rng.paretovariate(1.5)), 500, authorships - total)
+        papers.append(rng.sample(range(num_authors), max(size, 1)))
+        total += max(size, 1)
+
+    return authors, papers
+
+
+def measure(build) -> tuple[int, object]:
+    tracemalloc.start()
+    model = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, model
+
+
+def build_legacy(authors, papers):
+    # Every row has its own copy of the strings, like pandas gives us
+    author_objects = {
+        id: LegacyAuthor(name, surname, "university of turin", "".join(dep), id)
+        for name, surname, dep, id in authors
+    }
+    paper_objects = [
+        LegacyPaper(
+            id=f"2318/{i}",
+            title=f"Paper number {i}",
+            year=2000 + i % 20,
+            authors=["".join(authors[x][3]) for x in paper],
+        )
+        for i, paper in enumerate(papers)
+    ]
+    return author_objects, paper_objects
+
+
+def build_compact(authors, papers):
+    author_objects = {
+        id: Author.from_normalized(
+            name, surname, intern("university of turin"), "".join(dep), id
+        )
+        for name, surname, dep, id in authors
+    }
+    paper_objects = [
+        Paper(
+            id=f"2318/{i}",
+            title=f"Paper number {i}",
+            year=2000 + i % 20,
+            authors=array("i", paper),
+        )
+        for i, paper in enumerate(papers)
+    ]
+    return author_objects, paper_objects
+
+
+def main(authorships: int, num_authors: int) -> None:
+    authors, papers = make_rows(authorships, num_authors)
+    print(
+        f"{sum(len(x) for x in papers)} authorships, "
+        f"{len(papers)} papers, {num_authors} authors"
+    )
+
+    for name, build in (("legacy", build_legacy), ("compact", build_compact)):
+        size, _ = measure(lambda: build(authors, papers))
+        print(f"{name:>8}: {size / 2**20:8.1f} MiB")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--authorships", help="Number of authorships", type=int, default=1_000_000
+    )
+    parser.add_argument(
+        "--authors", help="Number of distinct authors", type=int, default=50_000
+    )
+
+    args = parser.parse_args()
+
+    main(args.authorships, args.authors)
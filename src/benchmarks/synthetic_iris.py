@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+
+"""Make synthetic IRIS exports, to test and benchmark the preparsing with.
+
+The files have the same headers as the real exports (all the ones that
+`standardize_header` knows), one row per authorship, and a metadata.json
+like the one in `data/in`. The columns that the preparsing doesn't use are
+filled with placeholders, or left empty. The files are made to look a bit
+like the real data:
+    - the number of authors of each paper is heavy-tailed (Pareto), so there
+      are a few papers with hundreds of authors;
+    - some authors write a lot more than others (Zipf);
+    - some authorships have no CRIS ID, and some authors no department.
+"""
+from dataclasses import dataclass
+from pathlib import Path
+import csv
+import json
+import logging
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+# The original headers of the columns, in export order (the same as in
+# `standardize_header` of iris_to_json.py). The ones that we don't make are
+# left empty.
+HEADERS = {
+    "handle": "Handle",
+    "title": "Titolo",
+    "year": "Anno di pubblicazione",
+    "iris_type": "Tipologia IRIS",
+    "authors": "Tutti gli autori/Curatori",
+    "num_authors": "Nr autori/Curatori (numero)",
+    "recognized_authors": "contributors: Autori/curatori riconosciuti (elenco)",
+    "num_recognized_authors": "contributors: Autori/curatori riconosciuti (conteggio)",
+    "currently_affiliated_authors": "contributors: Autori/curatori attualmente afferenti (elenco)",
+    "num_currently_affiliated_authors": "contributors: Autori/curatori attualmente afferenti (Nr)",
+    "language": "Lingua (denominazione)",
+    "journal_name": "Nome rivista",
+    "journal_issn": "Rivista/Serie: ISSN",
+    "journal_ance_code": "Rivista: codice ANCE",
+    "journal_is_doaj": "rivista: DOAJ (si/no)",
+    "journal_sherpa_romeo_preprint_policy": "rivista: policy sherpa/romeo per pre-print",
+    "journal_sherpa_romeo_policy": "rivista: policy sherpa/romeo per versione editoriale",
+    "journal_sherpa_romeo_postprint_policy": "rivista: policy sherpa/romeo per post-print",
+    "journal_publisher": "rivista: editore",
+    "author_surname": "autore: Cognome",
+    "author_name": "autore: Nome",
+    "author_orcid": "autore: ORCID",
+    "author_cris_id": "autore: ID persona (CRIS)",
+    "author_role": "autore: Ruolo al 01/07/2023",
+    "author_department": "autore: Unità organizzativa interna al 01/07/2023",
+    "scopus_id": "scopus: Identificativo",
+    "scopus_affiliations": "scopus: affiliazioni",
+    "scopus_countries": "scopus: nazioni",
+    "scopus_has_foreign_coauthor": "scopus: presenza coautore straniero",
+}
+
+# Some of the department names of the real data, so that the selected
+# departments of the analysis are there too
+DEPARTMENTS = [
+    "Biotecnologie molecolari e scienze per la salute",
+    "Chimica",
+    "Fisica",
+    "Informatica",
+    "Matematica Giuseppe Peano",
+    "Neuroscienze Rita Levi Montalcini",
+    "Oncologia",
+    "Psicologia",
+    "Scienza e tecnologia del farmaco",
+    "Scienze cliniche e biologiche",
+    "Scienze della vita e biologia dei sistemi",
+    "Scienze mediche",
+    "Scienze agrarie, forestali e alimentari",
+    "Scienze della terra",
+    "Scienze veterinarie",
+    "Economia e statistica Cognetti de Martiis",
+    "Giurisprudenza",
+    "Filosofia e scienze dell'educazione",
+    "Studi storici",
+    "Lingue e letterature straniere e culture moderne",
+]
+
+IRIS_TYPES = ["03A-Articolo su Rivista", "04A-Conferenza", "02A-Capitolo o Saggio"]
+
+ROLES = ["Professore Ordinario", "Professore Associato", "Ricercatore", "Dottorando"]
+
+# The papers are spread over this many journals
+NUM_JOURNALS = 500
+
+
+@dataclass
+class SyntheticConfig:
+    """How big and how skewed the synthetic data is"""
+
+    first_year: int = 2012
+    last_year: int = 2017
+    num_authors: int = 2_000
+    papers_per_year: int = 2_000
+    # Shape of the Pareto distribution of the number of authors per paper.
+    # The lower, the heavier the tail.
+    size_alpha: float = 1.5
+    max_size: int = 1_000
+    # Exponent of the Zipf-like productivity of the authors
+    productivity_exponent: float = 1.0
+    # Fraction of authorships without a CRIS ID (external authors)
+    unknown_fraction: float = 0.05
+    # Fraction of authors without a department
+    no_department_fraction: float = 0.1
+    seed: int = 42
+
+
+def make_authors(config: SyntheticConfig, rng: np.random.Generator) -> pd.DataFrame:
+    n = config.num_authors
+    departments = np.array(DEPARTMENTS, dtype=object)[
+        rng.integers(len(DEPARTMENTS), size=n)
+    ]
+    departments[rng.random(n) < config.no_department_fraction] = ""
+    roles = np.array(ROLES, dtype=object)[rng.integers(len(ROLES), size=n)]
+    return pd.DataFrame(
+        {
+            "author_surname": [f"Surname{i}" for i in range(n)],
+            "author_name": [f"Name{i}" for i in range(n)],
+            "author_orcid": [
+                f"0000-0000-{i // 10000:04d}-{i % 10000:04d}" for i in range(n)
+            ],
+            "author_cris_id": [f"rp{i:07d}" for i in range(n)],
+            "author_role": roles,
+            "author_department": departments,
+        }
+    )
+
+
+def paper_sizes(
+    config: SyntheticConfig, rng: np.random.Generator, n: int
+) -> np.ndarray:
+    """The number of authors of `n` papers, at least one"""
+    sizes = np.floor(rng.pareto(config.size_alpha, size=n) + 1).astype(np.int64)
+    return np.minimum(sizes, min(config.max_size, config.num_authors))
+
+
+def sample_authorships(
+    config: SyntheticConfig, sizes: np.ndarray, rng: np.random.Generator
+) -> tuple[np.ndarray, np.ndarray]:
+    """Pick the authors of papers with some sizes, by their productivity.
+
+    Returns the paper and the author of each authorship. Authors that come
+    up twice in a paper are drawn again a few times, and then dropped, so
+    the largest papers may end up a bit smaller.
+    """
+    productivity = 1 / np.arange(1, config.num_authors + 1) ** (
+        config.productivity_exponent
+    )
+    productivity = rng.permutation(productivity)
+    cumulative = np.cumsum(productivity / productivity.sum())
+    cumulative[-1] = 1
+
+    paper = np.repeat(np.arange(len(sizes)), sizes)
+    chosen = np.searchsorted(cumulative, rng.random(len(paper)), side="right")
+    for _ in range(20):
+        _, first = np.unique(paper * config.num_authors + chosen, return_index=True)
+        again = np.ones(len(chosen), dtype=bool)
+        again[first] = False
+        if not again.any():
+            break
+        chosen[again] = np.searchsorted(
+            cumulative, rng.random(again.sum()), side="right"
+        )
+    else:
+        _, first = np.unique(paper * config.num_authors + chosen, return_index=True)
+        first.sort()
+        paper, chosen = paper[first], chosen[first]
+
+    return paper, chosen
+
+
+def make_year(
+    config: SyntheticConfig,
+    year: int,
+    authors: pd.DataFrame,
+    rng: np.random.Generator,
+) -> pd.DataFrame:
+    """Make the rows of the papers of one year"""
+    sizes = paper_sizes(config, rng, config.papers_per_year)
+    paper, chosen = sample_authorships(config, sizes, rng)
+
+    rows = authors.iloc[chosen].reset_index(drop=True)
+    unknown = rng.random(len(rows)) < config.unknown_fraction
+    rows.loc[
+        unknown, ["author_orcid", "author_cris_id", "author_role", "author_department"]
+    ] = ""
+
+    n = len(sizes)
+    journals = rng.integers(NUM_JOURNALS, size=n)
+    # Some papers may have lost some authors while sampling them
+    num_authors = np.bincount(paper, minlength=n)
+    num_recognized = np.bincount(paper, weights=~unknown, minlength=n).astype(int)
+    papers = pd.DataFrame(
+        {
+            "handle": [f"2318/{year}{i:07d}" for i in range(n)],
+            "title": [f"Synthetic paper {i} of {year}" for i in range(n)],
+            "year": year,
+            "iris_type": np.array(IRIS_TYPES, dtype=object)[
+                rng.integers(len(IRIS_TYPES), size=n)
+            ],
+            "num_authors": num_authors,
+            "num_recognized_authors": num_recognized,
+            "num_currently_affiliated_authors": num_recognized,
+            "language": "Inglese",
+            "journal_name": [f"Journal {x}" for x in journals],
+            "journal_issn": [f"1000-{x:04d}" for x in journals],
+            "journal_is_doaj": np.where(journals % 5 == 0, "si", "no"),
+            "journal_publisher": [f"Publisher {x % 25}" for x in journals],
+            "scopus_id": [f"2-s2.0-{year}{i:07d}" for i in range(n)],
+            "scopus_has_foreign_coauthor": np.where(num_authors > 10, "si", "no"),
+        }
+    )
+
+    rows = pd.concat([papers.iloc[paper].reset_index(drop=True), rows], axis=1)
+    return rows.reindex(columns=list(HEADERS), fill_value="")
+
+
+def write_year(rows: pd.DataFrame, path: Path) -> None:
+    rows.rename(columns=HEADERS).to_csv(path, index=False, quoting=csv.QUOTE_ALL)
+
+
+def generate(config: SyntheticConfig, output_dir: Path) -> Path:
+    """Write one IRIS file per year in `output_dir`, and a metadata.json file
+    that points to them. Returns the path to the metadata"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(config.seed)
+    authors = make_authors(config, rng)
+
+    files = []
+    for year in range(config.first_year, config.last_year + 1):
+        path = output_dir / f"iris_{year}.csv"
+        rows = make_year(config, year, authors, rng)
+        log.info(f"Writing {len(rows)} authorships of {year} to {path}")
+        write_year(rows, path)
+        files.append({"year": year, "path": str(path.absolute())})
+
+    metadata_path = output_dir / "metadata.json"
+    with metadata_path.open("w+") as stream:
+        json.dump({"files": files}, stream, indent=4)
+
+    return metadata_path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    defaults = SyntheticConfig()
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("output_dir", help="Folder to write the files in", type=Path)
+    parser.add_argument(
+        "--first_year", help="First year", type=int, default=defaults.first_year
+    )
+    parser.add_argument(
+        "--last_year", help="Last year", type=int, default=defaults.last_year
+    )
+    parser.add_argument(
+        "--authors",
+        help="Number of distinct authors",
+        type=int,
+        default=defaults.num_authors,
+    )
+    parser.add_argument(
+        "--papers",
+        help="Number of papers per year",
+        type=int,
+        default=defaults.papers_per_year,
+    )
+    parser.add_argument(
+        "--size_alpha",
+        help="Pareto shape of the number of authors per paper (lower is heavier)",
+        type=float,
+        default=defaults.size_alpha,
+    )
+    parser.add_argument(
+        "--max_size",
+        help="Maximum number of authors of a paper",
+        type=int,
+        default=defaults.max_size,
+    )
+    parser.add_argument(
+        "--productivity_exponent",
+        help="Zipf exponent of how many papers each author writes",
+        type=float,
+        default=defaults.productivity_exponent,
+    )
+    parser.add_argument(
+        "--unknown_fraction",
+        help="Fraction of authorships without a CRIS ID",
+        type=float,
+        default=defaults.unknown_fraction,
+    )
+    parser.add_argument(
+        "--no_department_fraction",
+        help="Fraction of authors without a department",
+        type=float,
+        default=defaults.no_department_fraction,
+    )
+    parser.add_argument("--seed", help="Random seed", type=int, default=defaults.seed)
+
+    args = parser.parse_args()
+
+    generate(
+        SyntheticConfig(
+            first_year=args.first_year,
+            last_year=args.last_year,
+            num_authors=args.authors,
+            papers_per_year=args.papers,
+            size_alpha=args.size_alpha,
+            max_size=args.max_size,
+            productivity_exponent=args.productivity_exponent,
+            unknown_fraction=args.unknown_fraction,
+            no_department_fraction=args.no_department_fraction,
+            seed=args.seed,
+        ),
+        args.output_dir,
+    )
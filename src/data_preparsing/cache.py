@@ -0,0 +1,215 @@
+"""A content-addressed cache for the outputs of the preparsing scripts.
+
+Each entry is keyed by the hash of everything that goes into a result:
+    - the contents of the input files;
+    - the parameters of the stage (window, weight strategy, filters, ...);
+    - the source code of the modules that make the result.
+
+If we have already made a result with the same key, we just copy the cached
+files to where they should go instead of making them again. Entries are
+evicted in least recently used order when the cache gets too big.
+"""
+
+import hashlib
+import inspect
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Iterable, Optional, Union
+from uuid import uuid4
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = (
+    Path(os.environ.get("XDG_CACHE_HOME", "~/.cache")).expanduser()
+    / "turin-author-network"
+)
+# In MiB
+DEFAULT_CACHE_SIZE = 2048
+
+# If the cache itself changes, bump this to throw away the old entries
+CACHE_VERSION = 1
+
+_file_hashes: dict[tuple, str] = {}
+
+# Files in a folder that don't go into its hash. The index of a columnar
+# digest (see digest_index.py) is saved in its folder, but it is made from
+# the digest, so building it must not change the digest's hash.
+UNHASHED = ("index.*",)
+
+
+def hash_file(path: Path) -> str:
+    """Hash the contents of a file, or of all files in a folder.
+
+    Hashes are remembered for as long as the file has the same size and
+    modification time, since windows share most of their input files. The
+    UNHASHED files of a folder are skipped.
+    """
+    path = Path(path)
+    if path.is_dir():
+        hasher = hashlib.sha256()
+        files = (
+            x
+            for x in path.rglob("*")
+            if x.is_file() and not any(x.match(pattern) for pattern in UNHASHED)
+        )
+        for file in sorted(files):
+            hasher.update(str(file.relative_to(path)).encode("utf-8"))
+            hasher.update(hash_file(file).encode("utf-8"))
+        return hasher.hexdigest()
+
+    stat = path.stat()
+    memo_key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+    if memo_key in _file_hashes:
+        return _file_hashes[memo_key]
+
+    hasher = hashlib.sha256()
+    with path.open("rb") as stream:
+        while chunk := stream.read(2**20):
+            hasher.update(chunk)
+
+    _file_hashes[memo_key] = hasher.hexdigest()
+    return _file_hashes[memo_key]
+
+
+def cache_key(
+    stage: str,
+    params: dict,
+    inputs: Iterable[Union[str, Path]] = (),
+    code: Iterable[Any] = (),
+) -> str:
+    """Make the key of a result.
+
+    `code` is a list of modules, classes or functions: the whole source file
+    that each of them is defined in goes into the key.
+    """
+    record = {
+        "version": CACHE_VERSION,
+        "stage": stage,
+        "params": params,
+        "inputs": [hash_file(Path(x)) for x in inputs],
+        "code": sorted({hash_file(Path(inspect.getfile(x))) for x in code}),
+    }
+    encoded = json.dumps(record, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _size(path: Path) -> int:
+    if path.is_dir():
+        return sum(x.stat().st_size for x in path.rglob("*") if x.is_file())
+    return path.stat().st_size
+
+
+def _copy(source: Path, destination: Path) -> None:
+    if destination.is_dir():
+        shutil.rmtree(destination)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    if source.is_dir():
+        shutil.copytree(source, destination)
+    else:
+        shutil.copyfile(source, destination)
+
+
+class ResultCache:
+    def __init__(
+        self, root: Path = DEFAULT_CACHE_DIR, max_size: int = DEFAULT_CACHE_SIZE
+    ) -> None:
+        """A cache of results in the `root` folder, of at most `max_size` MiB"""
+        self.root = Path(root)
+        self.max_size = max_size * 2**20
+
+    def restore(self, key: str) -> Optional[dict]:
+        """Copy the files of an entry back to where they were made.
+
+        Returns the info stored with the entry, or None if there is no entry.
+        """
+        entry = self.root / key
+        manifest_path = entry / "manifest.json"
+        try:
+            manifest = json.loads(manifest_path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        for i, path in enumerate(manifest["paths"]):
+            _copy(entry / str(i), Path(path))
+
+        # The modification time of the manifest is the last time we used it
+        os.utime(manifest_path)
+        log.info(f"Restored {len(manifest['paths'])} file(s) from cache {key[:12]}")
+
+        return manifest["info"]
+
+    def store(
+        self, key: str, paths: Iterable[Path], info: Optional[dict] = None
+    ) -> None:
+        """Store copies of some result files (or folders) with their info"""
+        paths = [Path(x) for x in paths]
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        # We fill the entry on the side, so that it shows up all at once
+        staging = self.root / f".staging-{uuid4()}"
+        staging.mkdir()
+        for i, path in enumerate(paths):
+            _copy(path, staging / str(i))
+        manifest = {"paths": [str(x) for x in paths], "info": info or {}}
+        (staging / "manifest.json").write_text(json.dumps(manifest))
+
+        entry = self.root / key
+        if entry.exists():
+            shutil.rmtree(entry)
+        try:
+            staging.rename(entry)
+        except OSError:
+            # Someone else stored the same entry in the meantime
+            shutil.rmtree(staging, ignore_errors=True)
+
+        self.evict(keep=key)
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """Remove the least recently used entries until we fit in the cache"""
+        entries = []
+        for entry in self.root.iterdir():
+            manifest_path = entry / "manifest.json"
+            if entry.name.startswith(".") or not manifest_path.exists():
+                continue
+            entries.append((manifest_path.stat().st_mtime, _size(entry), entry))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda x: x[0]):
+            if total <= self.max_size:
+                break
+            if entry.name == keep:
+                continue
+            log.info(f"Evicting cache entry {entry.name[:12]}")
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+
+def add_cache_arguments(parser) -> None:
+    """Add the cache options to an argparse parser"""
+    parser.add_argument(
+        "--no_cache",
+        "--no-cache",
+        action="store_true",
+        help="Always make the outputs again, without looking in the cache",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        help="Folder to keep the cache in",
+        type=Path,
+        default=DEFAULT_CACHE_DIR,
+    )
+    parser.add_argument(
+        "--cache_size",
+        help="Maximum size of the cache, in MiB",
+        type=int,
+        default=DEFAULT_CACHE_SIZE,
+    )
+
+
+def cache_from_args(args) -> Optional[ResultCache]:
+    if args.no_cache:
+        return None
+    return ResultCache(args.cache_dir, args.cache_size)
@@ -0,0 +1,531 @@
+"""Read and write the author/paper digests, one record at a time.
+
+The digests can be in three formats:
+    - JSON: the original format, a single object with an "authors" and a
+      "papers" list;
+    - JSONL: one record per line, with a "kind" key that is either "author"
+      or "paper". All the authors come before all the papers.
+    - COLUMNAR: a folder with one numpy array per column, see below.
+
+The JSONL format can be read and written in constant memory, so it is the
+one to use when piping the preparsing scripts into each other. The JSON
+format is still written out incrementally, but has to be read in whole.
+
+The COLUMNAR format is a folder of .npy files, loaded as memory maps, so
+many processes reading the same digest share the same pages. Each column
+of the authors and papers is stored as:
+    - `<table>.<column>.npy` for integer columns;
+    - `<table>.<column>.values.npy` (utf-8 bytes) and `.offsets.npy` for
+      string columns, plus a `.null.npy` mask for missing values;
+    - `papers.authors.values.npy` (indexes in the author table) and
+      `papers.authors.offsets.npy` for the authors of each paper.
+What column is of what kind is saved in `meta.json`. Values that are
+neither integers nor strings are saved as JSON-encoded strings.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import sys
+from enum import Enum
+from io import IOBase
+from pathlib import Path
+from typing import Generator, Iterable, Optional, Union
+
+from lazy import lazy_import
+
+np = lazy_import("numpy")
+
+
+class DigestFormat(Enum):
+    JSON = "json"
+    JSONL = "jsonl"
+    COLUMNAR = "columnar"
+
+
+def paper_year(year: Optional[float]) -> Optional[int]:
+    """The year of a paper as an int, or None if it has none.
+
+    Missing years are NaN in the digests made from the IRIS files (that's how
+    pandas reads them), and None in some others.
+    """
+    if year is None or not math.isfinite(year):
+        return None
+    return int(year)
+
+
+def read_records(stream: IOBase) -> Generator[tuple[str, dict], None, None]:
+    """Read a digest of any format, yielding ("author" | "paper", record) tuples"""
+    first_line = stream.readline()
+    if not first_line:
+        return
+
+    # JSONL files have a whole record with a "kind" key on the first line.
+    # JSON files are either indented (so the first line is just "{") or all on
+    # one line, but without a "kind" key.
+    try:
+        first_record = json.loads(first_line)
+    except json.JSONDecodeError:
+        first_record = None
+
+    if isinstance(first_record, dict) and "kind" in first_record:
+        yield first_record.pop("kind"), first_record
+        for line in stream:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield record.pop("kind"), record
+        return
+
+    # One-line JSON was parsed whole already, indented JSON needs the rest
+    if isinstance(first_record, dict):
+        data = first_record
+    else:
+        data = json.loads(first_line + stream.read())
+    for author in data["authors"]:
+        yield "author", author
+    for paper in data["papers"]:
+        yield "paper", paper
+
+
+class DigestReader:
+    """Split a digest in its authors and its papers, without loading it.
+
+    The authors must be consumed before the papers. If `close_stream`, the
+    stream is closed with the reader.
+    """
+
+    def __init__(self, stream: IOBase, close_stream: bool = False) -> None:
+        self.stream = stream
+        self.close_stream = close_stream
+        self._records = read_records(stream)
+        self._first_paper = None
+        self._authors_done = False
+
+    def authors(self) -> Generator[dict, None, None]:
+        for kind, record in self._records:
+            if kind == "paper":
+                self._first_paper = record
+                break
+            yield record
+        self._authors_done = True
+
+    def papers(self) -> Generator[dict, None, None]:
+        if not self._authors_done:
+            # Skip over the authors that nobody wanted
+            for _ in self.authors():
+                pass
+
+        if self._first_paper is not None:
+            yield self._first_paper
+            self._first_paper = None
+
+        for kind, record in self._records:
+            if kind != "paper":
+                raise ValueError("Found an author record after the papers")
+            yield record
+
+    def close(self) -> None:
+        if self.close_stream:
+            self.stream.close()
+
+    def __enter__(self) -> DigestReader:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+def load_digest(stream: IOBase) -> dict:
+    """Load a whole digest of any format in memory"""
+    reader = DigestReader(stream)
+    authors = list(reader.authors())
+    return {"authors": authors, "papers": list(reader.papers())}
+
+
+class DigestWriter:
+    """Write a digest one record at a time. All authors must come first.
+
+    In JSON format, the output is the same as `json.dump` would give for the
+    whole {"authors": [...], "papers": [...]} object, with the same `indent`.
+    If `close_stream`, the stream is closed with the writer.
+    """
+
+    SECTIONS = ("authors", "papers")
+
+    def __init__(
+        self,
+        stream: IOBase,
+        format: DigestFormat = DigestFormat.JSON,
+        indent: Optional[int] = None,
+        cls: Optional[type[json.JSONEncoder]] = None,
+        close_stream: bool = False,
+    ) -> None:
+        self.stream = stream
+        self.format = format
+        self.indent = indent
+        self.cls = cls
+        self.close_stream = close_stream
+
+        # Index of the section we are writing in SECTIONS, and how many
+        # records we have written in it.
+        self._section = -1
+        self._written = 0
+
+    def _start_section(self, section: int) -> None:
+        if section < self._section:
+            raise ValueError("All authors must be written before the papers")
+
+        while self._section < section:
+            self._close_section()
+            self._section += 1
+            self._written = 0
+            if self.format == DigestFormat.JSON:
+                self._open_section()
+
+    def _open_section(self) -> None:
+        name = self.SECTIONS[self._section]
+        if self.indent is None:
+            opening = "{" if self._section == 0 else ", "
+            self.stream.write(f'{opening}"{name}": [')
+        else:
+            opening = "{\n" if self._section == 0 else ",\n"
+            self.stream.write(f'{opening}{" " * self.indent}"{name}": [')
+
+    def _close_section(self) -> None:
+        if self._section < 0 or self.format != DigestFormat.JSON:
+            return
+        if self.indent is not None and self._written:
+            self.stream.write(f'\n{" " * self.indent}]')
+        else:
+            self.stream.write("]")
+
+    def _write(self, kind: str, record: dict) -> None:
+        if self.format == DigestFormat.JSONL:
+            self.stream.write(json.dumps({"kind": kind, **record}, cls=self.cls))
+            self.stream.write("\n")
+            return
+
+        if self.indent is None:
+            if self._written:
+                self.stream.write(", ")
+            self.stream.write(json.dumps(record, cls=self.cls))
+        else:
+            prefix = " " * (self.indent * 2)
+            text = json.dumps(record, indent=self.indent, cls=self.cls)
+            self.stream.write(",\n" if self._written else "\n")
+            self.stream.write("\n".join(prefix + x for x in text.split("\n")))
+
+        self._written += 1
+
+    def write_author(self, author: dict) -> None:
+        self._start_section(0)
+        self._write("author", author)
+
+    def write_paper(self, paper: dict) -> None:
+        self._start_section(1)
+        self._write("paper", paper)
+
+    def write_authors(self, authors: Iterable[dict]) -> None:
+        for author in authors:
+            self.write_author(author)
+
+    def write_papers(self, papers: Iterable[dict]) -> None:
+        for paper in papers:
+            self.write_paper(paper)
+
+    def close(self) -> None:
+        """Finish the digest, and close the stream if `close_stream`"""
+        self._start_section(len(self.SECTIONS) - 1)
+        self._close_section()
+        if self.format == DigestFormat.JSON:
+            self.stream.write("}" if self.indent is None else "\n}")
+        self.stream.flush()
+        if self.close_stream:
+            self.stream.close()
+
+    def __enter__(self) -> DigestWriter:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        elif self.close_stream:
+            # Don't finish a broken digest, but don't leak the file either
+            self.stream.close()
+
+
+COLUMNAR_VERSION = 1
+
+
+def _column_kind(values: list) -> str:
+    """Find out how to store a column: as "int", "str" or "json" strings"""
+    is_int = [
+        isinstance(x, (int, np.integer)) and not isinstance(x, bool) for x in values
+    ]
+    # Integer columns can't have missing values, so they go to "json"
+    if values and all(is_int):
+        return "int"
+    if all(isinstance(x, str) or x is None for x in values):
+        return "str"
+    return "json"
+
+
+def _save_strings(folder: Path, name: str, values: list[Optional[str]]) -> None:
+    encoded = [x.encode("utf-8") if x is not None else b"" for x in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(x) for x in encoded], out=offsets[1:])
+    np.save(folder / f"{name}.values.npy", np.frombuffer(b"".join(encoded), np.uint8))
+    np.save(folder / f"{name}.offsets.npy", offsets)
+    np.save(folder / f"{name}.null.npy", np.array([x is None for x in values]))
+
+
+class StringColumn:
+    """A memory-mapped column of strings, with None for missing values"""
+
+    def __init__(self, folder: Path, name: str) -> None:
+        self.values = np.load(folder / f"{name}.values.npy", mmap_mode="r")
+        self.offsets = np.load(folder / f"{name}.offsets.npy", mmap_mode="r")
+        self.null = np.load(folder / f"{name}.null.npy", mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.null)
+
+    def __getitem__(self, i: int) -> Optional[str]:
+        if self.null[i]:
+            return None
+        return self.values[self.offsets[i] : self.offsets[i + 1]].tobytes().decode()
+
+    def tolist(self) -> list[Optional[str]]:
+        data = self.values.tobytes()
+        offsets = self.offsets.tolist()
+        return [
+            None if null else data[start:end].decode()
+            for start, end, null in zip(offsets, offsets[1:], self.null.tolist())
+        ]
+
+
+class ColumnarDigestWriter:
+    """Write a COLUMNAR digest. Same interface as `DigestWriter`.
+
+    The columns are collected in memory and saved when closing the writer.
+    """
+
+    def __init__(
+        self, folder: Path, cls: Optional[type[json.JSONEncoder]] = None
+    ) -> None:
+        self.folder = Path(folder)
+        self.cls = cls
+        self.authors: list[dict] = []
+        self.papers: list[dict] = []
+
+    def write_author(self, author: dict) -> None:
+        if self.papers:
+            raise ValueError("All authors must be written before the papers")
+        self.authors.append(author)
+
+    def write_paper(self, paper: dict) -> None:
+        self.papers.append(paper)
+
+    def write_authors(self, authors: Iterable[dict]) -> None:
+        for author in authors:
+            self.write_author(author)
+
+    def write_papers(self, papers: Iterable[dict]) -> None:
+        for paper in papers:
+            self.write_paper(paper)
+
+    def _save_table(self, name: str, records: list[dict], skip=()) -> dict:
+        kinds = {}
+        columns = list(records[0].keys()) if records else []
+        for column in columns:
+            if column in skip:
+                continue
+            values = [x[column] for x in records]
+            kind = _column_kind(values)
+            if kind == "int":
+                np.save(
+                    self.folder / f"{name}.{column}.npy", np.array(values, np.int64)
+                )
+            elif kind == "str":
+                _save_strings(self.folder, f"{name}.{column}", values)
+            else:
+                _save_strings(
+                    self.folder,
+                    f"{name}.{column}",
+                    [json.dumps(x, cls=self.cls) for x in values],
+                )
+            kinds[column] = kind
+        return kinds
+
+    def close(self) -> None:
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+        meta = {
+            "format": DigestFormat.COLUMNAR.value,
+            "version": COLUMNAR_VERSION,
+            "authors": {
+                "length": len(self.authors),
+                "columns": self._save_table("authors", self.authors),
+            },
+            "papers": {
+                "length": len(self.papers),
+                "columns": self._save_table("papers", self.papers, skip=("authors",)),
+            },
+        }
+
+        index = {author["id"]: i for i, author in enumerate(self.authors)}
+        offsets = np.zeros(len(self.papers) + 1, dtype=np.int64)
+        np.cumsum([len(x["authors"]) for x in self.papers], out=offsets[1:])
+        try:
+            values = np.fromiter(
+                (index[x] for paper in self.papers for x in paper["authors"]),
+                dtype=np.int32,
+                count=offsets[-1],
+            )
+        except KeyError as e:
+            raise ValueError(f"Paper author {e} is not in the authors") from e
+        np.save(self.folder / "papers.authors.offsets.npy", offsets)
+        np.save(self.folder / "papers.authors.values.npy", values)
+
+        with (self.folder / "meta.json").open("w+") as stream:
+            json.dump(meta, stream, indent=4)
+
+    def __enter__(self) -> ColumnarDigestWriter:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+
+
+class ColumnarDigestReader:
+    """Read a COLUMNAR digest. Same interface as `DigestReader`.
+
+    The raw (memory-mapped) arrays are available in `columns`, and the
+    authors of the papers as indexes in `author_offsets` and `author_values`.
+    """
+
+    def __init__(self, folder: Path) -> None:
+        self.folder = Path(folder)
+        with (self.folder / "meta.json").open("r") as stream:
+            self.meta = json.load(stream)
+
+        if self.meta["version"] != COLUMNAR_VERSION:
+            raise ValueError(
+                f"Unsupported columnar digest version {self.meta['version']}"
+            )
+
+        self.columns = {}
+        for table in ("authors", "papers"):
+            for column, kind in self.meta[table]["columns"].items():
+                name = f"{table}.{column}"
+                if kind == "int":
+                    self.columns[name] = np.load(
+                        self.folder / f"{name}.npy", mmap_mode="r"
+                    )
+                else:
+                    self.columns[name] = StringColumn(self.folder, name)
+
+        self.author_offsets = np.load(
+            self.folder / "papers.authors.offsets.npy", mmap_mode="r"
+        )
+        self.author_values = np.load(
+            self.folder / "papers.authors.values.npy", mmap_mode="r"
+        )
+
+    def _table(self, table: str) -> Generator[dict, None, None]:
+        columns = {}
+        for column, kind in self.meta[table]["columns"].items():
+            values = self.columns[f"{table}.{column}"].tolist()
+            if kind == "json":
+                values = [json.loads(x) for x in values]
+            columns[column] = values
+
+        for i in range(self.meta[table]["length"]):
+            yield {column: values[i] for column, values in columns.items()}
+
+    def _rows(self, table: str, rows: Iterable[int]) -> Generator[dict, None, None]:
+        """The records of some rows of a table, read one at a time"""
+        kinds = self.meta[table]["columns"]
+        for i in rows:
+            record = {}
+            for column, kind in kinds.items():
+                value = self.columns[f"{table}.{column}"][i]
+                if kind == "int":
+                    value = int(value)
+                elif kind == "json":
+                    value = json.loads(value)
+                record[column] = value
+            yield record
+
+    def authors_at(self, rows: Iterable[int]) -> Generator[dict, None, None]:
+        """The authors in some rows, without reading the others"""
+        yield from self._rows("authors", rows)
+
+    def papers_at(self, rows: Iterable[int]) -> Generator[dict, None, None]:
+        """The papers in some rows, without reading the others"""
+        rows = [int(x) for x in rows]
+        ids = self.columns["authors.id"]
+        for i, paper in zip(rows, self._rows("papers", rows)):
+            start, end = self.author_offsets[i], self.author_offsets[i + 1]
+            paper["authors"] = [ids[x] for x in self.author_values[start:end]]
+            yield paper
+
+    def author_ids(self) -> list[str]:
+        return self.columns["authors.id"].tolist()
+
+    def authors(self) -> Generator[dict, None, None]:
+        yield from self._table("authors")
+
+    def papers(self) -> Generator[dict, None, None]:
+        ids = self.author_ids()
+        offsets = self.author_offsets.tolist()
+        values = self.author_values
+        for i, paper in enumerate(self._table("papers")):
+            paper["authors"] = [ids[x] for x in values[offsets[i] : offsets[i + 1]]]
+            yield paper
+
+    def close(self) -> None:
+        """Drop the memory maps. They are unmapped once nothing else uses them"""
+        self.columns = {}
+        self.author_offsets = self.author_values = None
+
+    def __enter__(self) -> ColumnarDigestReader:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+def open_digest_reader(
+    path: Optional[Path],
+) -> Union[DigestReader, ColumnarDigestReader]:
+    """Open a digest of any format. Reads from stdin if `path` is None.
+
+    Use it in a `with` block, so the file is closed when done.
+    """
+    if path is None:
+        return DigestReader(sys.stdin)
+    if Path(path).is_dir():
+        return ColumnarDigestReader(path)
+    return DigestReader(Path(path).open("r"), close_stream=True)
+
+
+def open_digest_writer(
+    path: Optional[Path],
+    format: DigestFormat = DigestFormat.JSON,
+    **kwargs,
+) -> Union[DigestWriter, ColumnarDigestWriter]:
+    """Open a writer for a digest. Writes to stdout if `path` is None.
+
+    The other arguments are passed to the `DigestWriter`.
+    """
+    if format == DigestFormat.COLUMNAR:
+        if path is None:
+            raise ValueError("Columnar digests need an output folder")
+        return ColumnarDigestWriter(path, cls=kwargs.get("cls"))
+
+    stream = Path(path).open("w+") if path else sys.stdout
+    return DigestWriter(stream, format, close_stream=path is not None, **kwargs)
@@ -0,0 +1,382 @@
+#!/usr/bin/env python
+
+"""Index a COLUMNAR digest by year, department and author.
+
+The index is built once, and saved in the digest folder next to the columns
+(so it is memory-mapped like them):
+    - `index.years.npy`, `index.year_offsets.npy` and `index.year_papers.npy`:
+      the rows of the papers of each year, sorted by year. Papers without a
+      year are not in there;
+    - `index.departments.*` (a string column), `index.department_offsets.npy`
+      and `index.department_papers.npy`: the rows of the papers with at least
+      one author of each department;
+    - `index.author_offsets.npy` and `index.author_papers.npy`: the rows of
+      the papers of each author (by author row);
+    - `index.json`, to tell if the index is older than the digest.
+The index files don't count for the hash of the digest in the cache, so
+building the index doesn't invalidate the cached results made from it.
+
+With it, a range of years or some departments can be cut out of the whole
+digest by only reading the rows that are needed, instead of parsing the IRIS
+files of those years again or filtering the whole digest.
+
+    python digest_index.py build data/digest
+    python digest_index.py extract data/digest --years 2012-2014 \
+        --output_file out.json
+    python digest_index.py extract data/digest --metadata data/in/metadata.json \
+        --window 3 --sliding --output_file "out_{minyear}-{maxyear}.json"
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Iterable, Optional
+import json
+import logging
+
+from digest import (
+    ColumnarDigestReader,
+    DigestFormat,
+    StringColumn,
+    _save_strings,
+    open_digest_writer,
+    paper_year,
+)
+from group_files import parse_slice
+from iris_to_json import format_window_path, plan_windows
+from lazy import lazy_import
+
+np = lazy_import("numpy")
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+
+def _paper_years(reader: ColumnarDigestReader) -> tuple[np.ndarray, np.ndarray]:
+    """The rows of the papers that have a year, and their years"""
+    if reader.meta["papers"]["columns"].get("year") == "int":
+        years = np.asarray(reader.columns["papers.year"], dtype=np.int64)
+        return np.arange(len(years)), years
+
+    # With missing years the column is saved as JSON, and they are null or NaN
+    years = [paper_year(json.loads(x)) for x in reader.columns["papers.year"].tolist()]
+    rows = [i for i, year in enumerate(years) if year is not None]
+    return np.array(rows, dtype=np.int64), np.array(
+        [years[i] for i in rows], dtype=np.int64
+    )
+
+
+def _postings(keys: np.ndarray, rows: np.ndarray, size: int) -> tuple:
+    """Group the `rows` by their `keys` (in range(size)) as offsets and values.
+
+    The rows of each key are kept in ascending order, without repeats.
+    """
+    pairs = np.unique(keys.astype(np.int64) * (rows.max(initial=0) + 1) + rows)
+    keys, rows = np.divmod(pairs, rows.max(initial=0) + 1)
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=size), out=offsets[1:])
+    return offsets, rows
+
+
+def _index_meta(reader: ColumnarDigestReader) -> dict:
+    return {
+        "version": INDEX_VERSION,
+        "authors": reader.meta["authors"]["length"],
+        "papers": reader.meta["papers"]["length"],
+        "digest_mtime": (reader.folder / "meta.json").stat().st_mtime_ns,
+    }
+
+
+def build_index(folder: Path) -> None:
+    """Build the index of a columnar digest, and save it in its folder"""
+    folder = Path(folder)
+    reader = ColumnarDigestReader(folder)
+    num_papers = reader.meta["papers"]["length"]
+    num_authors = reader.meta["authors"]["length"]
+    log.info(f"Indexing {num_papers} papers and {num_authors} authors in {folder}")
+
+    # The stable sort keeps the papers of each year in their original order
+    rows, years = _paper_years(reader)
+    order = np.argsort(years, kind="stable")
+    unique_years, starts = np.unique(years[order], return_index=True)
+    np.save(folder / "index.years.npy", unique_years)
+    np.save(folder / "index.year_offsets.npy", np.append(starts, len(order)))
+    np.save(folder / "index.year_papers.npy", rows[order])
+
+    # One entry per authorship: which paper, and which author
+    offsets = np.asarray(reader.author_offsets)
+    authorship_papers = np.repeat(np.arange(num_papers), np.diff(offsets))
+    authorship_authors = np.asarray(reader.author_values, dtype=np.int64)
+
+    departments = reader.columns["authors.department"].tolist()
+    names = sorted({x for x in departments if x is not None})
+    codes = {name: i for i, name in enumerate(names)}
+    author_codes = np.array([codes.get(x, -1) for x in departments], np.int64)
+    authorship_codes = author_codes[authorship_authors]
+    known = authorship_codes >= 0
+    department_offsets, department_papers = _postings(
+        authorship_codes[known], authorship_papers[known], len(names)
+    )
+    _save_strings(folder, "index.departments", names)
+    np.save(folder / "index.department_offsets.npy", department_offsets)
+    np.save(folder / "index.department_papers.npy", department_papers)
+
+    author_offsets, author_papers = _postings(
+        authorship_authors, authorship_papers, num_authors
+    )
+    np.save(folder / "index.author_offsets.npy", author_offsets)
+    np.save(folder / "index.author_papers.npy", author_papers)
+
+    with (folder / "index.json").open("w+") as stream:
+        json.dump(_index_meta(reader), stream, indent=4)
+
+
+class DigestIndex:
+    """The (memory-mapped) index of a columnar digest. Papers and authors are
+    given as their rows in the digest, sorted like in the digest"""
+
+    def __init__(self, folder: Path) -> None:
+        self.folder = Path(folder)
+        self.reader = ColumnarDigestReader(self.folder)
+
+        def load(name: str) -> np.ndarray:
+            return np.load(self.folder / f"index.{name}.npy", mmap_mode="r")
+
+        self.years = load("years")
+        self.year_offsets = load("year_offsets")
+        self.year_papers = load("year_papers")
+        self.departments = StringColumn(self.folder, "index.departments").tolist()
+        self.department_offsets = load("department_offsets")
+        self.department_papers = load("department_papers")
+        self.author_offsets = load("author_offsets")
+        self.author_papers = load("author_papers")
+        self._author_rows = None
+
+    def papers_in_years(
+        self, start: Optional[int] = None, end: Optional[int] = None
+    ) -> np.ndarray:
+        """The papers from `start` to `end`, both inclusive"""
+        first = 0 if start is None else np.searchsorted(self.years, start, "left")
+        last = (
+            len(self.years)
+            if end is None
+            else np.searchsorted(self.years, end, "right")
+        )
+        rows = self.year_papers[self.year_offsets[first] : self.year_offsets[last]]
+        return np.sort(rows)
+
+    def papers_of_departments(self, departments: Iterable[str]) -> np.ndarray:
+        """The papers with at least one author from these departments"""
+        # Departments are normalized like in `iris_to_json.Author`
+        wanted = {x.lower().strip() for x in departments}
+        rows = [
+            self.department_papers[
+                self.department_offsets[i] : self.department_offsets[i + 1]
+            ]
+            for i, name in enumerate(self.departments)
+            if name in wanted
+        ]
+        return np.unique(np.concatenate(rows)) if rows else np.array([], np.int64)
+
+    def papers_of_authors(self, ids: Iterable[str]) -> np.ndarray:
+        """The papers of some authors, by their ID"""
+        if self._author_rows is None:
+            self._author_rows = {x: i for i, x in enumerate(self.reader.author_ids())}
+        rows = [
+            self.author_papers[self.author_offsets[i] : self.author_offsets[i + 1]]
+            for i in (self._author_rows[x] for x in ids if x in self._author_rows)
+        ]
+        return np.unique(np.concatenate(rows)) if rows else np.array([], np.int64)
+
+    def authors_of_papers(self, rows: np.ndarray) -> np.ndarray:
+        """The authors of some papers"""
+        starts = self.reader.author_offsets[rows]
+        lengths = self.reader.author_offsets[np.asarray(rows) + 1] - starts
+        # The positions of all their authorships, without a loop over papers
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        positions += np.arange(lengths.sum())
+        return np.unique(self.reader.author_values[positions])
+
+    def select(
+        self,
+        years: Optional[tuple[Optional[int], Optional[int]]] = None,
+        departments: Optional[list[str]] = None,
+    ) -> np.ndarray:
+        """The papers in a range of years and of some departments"""
+        rows = np.arange(self.reader.meta["papers"]["length"])
+        if years is not None:
+            rows = self.papers_in_years(*years)
+        if departments is not None:
+            rows = np.intersect1d(rows, self.papers_of_departments(departments))
+        return rows
+
+
+def is_stale(folder: Path) -> bool:
+    """Is the index missing, or older than the digest?"""
+    path = Path(folder) / "index.json"
+    if not path.exists():
+        return True
+    with path.open("r") as stream:
+        return json.load(stream) != _index_meta(ColumnarDigestReader(folder))
+
+
+def load_index(folder: Path) -> DigestIndex:
+    """Load the index of a columnar digest, building it first if needed"""
+    if is_stale(folder):
+        build_index(folder)
+    return DigestIndex(folder)
+
+
+def write_selection(
+    index: DigestIndex,
+    rows: np.ndarray,
+    output_path: Optional[Path],
+    format: DigestFormat = DigestFormat.JSON,
+) -> None:
+    """Write the papers in some rows, and their authors, as a digest"""
+    authors = index.authors_of_papers(rows)
+    log.info(f"Writing {len(rows)} papers and {len(authors)} authors")
+    with open_digest_writer(output_path, format) as writer:
+        writer.write_authors(index.reader.authors_at(authors.tolist()))
+        writer.write_papers(index.reader.papers_at(rows.tolist()))
+
+
+def extract(
+    folder: Path,
+    output_path: Optional[Path],
+    format: DigestFormat = DigestFormat.JSON,
+    years: Optional[tuple[Optional[int], Optional[int]]] = None,
+    departments: Optional[list[str]] = None,
+) -> None:
+    """Cut the papers of some years and departments out of a digest.
+
+    Only the authors of the kept papers are written, so this is the same as
+    `filter_json.py --min_year --max_year --departments --drop_orphan_authors`
+    without the `--min_authors` filter.
+    """
+    index = load_index(folder)
+    write_selection(index, index.select(years, departments), output_path, format)
+
+
+def extract_windows(
+    folder: Path,
+    metadata: dict,
+    width: int,
+    sliding: bool,
+    output_pattern: str,
+    format: DigestFormat = DigestFormat.JSON,
+    departments: Optional[list[str]] = None,
+) -> None:
+    """Cut the digest in the same windows of years as `iris_to_json.py`.
+
+    The output pattern is formatted with {n}, {minyear} and {maxyear}.
+    """
+    index = load_index(folder)
+    for window in plan_windows(metadata, width, sliding):
+        rows = index.select((window.minyear, window.maxyear), departments)
+        output_path = format_window_path(output_pattern, window)
+        log.info(f"Writing window {window.n} to {output_path}")
+        write_selection(index, rows, output_path, format)
+
+
+def cli(argv: Optional[list[str]] = None) -> None:
+    """Run the script with these command line arguments (or sys.argv)"""
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    subparsers = parser.add_subparsers(
+        help="What to do with the index", required=True, dest="method"
+    )
+
+    parser_build = subparsers.add_parser(
+        "build", help="Build (or rebuild) the index of a columnar digest"
+    )
+    parser_build.add_argument("digest", help="Columnar digest folder", type=Path)
+
+    parser_extract = subparsers.add_parser(
+        "extract", help="Extract some years and departments from a digest"
+    )
+    parser_extract.add_argument("digest", help="Columnar digest folder", type=Path)
+    parser_extract.add_argument(
+        "--output_file",
+        help=(
+            "Output file. With --window, it's formatted with {n}, {minyear} "
+            "and {maxyear}"
+        ),
+        default=None,
+    )
+    parser_extract.add_argument(
+        "--format",
+        help="Format of the output digest",
+        choices=[x.value for x in DigestFormat],
+        default="json",
+    )
+    parser_extract.add_argument(
+        "--years", help="Years to extract, e.g. 2012-2015. Use - as a separator."
+    )
+    parser_extract.add_argument(
+        "--departments",
+        help="Keep papers with at least one author from these departments",
+        nargs="+",
+        default=None,
+    )
+    parser_extract.add_argument(
+        "--metadata",
+        help="Metadata file with the input files by year, for --window",
+        type=argparse.FileType("r"),
+        default=None,
+    )
+    parser_extract.add_argument(
+        "--window",
+        help="Extract windows of this many files, like iris_to_json.py",
+        type=int,
+        default=None,
+    )
+    parser_extract.add_argument(
+        "--sliding",
+        action="store_true",
+        help="If specified, makes the window a sliding window",
+    )
+
+    args = parser.parse_args(argv)
+
+    match args.method:
+        case "build":
+            build_index(args.digest)
+        case "extract":
+            metadata = None
+            if args.metadata:
+                with args.metadata:
+                    metadata = json.load(args.metadata)
+
+            if args.format == "columnar" and args.output_file is None:
+                parser.error("Columnar output needs an --output_file folder")
+
+            if args.window is not None:
+                if metadata is None or args.output_file is None:
+                    parser.error("--window needs --metadata and an --output_file")
+                if args.years is not None:
+                    parser.error("--years and --window cannot be used together")
+                extract_windows(
+                    args.digest,
+                    metadata,
+                    args.window,
+                    args.sliding,
+                    args.output_file,
+                    DigestFormat(args.format),
+                    departments=args.departments,
+                )
+            else:
+                extract(
+                    args.digest,
+                    args.output_file,
+                    DigestFormat(args.format),
+                    years=parse_slice(args.years) if args.years else None,
+                    departments=args.departments,
+                )
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,52 +1,217 @@
 #!/usr/bin/env python
 
 """This file filters the json file for various parameters."""
-import sys
-import sys
 from pathlib import Path
-from io import IOBase
-import json
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Optional, Union
 import logging
 
+from cache import ResultCache, add_cache_arguments, cache_from_args, cache_key
+from digest import (
+    ColumnarDigestReader,
+    ColumnarDigestWriter,
+    DigestFormat,
+    DigestReader,
+    DigestWriter,
+    open_digest_reader,
+    open_digest_writer,
+)
+from instrumentation import (
+    Instruments,
+    Stage,
+    add_instrumentation_arguments,
+    counted,
+    instruments_from_args,
+)
+
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
 
-def remove_single_author_papers(data: list[dict]) -> dict:
-    """Remove papers that have only one author"""
-    log.info("Removing single author papers...")
-    return [value for value in data if len(value["authors"]) > 1]
+PaperPredicate = Callable[[dict], bool]
+
+
+def min_authors_filter(n: int, authors: dict) -> PaperPredicate:
+    return lambda paper: len(paper["authors"]) >= n
+
+
+def max_authors_filter(n: int, authors: dict) -> PaperPredicate:
+    return lambda paper: len(paper["authors"]) <= n
+
+
+def min_year_filter(year: int, authors: dict) -> PaperPredicate:
+    return lambda paper: paper["year"] is not None and paper["year"] >= year
+
+
+def max_year_filter(year: int, authors: dict) -> PaperPredicate:
+    return lambda paper: paper["year"] is not None and paper["year"] <= year
+
+
+def departments_filter(departments: list[str], authors: dict) -> PaperPredicate:
+    # Departments are normalized like in `iris_to_json.Author`
+    departments = {x.lower().strip() for x in departments}
+    in_departments = {
+        id for id, author in authors.items() if author["department"] in departments
+    }
+    return lambda paper: not in_departments.isdisjoint(paper["authors"])
 
 
-FILTERS = {
-    "papers": [
-        remove_single_author_papers,
-    ],
-    "authors": [],
-    "both": [],
+@dataclass
+class PaperFilter:
+    """A filter on the papers, selectable from the command line as --<name>.
+
+    `make` takes the value given on the command line and the authors by ID,
+    and returns a predicate that is True for the papers to keep.
+    """
+
+    make: Callable[[Any, dict], PaperPredicate]
+    help: str
+    type: Callable = int
+    nargs: Optional[str] = None
+    needs_authors: bool = False
+
+
+PAPER_FILTERS = {
+    "min_authors": PaperFilter(
+        min_authors_filter, "Keep papers with at least this many authors"
+    ),
+    "max_authors": PaperFilter(
+        max_authors_filter, "Keep papers with at most this many authors"
+    ),
+    "min_year": PaperFilter(min_year_filter, "Keep papers from this year onwards"),
+    "max_year": PaperFilter(max_year_filter, "Keep papers up to this year"),
+    "departments": PaperFilter(
+        departments_filter,
+        "Keep papers with at least one author from these departments",
+        type=str,
+        nargs="+",
+        needs_authors=True,
+    ),
 }
 
+# We never want single author papers, since they make no edges
+DEFAULT_FILTERS = {"min_authors": 2}
 
-def apply_filters(data: dict, filters: list) -> dict:
-    for filter in filters["papers"]:
-        data["papers"] = filter(data["papers"])
-    for filter in filters["authors"]:
-        data["authors"] = filter(data["authors"])
-    for filter in filters["both"]:
-        data = filter(data)
 
-    return data
+def make_paper_predicate(
+    filters: dict, authors: Optional[dict] = None
+) -> PaperPredicate:
+    """Fuse the selected paper filters into a single predicate"""
+    predicates = tuple(
+        PAPER_FILTERS[name].make(value, authors) for name, value in filters.items()
+    )
 
+    def keep(paper: dict) -> bool:
+        for predicate in predicates:
+            if not predicate(paper):
+                return False
+        return True
 
-def main(input_stream: IOBase, output_stream: IOBase) -> None:
-    data = json.load(input_stream)
-    # TODO: Add a way to select which filters to apply
-    data = apply_filters(data, FILTERS)
+    return keep
 
-    json.dump(data, output_stream)
 
+def filter_records(
+    authors: Iterable[dict],
+    papers: Iterable[dict],
+    filters: dict,
+    drop_orphans: bool = False,
+) -> tuple[Iterable[dict], Iterable[dict]]:
+    """Apply the filters to the author and paper records.
 
-if __name__ == "__main__":
+    All paper filters are checked in the same pass over the papers. If no
+    filter needs to look at the authors, the records are filtered lazily, so
+    they can be streamed in constant memory (authors first, then papers).
+
+    With `drop_orphans`, authors left without papers are dropped too. As the
+    authors have to come first, the kept papers are buffered for this.
+    """
+    log.info(f"Filtering papers with {filters}")
+    needs_authors = any(PAPER_FILTERS[x].needs_authors for x in filters)
+
+    if not (needs_authors or drop_orphans):
+        keep = make_paper_predicate(filters)
+        return authors, (x for x in papers if keep(x))
+
+    authors = {x["id"]: x for x in authors}
+    keep = make_paper_predicate(filters, authors)
+    papers = (x for x in papers if keep(x))
+
+    if not drop_orphans:
+        return authors.values(), papers
+
+    papers = list(papers)
+    used = set()
+    for paper in papers:
+        used.update(paper["authors"])
+
+    log.info(f"Dropping {len(authors) - len(used)} authors without papers")
+    return [x for id, x in authors.items() if id in used], papers
+
+
+def stream_filters(
+    reader: Union[DigestReader, ColumnarDigestReader],
+    writer: Union[DigestWriter, ColumnarDigestWriter],
+    filters: dict,
+    drop_orphans: bool = False,
+    stage: Optional[Stage] = None,
+) -> None:
+    """Apply the filters while streaming the records from reader to writer.
+
+    If a `stage` is given, the records are counted in it on the way in and out.
+    """
+    authors, papers = reader.authors(), reader.papers()
+    if stage:
+        authors = counted(authors, stage, "authors_in")
+        papers = counted(papers, stage, "papers_in")
+
+    authors, papers = filter_records(authors, papers, filters, drop_orphans)
+    if stage:
+        authors = counted(authors, stage, "authors_out")
+        papers = counted(papers, stage, "papers_out")
+
+    writer.write_authors(authors)
+    writer.write_papers(papers)
+
+
+def main(
+    input_path: Optional[Path],
+    output_path: Optional[Path],
+    format: DigestFormat = DigestFormat.JSON,
+    filters: dict = DEFAULT_FILTERS,
+    drop_orphans: bool = False,
+    cache: Optional[ResultCache] = None,
+    instruments: Optional[Instruments] = None,
+) -> None:
+    instruments = instruments or Instruments("filter_json")
+    key = None
+    if cache and input_path and output_path:
+        params = {
+            "output_path": str(output_path),
+            "format": format.value,
+            "filters": filters,
+            "drop_orphans": drop_orphans,
+        }
+        key = cache_key(
+            "filter_json", params, inputs=[input_path], code=(main, DigestFormat)
+        )
+        if cache.restore(key) is not None:
+            return
+
+    # Reading, filtering and writing are interleaved, so they are one stage
+    with instruments.stage("filter") as stage:
+        with open_digest_reader(input_path) as reader, open_digest_writer(
+            output_path, format
+        ) as writer:
+            stream_filters(reader, writer, filters, drop_orphans, stage)
+
+    if key:
+        cache.store(key, [output_path])
+
+    instruments.flush()
+
+
+def cli(argv: Optional[list[str]] = None) -> None:
+    """Run the script with these command line arguments (or sys.argv)"""
     import argparse
 
     parser = argparse.ArgumentParser()
@@ -57,10 +222,49 @@ if __name__ == "__main__":
     parser.add_argument(
         "--output_file", help="Output file to process", type=Path, default=None
     )
+    parser.add_argument(
+        "--format",
+        help="Format of the output digest",
+        choices=[x.value for x in DigestFormat],
+        default="json",
+    )
+    for name, filter in PAPER_FILTERS.items():
+        parser.add_argument(
+            f"--{name}",
+            help=filter.help,
+            type=filter.type,
+            nargs=filter.nargs,
+            default=DEFAULT_FILTERS.get(name),
+        )
+    parser.add_argument(
+        "--drop_orphan_authors",
+        action="store_true",
+        help="Also drop the authors that are left without any paper",
+    )
+    add_cache_arguments(parser)
+    add_instrumentation_arguments(parser)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
-    input_stream = args.input_file.open("r") if args.input_file else sys.stdin
-    output_stream = args.output_file.open("w+") if args.output_file else sys.stdout
+    if args.format == "columnar" and args.output_file is None:
+        parser.error("Columnar output needs an --output_file folder")
 
-    main(input_stream, output_stream)
+    filters = {
+        name: getattr(args, name)
+        for name in PAPER_FILTERS
+        if getattr(args, name) is not None
+    }
+
+    main(
+        args.input_file,
+        args.output_file,
+        DigestFormat(args.format),
+        filters=filters,
+        drop_orphans=args.drop_orphan_authors,
+        cache=cache_from_args(args),
+        instruments=instruments_from_args(args, "filter_json"),
+    )
+
+
+if __name__ == "__main__":
+    cli()
@@ -4,26 +4,45 @@
 
 from pathlib import Path
 import json
-from typing import TextIO, Generator, Iterable, Union
+from typing import TextIO, Generator, Iterable, Optional, Union
 from more_itertools import batched, windowed
 from sys import stdout
 
 
-def find_year(metadata: dict, year: int) -> dict:
+def year_index(metadata: dict) -> dict[int, dict]:
+    """Map each year to the first file object for that year"""
+    index = {}
+    for item in metadata["files"]:
+        index.setdefault(item["year"], item)
+    return index
+
+
+def find_year(
+    metadata: dict, year: int, index: Optional[dict[int, dict]] = None
+) -> dict:
     """Find and return a single file object for one year.
 
     Finds the first item for that year. If none are found, raises
-    a `FileNotFoundError`.
+    a `FileNotFoundError`. Pass the `year_index` of the metadata to look up
+    many years without going through all files every time.
     """
-    for item in list(metadata["files"]):
-        if item["year"] == year:
-            return item
+    if index is None:
+        index = year_index(metadata)
+
+    try:
+        return index[year]
+    except KeyError:
+        raise FileNotFoundError(f"No file for year {year} exists in the metadata")
 
-    raise FileNotFoundError(f"No file for year {year} exists in the metadata")
+
+def parse_slice(text: str) -> tuple[int, int]:
+    """Parse a slice of years like 2012-2015 (or just 2012) to (start, end)"""
+    years = [int(x) for x in text.split("-")]
+    return min(years), max(years)
 
 
 def window(
-    medatada: dict, width: int, sliding: bool = False
+    metadata: dict, width: int, sliding: bool = False
 ) -> Generator[str, None, None]:
     """Sort files by year, and return a (sliding) window over them"""
     files = [x["path"] for x in metadata["files"]]
@@ -38,8 +57,9 @@ def window(
 
 def slice(metadata: dict, start: int, end: int) -> Generator[str, None, None]:
     """Return all years between two fenceposts, both inclusive"""
+    index = year_index(metadata)
     for year in range(start, end + 1):
-        yield find_year(metadata, year)["path"]
+        yield find_year(metadata, year, index)["path"]
 
 
 def single(metadata: dict) -> Generator[str, None, None]:
@@ -63,7 +83,8 @@ def write_output(generator: Iterable, outstream: TextIO = stdout) -> None:
         outstream.write("\n")
 
 
-if __name__ == "__main__":
+def cli(argv: Optional[list[str]] = None) -> None:
+    """Run the script with these command line arguments (or sys.argv)"""
     import argparse
 
     parser = argparse.ArgumentParser()
@@ -100,9 +121,11 @@ if __name__ == "__main__":
         "--slice", help="Years to slice, e.g. 2012-2015. Use - as a separator."
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+
+    with args.metadata:
+        metadata = json.load(args.metadata)
 
-    metadata = json.load(args.metadata)
     match args.method:
         case "window":
             write_output(window(metadata, width=args.size, sliding=args.sliding))
@@ -110,10 +133,14 @@ if __name__ == "__main__":
             write_output(single(metadata))
         case "bulk":
             if args.slice:
-                years = [int(x) for x in args.slice.split("-")]
+                start, end = parse_slice(args.slice)
                 # Hard to see, but this is a one-length tuple, with the list
                 # in position zero (since it's what write_output wants)
-                write_output((slice(metadata, start=min(years), end=max(years)),))
+                write_output((slice(metadata, start=start, end=end),))
             else:
                 # Same as above, is a tuple
                 write_output(([x["path"] for x in metadata["files"]],))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,162 @@
+"""Per-stage timing and memory instrumentation of the preparsing scripts.
+
+The scripts run their work in named stages (reading, parsing, filtering,
+building edges, writing, ...):
+
+    instruments = Instruments("json_to_network", metrics_path)
+    with instruments.stage("build") as stage:
+        network = build_network(...)
+        stage.count(edges=len(network.edges))
+    instruments.flush(n=1)
+
+Each stage records its wall time, CPU time, the peak RSS of the process at
+its end and any counts (rows, papers, edges, ...). A stage can run more than
+once (e.g. once per file), and the records add up. `flush` writes the
+stages so far as one JSON line (one per window) and starts over.
+
+The metrics are appended to the file, so parallel jobs can share it.
+Stages can also be run under cProfile, with one .prof file per stage.
+"""
+
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from time import perf_counter, process_time
+from typing import Generator, Iterable, Optional
+import cProfile
+import json
+import logging
+import resource
+import sys
+
+log = logging.getLogger(__name__)
+
+
+def peak_rss_mib() -> float:
+    """The peak resident memory of this process so far, in MiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives KiB, macOS gives bytes
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+@dataclass
+class Stage:
+    """The measurements of a stage. The CPU time is only of this process, so
+    it doesn't include the work of process pools"""
+
+    name: str
+    calls: int = 0
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    peak_rss_mib: float = 0.0
+    counts: dict = field(default_factory=dict)
+
+    def count(self, **counts: int) -> None:
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+
+def counted(items: Iterable, stage: Stage, key: str) -> Generator:
+    """Pass the items through, counting them in the stage as they go"""
+    for item in items:
+        stage.count(**{key: 1})
+        yield item
+
+
+class Instruments:
+    def __init__(
+        self,
+        script: str,
+        metrics_path: Optional[Path] = None,
+        profile_dir: Optional[Path] = None,
+        profile_stages: Optional[list[str]] = None,
+    ) -> None:
+        """Instruments for a script.
+
+        Metrics are appended to `metrics_path` as JSON lines, if given. If
+        `profile_dir` is given, the stages (all of them, or just the
+        `profile_stages`) are profiled, and their stats written there.
+        """
+        self.script = script
+        self.metrics_path = metrics_path
+        self.profile_dir = profile_dir
+        self.profile_stages = profile_stages
+        self.stages: dict[str, Stage] = {}
+        self.profilers: dict[str, cProfile.Profile] = {}
+
+    def profiles(self, name: str) -> bool:
+        if self.profile_dir is None:
+            return False
+        return not self.profile_stages or name in self.profile_stages
+
+    @contextmanager
+    def stage(self, name: str) -> Generator[Stage, None, None]:
+        record = self.stages.setdefault(name, Stage(name))
+        profiler = None
+        if self.profiles(name):
+            profiler = self.profilers.setdefault(name, cProfile.Profile())
+
+        wall, cpu = perf_counter(), process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+            record.calls += 1
+            record.wall_seconds += perf_counter() - wall
+            record.cpu_seconds += process_time() - cpu
+            record.peak_rss_mib = max(record.peak_rss_mib, peak_rss_mib())
+
+    def flush(self, **fields) -> dict:
+        """Emit a record of the stages so far, with some identifying `fields`
+        (like the window), and start again"""
+        record = {
+            "script": self.script,
+            **fields,
+            "stages": [asdict(x) for x in self.stages.values()],
+        }
+        log.debug(f"Metrics: {record}")
+
+        if self.metrics_path:
+            with Path(self.metrics_path).open("a") as stream:
+                stream.write(json.dumps(record) + "\n")
+
+        if self.profilers:
+            Path(self.profile_dir).mkdir(parents=True, exist_ok=True)
+            suffix = "".join(f"_{k}{v}" for k, v in fields.items())
+            for name, profiler in self.profilers.items():
+                path = Path(self.profile_dir) / f"{self.script}{suffix}_{name}.prof"
+                profiler.dump_stats(path)
+                log.info(f"Wrote the profile of {name} to {path}")
+
+        self.stages = {}
+        self.profilers = {}
+        return record
+
+
+def add_instrumentation_arguments(parser) -> None:
+    """Add the instrumentation options to an argparse parser"""
+    parser.add_argument(
+        "--metrics",
+        help="Append the time and memory of each stage here, as JSON lines",
+        type=Path,
+        default=None,
+    )
+    parser.add_argument(
+        "--profile_dir",
+        help="Profile the stages with cProfile, and write the .prof files here",
+        type=Path,
+        default=None,
+    )
+    parser.add_argument(
+        "--profile_stage",
+        help="Only profile this stage (can be given more than once)",
+        action="append",
+        default=None,
+    )
+
+
+def instruments_from_args(args, script: str) -> Instruments:
+    return Instruments(script, args.metrics, args.profile_dir, args.profile_stage)
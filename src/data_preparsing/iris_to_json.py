@@ -2,24 +2,47 @@
 """This script converts a series of IRIS tables to a json digest"""
 from __future__ import annotations
 
-import pandas as pd
 from dataclasses import dataclass
-from typing import Optional, TextIO
+from typing import Callable, Generator, Iterable, Optional, TextIO, Union
 from uuid import uuid4
-from jellyfish import jaro_winkler_similarity as jws
-from io import StringIO, IOBase
-from tqdm import tqdm
+from pathlib import Path
 import csv
 import logging
 import json
-import numpy as np
 import sys
+import unicodedata
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from cache import ResultCache, add_cache_arguments, cache_from_args, cache_key
+from digest import DigestFormat, open_digest_writer
+import group_files
+from instrumentation import (
+    Instruments,
+    add_instrumentation_arguments,
+    instruments_from_args,
+)
+from lazy import lazy_import
+from pseudonyms import SECRET_ENV_VAR, make_pseudonyms
+
+jellyfish = lazy_import("jellyfish")
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
 
+def intern(value):
+    """Intern strings, so that repeated values (e.g. departments) are shared"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
 class Author:
+    # Slots save us the instance __dict__: we have a lot of authors
+    __slots__ = ("name", "surname", "affiliation", "department", "id")
+
     def __init__(
         self,
         name: str,
@@ -35,21 +58,48 @@ class Author:
         self.surname = (
             surname.lower().strip() if surname and pd.notna(surname) else None
         )
-        self.affiliation = (
+        self.affiliation = intern(
             affiliation.lower().strip()
             if affiliation and pd.notna(affiliation)
             else None
         )
-        self.department = (
+        self.department = intern(
             # Sanitize the department's " since they will fuck up later
             department.lower().strip().replace('"', "")
             if department and pd.notna(department)
             else None
         )
-        self.id = id or str(uuid4())
+        self.id = intern(id or str(uuid4()))
 
         assert self.id is not None, "ID should not be None"
 
+    @classmethod
+    def from_normalized(
+        cls,
+        name: Optional[str],
+        surname: Optional[str],
+        affiliation: Optional[str],
+        department: Optional[str],
+        id: str,
+    ) -> Author:
+        """Make an author from fields that are already normalized (or None)"""
+        author = cls.__new__(cls)
+        author.name = name
+        author.surname = surname
+        author.affiliation = intern(affiliation)
+        author.department = intern(department)
+        author.id = intern(id)
+        return author
+
+    def to_record(self) -> dict:
+        return {
+            "name": self.name,
+            "surname": self.surname,
+            "affiliation": self.affiliation,
+            "department": self.department,
+            "id": self.id,
+        }
+
     def is_superset_of(self, other: Author) -> bool:
         """Return if this author is a better version than the other"""
         if other.id != self.id:
@@ -63,49 +113,173 @@ class Author:
             or (self.department is not None and other.department is None)
         )
 
+    def merged_with(self, other: Author) -> Author:
+        """Return a copy of this author, with the missing fields from the other"""
+        return Author.from_normalized(
+            name=self.name if self.name is not None else other.name,
+            surname=self.surname if self.surname is not None else other.surname,
+            affiliation=(
+                self.affiliation if self.affiliation is not None else other.affiliation
+            ),
+            department=(
+                self.department if self.department is not None else other.department
+            ),
+            id=self.id,
+        )
+
     def distance(self, other: Author) -> float:
         """Return the distance between this author and the other, ignoring the ID"""
         # This is a weighted average, were we give more importance to the name and surname
         # The rationale is that the affiliation and department are more likely to change
         # between roles than your name or surname. This might not be optimal?
         return (
-            jws(self.name or "", other.name or "")
-            + jws(self.surname or "", other.surname or "")
-            + jws(self.affiliation or "", other.affiliation or "") * 0.5
-            + jws(self.department or "", other.department or "") * 0.5
+            jellyfish.jaro_winkler_similarity(self.name or "", other.name or "")
+            + jellyfish.jaro_winkler_similarity(self.surname or "", other.surname or "")
+            + jellyfish.jaro_winkler_similarity(
+                self.affiliation or "", other.affiliation or ""
+            )
+            * 0.5
+            + jellyfish.jaro_winkler_similarity(
+                self.department or "", other.department or ""
+            )
+            * 0.5
         ) / 3
 
 
+def blocking_key(author: Author) -> Optional[str]:
+    """Return the key of the block of similar authors this author is in.
+
+    Only authors in the same block are compared when fuzzy matching, so
+    matching is (about) linear in the number of authors. We block on the
+    start of the surname, without accents and punctuation.
+    """
+    if not author.surname:
+        return None
+    folded = unicodedata.normalize("NFKD", author.surname)
+    folded = "".join(x for x in folded if x.isalnum())
+    return folded[:4] or None
+
+
 class AuthorGlobber:
-    def __init__(self) -> None:
+    def __init__(self, fuzzy_threshold: Optional[float] = None) -> None:
+        """Glob authors together.
+
+        Authors are always globbed on their ID. If `fuzzy_threshold` is
+        given, authors without an ID (e.g. no CRIS ID) can also be globbed
+        with an author in the same block (see `blocking_key`) if their
+        `Author.distance` is at least `fuzzy_threshold` (1 is a perfect match).
+        """
         self.authors = dict()
+        # The position of each author in `authors`, by ID
+        self.index: dict[str, int] = {}
+        self.fuzzy_threshold = fuzzy_threshold
+        # The IDs we made up for authors that did not have one
+        self.generated_ids = set()
+        self._blocks: dict[str, list[Author]] = {}
 
     def add(self, author: Author) -> None:
+        if author.id not in self.index:
+            self.index[author.id] = len(self.index)
         self.authors[author.id] = author
 
-    def add_or_glob(self, author: Author) -> str:
-        if hit := self.find(author):
+        if self.fuzzy_threshold is not None:
+            key = blocking_key(author)
+            if key is not None:
+                self._blocks.setdefault(key, []).append(author)
+
+    def _replace(self, old: Author, new: Author) -> None:
+        if self.fuzzy_threshold is not None:
+            key = blocking_key(old)
+            if key is not None:
+                self._blocks[key].remove(old)
+        # The dict keeps the position of the old author
+        self.add(new)
+
+    def add_or_glob(self, author: Author, fuzzy: bool = False) -> str:
+        if hit := self.find(author, fuzzy=fuzzy):
+            if author.is_superset_of(hit):
+                # We fill in what we know now. We make a new author, since
+                # the old one might be shared with other gobblers.
+                self._replace(hit, hit.merged_with(author))
             return hit.id
         else:
             self.add(author)
+            if fuzzy:
+                self.generated_ids.add(author.id)
             return author.id
 
-    def find(self, author: Author) -> Optional[Author]:
+    def find(self, author: Author, fuzzy: bool = False) -> Optional[Author]:
         if author.id in self.authors:
             # TODO: We return the saved one, but which is better?
             return self.authors[author.id]
 
-        # TODO: Heuristics here?
+        if fuzzy and self.fuzzy_threshold is not None:
+            return self.find_fuzzy(author)
 
         return None
 
+    def find_fuzzy(self, author: Author) -> Optional[Author]:
+        """Find the most similar author in the same block, if similar enough"""
+        candidates = self._blocks.get(blocking_key(author), [])
 
-@dataclass
+        best, best_similarity = None, self.fuzzy_threshold
+        for candidate in candidates:
+            similarity = author.distance(candidate)
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+
+        return best
+
+    def merge(self, other: AuthorGlobber) -> dict[str, str]:
+        """Glob all the authors of another gobbler into this one, in order.
+
+        Returns the IDs of the authors of the other gobbler that were globbed
+        to an author with a different ID here (only happens for fuzzy matches).
+        """
+        renamed = {}
+        for author in other.authors.values():
+            fuzzy = author.id in other.generated_ids
+            new_id = self.add_or_glob(author, fuzzy=fuzzy)
+            if new_id != author.id:
+                renamed[author.id] = new_id
+
+        return renamed
+
+
+@dataclass(slots=True)
 class Paper:
     id: str
-    title: int
+    title: str
     year: int
-    authors: list[str]
+    # The positions of the authors in the AuthorGlobber that made this paper.
+    # Arrays are a good deal smaller than numpy arrays for a few numbers.
+    authors: array
+
+    def to_record(self, author_ids: list[str]) -> dict:
+        """Make the digest record of this paper, given the IDs of the authors"""
+        return {
+            "id": self.id,
+            "title": self.title,
+            "year": self.year,
+            "authors": [author_ids[x] for x in self.authors],
+        }
+
+
+def normalize_column(column: pd.Series, remove_quotes: bool = False) -> pd.Series:
+    """Normalize a column of author fields, like `Author` does one at a time.
+
+    Lowercases and strips the values, and turns missing (or empty) ones to None.
+    """
+    values = column.astype(object)
+    present = values.notna() & values.ne("")
+    clean = values[present].str.lower().str.strip()
+    if remove_quotes:
+        clean = clean.str.replace('"', "", regex=False)
+
+    # We go through numpy so that pandas does not turn our Nones into NaNs
+    result = np.full(len(column), None, dtype=object)
+    result[present.to_numpy()] = clean.to_numpy()
+    return pd.Series(result, index=column.index, dtype=object)
 
 
 def parse_file_simple(gobbler: AuthorGlobber, data: pd.DataFrame) -> list[Paper]:
@@ -114,59 +288,152 @@ def parse_file_simple(gobbler: AuthorGlobber, data: pd.DataFrame) -> list[Paper]
     # The resulting network will only have known authors. Not sure if this is ok
     # but it's a start.
 
-    # This does not work with authors without any cris ID.
-    data = data.dropna(subset="author_cris_id")
+    data = data.dropna(subset="handle")
 
-    papers = []
+    # Without fuzzy matching, we just drop the authors without any cris ID.
+    if gobbler.fuzzy_threshold is None:
+        data = data.dropna(subset="author_cris_id")
+
+    # We go through the papers sorted by handle, and through each paper's
+    # rows in file order. The first row of each author is the one we keep.
+    data = data.sort_values("handle", kind="stable")
+
+    known = data["author_cris_id"].notna()
+    if not known.all():
+        data = data.assign(author_cris_id=data["author_cris_id"].astype(object))
 
-    for paper_id, paper in tqdm(data.groupby("handle")):
-        # Extract the authors and add them to the gobbler
-        authors = []
-        for _, row in paper.iterrows():
-            author = Author(
-                name=row["author_name"],
-                surname=row["author_surname"],
-                affiliation="University of Turin",
-                department=row["author_department"],
-                id=row["author_cris_id"],
+    # Globbing keeps the first value of each field that is not missing, so
+    # we do the same here: `first` skips missing values.
+    authors = (
+        pd.DataFrame(
+            {
+                "id": data.loc[known, "author_cris_id"],
+                "name": normalize_column(data.loc[known, "author_name"]),
+                "surname": normalize_column(data.loc[known, "author_surname"]),
+                "department": normalize_column(
+                    data.loc[known, "author_department"], remove_quotes=True
+                ),
+            }
+        )
+        .groupby("id", sort=False)
+        .first()
+    )
+    # `first` gives NaNs for fields that are always missing
+    authors = authors.astype(object).where(authors.notna(), None)
+    for id, name, surname, department in zip(
+        authors.index.tolist(),
+        authors["name"].tolist(),
+        authors["surname"].tolist(),
+        authors["department"].tolist(),
+    ):
+        gobbler.add_or_glob(
+            Author.from_normalized(
+                name=name,
+                surname=surname,
+                affiliation="university of turin",
+                department=department,
+                id=id,
             )
-            result = gobbler.add_or_glob(author)
-            authors.append(result)
-
-        paper_obj = Paper(
-            id=paper_id,
-            title=paper["title"].iloc[0],  # The titles should all be the same
-            # TODO: We should probably check that the titles are the same
-            year=paper["year"].iloc[0],  # The years should all be the same
-            # TODO: We should probably check that the years are the same,
-            authors=authors,
         )
-        papers.append(paper_obj)
+
+    # The authors without an ID are fuzzy-matched one row at a time.
+    # They are only looked for in the blocks of similar authors, so this is
+    # still about linear in the number of rows.
+    unknown = data[~known]
+    for index, name, surname, department in zip(
+        unknown.index,
+        normalize_column(unknown["author_name"]).tolist(),
+        normalize_column(unknown["author_surname"]).tolist(),
+        normalize_column(unknown["author_department"], remove_quotes=True).tolist(),
+    ):
+        author = Author.from_normalized(
+            name=name,
+            surname=surname,
+            affiliation="university of turin",
+            department=department,
+            id=str(uuid4()),
+        )
+        data.at[index, "author_cris_id"] = gobbler.add_or_glob(author, fuzzy=True)
+
+    # Authors are otherwise only globbed exactly on their ID, so the ID in
+    # the row is the one that the gobbler has.
+    codes = data["author_cris_id"].map(gobbler.index).to_numpy(dtype=np.int32)
+    # The rows are sorted by handle, so each paper is a run of rows
+    starts = np.flatnonzero(~data["handle"].duplicated().to_numpy())
+    # The titles and years should all be the same in a paper, so we take the
+    # first ones.
+    # TODO: We should probably check that the titles and years are the same
+    firsts = data.iloc[starts]
+
+    papers = [
+        Paper(id=intern(paper_id), title=title, year=year, authors=authors)
+        for paper_id, title, year, authors in zip(
+            firsts["handle"].tolist(),
+            firsts["title"].tolist(),
+            firsts["year"].tolist(),
+            (array("i", x.tobytes()) for x in np.split(codes, starts[1:])),
+        )
+    ]
 
     log.info(f"Found {len(papers)} papers")
-    log.debug(papers[0])
+    if papers:
+        log.debug(papers[0])
 
     return papers
 
 
-def read_iris_data(stream: TextIO) -> pd.DataFrame:
-    """Read the iris data from the given path"""
-    log.info("Reading a file to an IRIS dataset")
-    # Edit the header
-    data = StringIO()
-    reader = csv.reader(stream)
-    header = next(reader)
-    header = [standardize_header(head.strip('"')) for head in header]
+# The columns that the rest of the pipeline actually uses, with the (compact)
+# types to load them as, or None to keep the type that pandas reads. All the
+# `author_*` columns are kept too.
+# Careful: the nullable types ("string", "Int32", ...) give pd.NA for missing
+# values, which can't be written to JSON, and would change the years in the
+# output (2012 instead of 2012.0) when some are missing.
+PIPELINE_COLUMNS = {
+    "handle": None,
+    "title": None,
+    "year": None,
+    "author_department": "category",
+}
+
+
+def is_pipeline_column(column: str) -> bool:
+    return column in PIPELINE_COLUMNS or column.startswith("author_")
+
+
+def read_iris_data(
+    stream: TextIO, engine: str = "c", compact: bool = False
+) -> pd.DataFrame:
+    """Read the iris data from the given stream.
 
-    data.write(",".join(header) + "\n")
+    The stream is handed to pandas as-is, and the header is standardized
+    after reading. `engine` is passed to `pd.read_csv` ("c" or "pyarrow").
 
-    for line in stream:
-        data.write(line)
+    If `compact`, only the PIPELINE_COLUMNS are loaded, with compact types.
+    """
+    log.info("Reading a file to an IRIS dataset")
+
+    usecols = None
+    if compact:
+        usecols = lambda head: is_pipeline_column(standardize_header(head))
 
-    data.seek(0)
+    source = stream
+    if engine == "pyarrow":
+        # Pyarrow wants bytes, and can't select columns with a function.
+        # If we can rewind the file, we peek at the header and select them by
+        # name, otherwise we select them after reading.
+        if usecols and stream.seekable():
+            header = next(csv.reader(stream))
+            stream.seek(0)
+            usecols = [head for head in header if usecols(head)]
+        else:
+            usecols = None
+        source = stream.buffer
 
     data = pd.read_csv(
-        data,
+        source,
+        engine=engine,
+        header=0,
+        usecols=usecols,
         encoding="utf-8",
         true_values=["si", "Sì", "SI", "sì", "yes", "Yes", "YES"],
         false_values=["no", "No", "NO"],
@@ -188,6 +455,14 @@ def read_iris_data(stream: TextIO) -> pd.DataFrame:
         skip_blank_lines=True,
     )
 
+    data.columns = [standardize_header(head.strip('"')) for head in data.columns]
+
+    if compact:
+        data = data[[x for x in data.columns if is_pipeline_column(x)]]
+        data = data.astype(
+            {k: v for k, v in PIPELINE_COLUMNS.items() if v and k in data.columns}
+        )
+
     return data
 
 
@@ -243,32 +518,389 @@ class NpEncoder(json.JSONEncoder):
         return super(NpEncoder, self).default(obj)
 
 
-def main(files: list[TextIO], output_steam: IOBase):
-    log.info(f"Parsing {len(files)} files. Reading them in...")
-    datasets = [read_iris_data(stream) for stream in files]
+@dataclass
+class ParsedFile:
+    """The authors and papers found in a single IRIS file"""
+
+    gobbler: AuthorGlobber
+    papers: list[Paper]
+
+
+def parse_file(
+    stream: TextIO,
+    engine: str = "c",
+    compact: bool = False,
+    fuzzy_threshold: Optional[float] = None,
+    instruments: Optional[Instruments] = None,
+) -> ParsedFile:
+    instruments = instruments or Instruments("iris_to_json")
+    with instruments.stage("read") as stage:
+        data = read_iris_data(stream, engine, compact)
+        stage.count(rows=len(data))
+
+    with instruments.stage("parse") as stage:
+        gobbler = AuthorGlobber(fuzzy_threshold)
+        papers = parse_file_simple(gobbler, data)
+        stage.count(authors=len(gobbler.authors), papers=len(papers))
+
+    return ParsedFile(gobbler=gobbler, papers=papers)
+
+
+def parse_path(path: str, **kwargs) -> ParsedFile:
+    """Parse the file at some path. Arguments are passed to `parse_file`"""
+    with open(path, "r") as stream:
+        return parse_file(stream, **kwargs)
 
-    author_gobbler = AuthorGlobber()
+
+def merge_parsed_files(
+    parsed_files: Iterable[ParsedFile],
+    fuzzy_threshold: Optional[float] = None,
+    instruments: Optional[Instruments] = None,
+) -> tuple[AuthorGlobber, list[Paper]]:
+    """Glob together the authors and papers of many files, in order.
+
+    Globbing keeps, for each field, the first value that is not missing, so
+    this gives the same result no matter how the files were parsed.
+    """
+    instruments = instruments or Instruments("iris_to_json")
+    gobbler = AuthorGlobber(fuzzy_threshold)
     papers = []
-    for dataset in datasets:
-        papers.extend(parse_file_simple(author_gobbler, dataset))
+    for parsed in parsed_files:
+        # The files may be parsed lazily, so we only time the globbing
+        with instruments.stage("glob") as stage:
+            renamed = gobbler.merge(parsed.gobbler)
+            # Where each author of this file ended up in the merged gobbler
+            positions = np.array(
+                [gobbler.index[renamed.get(x, x)] for x in parsed.gobbler.authors],
+                dtype=np.int32,
+            )
+            stage.count(papers=len(parsed.papers))
+            if np.array_equal(positions, np.arange(len(positions))):
+                papers.extend(parsed.papers)
+                continue
+
+            for paper in parsed.papers:
+                papers.append(
+                    Paper(
+                        id=paper.id,
+                        title=paper.title,
+                        year=paper.year,
+                        authors=array(
+                            "i",
+                            positions[np.frombuffer(paper.authors, np.int32)].tobytes(),
+                        ),
+                    )
+                )
+
+    return gobbler, papers
+
+
+def digest_records(
+    gobbler: AuthorGlobber,
+    papers: list[Paper],
+    pseudonym: Optional[Callable[[str], str]] = None,
+) -> tuple[Iterable[dict], Iterable[dict]]:
+    """Make the digest records of the globbed authors and papers.
+
+    If `pseudonym` is given, the author IDs are replaced with its pseudonyms
+    on the way out. Each ID is only anonymized once, since the papers point
+    at the authors by their position.
+    """
+    author_ids = list(gobbler.authors)
+    if pseudonym:
+        author_ids = [pseudonym(x) for x in author_ids]
+    authors = (x.to_record() for x in gobbler.authors.values())
+    if pseudonym:
+        authors = ({**record, "id": id} for record, id in zip(authors, author_ids))
+
+    return authors, (x.to_record(author_ids) for x in papers)
+
 
-    log.info(f"Found {len(author_gobbler.authors)} authors")
+def write_digest(
+    gobbler: AuthorGlobber,
+    papers: list[Paper],
+    output_path: Optional[Path],
+    format: DigestFormat = DigestFormat.JSON,
+    pseudonym: Optional[Callable[[str], str]] = None,
+) -> None:
+    """Write the globbed authors and papers to a digest"""
+    log.info(f"Found {len(gobbler.authors)} authors")
     log.info(f"Found {len(papers)} papers")
 
-    json.dump(
-        {
-            "authors": [x.__dict__ for x in author_gobbler.authors.values()],
-            "papers": [x.__dict__ for x in papers],
-        },
-        output_steam,
-        indent=4,
-        cls=NpEncoder,
+    # JSONL is meant to be streamed, so we don't bother indenting it
+    indent = 4 if format == DigestFormat.JSON else None
+    with open_digest_writer(
+        output_path, format, indent=indent, cls=NpEncoder
+    ) as writer:
+        authors, papers = digest_records(gobbler, papers, pseudonym)
+        writer.write_authors(authors)
+        writer.write_papers(papers)
+
+
+# The code that makes a digest, for the cache keys
+DIGEST_CODE = (Author, DigestFormat, group_files, make_pseudonyms)
+
+
+def digest_cache_key(
+    files: list[str],
+    output_path: Path,
+    format: DigestFormat,
+    fuzzy_threshold: Optional[float],
+    pseudonym: Optional[Callable[[str], str]],
+) -> Optional[str]:
+    """The cache key of a digest, or None if it can't be cached"""
+    fingerprint = getattr(pseudonym, "fingerprint", None)
+    if pseudonym and not fingerprint:
+        return None
+
+    # The engine, compact reading and jobs don't change the output
+    params = {
+        "output_path": str(output_path),
+        "format": format.value,
+        "fuzzy_threshold": fuzzy_threshold,
+        "pseudonym": fingerprint,
+    }
+    return cache_key("iris_to_json", params, inputs=files, code=DIGEST_CODE)
+
+
+def main(
+    files: list[TextIO],
+    output_path: Optional[Path],
+    format: DigestFormat = DigestFormat.JSON,
+    engine: str = "c",
+    compact: bool = False,
+    fuzzy_threshold: Optional[float] = None,
+    jobs: int = 1,
+    pseudonym: Optional[Callable[[str], str]] = None,
+    cache: Optional[ResultCache] = None,
+    instruments: Optional[Instruments] = None,
+):
+    instruments = instruments or Instruments("iris_to_json")
+    key = None
+    if cache and output_path and sys.stdin not in files:
+        key = digest_cache_key(
+            [x.name for x in files], output_path, format, fuzzy_threshold, pseudonym
+        )
+        if key and cache.restore(key) is not None:
+            return None
+
+    log.info(f"Parsing {len(files)} files. Reading them in...")
+    options = dict(engine=engine, compact=compact, fuzzy_threshold=fuzzy_threshold)
+
+    if jobs > 1:
+        # The workers re-open the files by themselves, and we can't see
+        # their stages from here
+        paths = [stream.name for stream in files]
+        with instruments.stage("read_and_parse"):
+            with ProcessPoolExecutor(jobs) as pool:
+                parsed_files = list(pool.map(partial(parse_path, **options), paths))
+    else:
+        parsed_files = (
+            parse_file(stream, instruments=instruments, **options) for stream in files
+        )
+
+    # The files are always globbed together in the same order, so the output
+    # does not depend on the number of jobs.
+    author_gobbler, papers = merge_parsed_files(
+        parsed_files, fuzzy_threshold, instruments
     )
 
+    with instruments.stage("write") as stage:
+        write_digest(author_gobbler, papers, output_path, format, pseudonym)
+        stage.count(authors=len(author_gobbler.authors), papers=len(papers))
+
+    if key:
+        cache.store(key, [output_path])
+
+    instruments.flush()
     return None
 
 
-if __name__ == "__main__":
+@dataclass
+class Window:
+    """A window of files, as `group_files.py window` would make it"""
+
+    n: int
+    minyear: int
+    maxyear: int
+    files: list[str]
+
+
+def plan_windows(metadata: dict, width: int, sliding: bool) -> list[Window]:
+    years = {x["path"]: x["year"] for x in metadata["files"]}
+    windows = []
+    for i, files in enumerate(group_files.window(metadata, width, sliding=sliding)):
+        files = [x for x in files if x is not None]
+        windows.append(
+            Window(
+                n=i + 1,
+                minyear=min(years[x] for x in files),
+                maxyear=max(years[x] for x in files),
+                files=files,
+            )
+        )
+    return windows
+
+
+def format_window_path(pattern: str, window: Union[Window, ParsedWindow]) -> Path:
+    return Path(
+        pattern.format(n=window.n, minyear=window.minyear, maxyear=window.maxyear)
+    )
+
+
+@dataclass
+class ParsedWindow:
+    """The globbed authors and papers of a window of files"""
+
+    n: int
+    minyear: int
+    maxyear: int
+    gobbler: AuthorGlobber
+    papers: list[Paper]
+
+
+def parse_windows(
+    metadata: dict,
+    width: int,
+    sliding: bool,
+    engine: str = "c",
+    compact: bool = False,
+    fuzzy_threshold: Optional[float] = None,
+    jobs: int = 1,
+    only: Optional[set[int]] = None,
+    instruments: Optional[Instruments] = None,
+) -> Generator[ParsedWindow, None, None]:
+    """Parse the windows of years that `group_files.py window` would make.
+
+    Each file is parsed only once, and kept around only for as long as there
+    are windows that need it. With more than one job, all files are parsed
+    in parallel from the start.
+
+    If `only` is given, just the windows with those numbers are parsed (and
+    just the files that they need).
+
+    The stages of each window are recorded in `instruments` while it is made.
+    """
+    instruments = instruments or Instruments("iris_to_json")
+    windows = plan_windows(metadata, width, sliding)
+    if only is not None:
+        windows = [x for x in windows if x.n in only]
+
+    last_use = {}
+    for i, window in enumerate(windows):
+        for file in window.files:
+            last_use[file] = i
+
+    options = dict(engine=engine, compact=compact, fuzzy_threshold=fuzzy_threshold)
+    pool = ProcessPoolExecutor(jobs) if jobs > 1 else None
+    pending = {}
+    if pool:
+        for file in last_use:
+            pending[file] = pool.submit(parse_path, file, **options)
+
+    parsed_files: dict[str, ParsedFile] = {}
+    try:
+        for i, window in enumerate(windows):
+            for file in window.files:
+                if file in parsed_files:
+                    continue
+                if pool:
+                    with instruments.stage("read_and_parse"):
+                        parsed_files[file] = pending.pop(file).result()
+                else:
+                    log.info(f"Parsing {file}...")
+                    parsed_files[file] = parse_path(
+                        file, instruments=instruments, **options
+                    )
+
+            gobbler, papers = merge_parsed_files(
+                (parsed_files[x] for x in window.files), fuzzy_threshold, instruments
+            )
+
+            for file in window.files:
+                if last_use[file] == i:
+                    del parsed_files[file]
+
+            yield ParsedWindow(
+                n=window.n,
+                minyear=window.minyear,
+                maxyear=window.maxyear,
+                gobbler=gobbler,
+                papers=papers,
+            )
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+
+
+def main_windowed(
+    metadata: dict,
+    width: int,
+    sliding: bool,
+    output_pattern: str,
+    format: DigestFormat = DigestFormat.JSON,
+    engine: str = "c",
+    compact: bool = False,
+    fuzzy_threshold: Optional[float] = None,
+    jobs: int = 1,
+    pseudonym: Optional[Callable[[str], str]] = None,
+    cache: Optional[ResultCache] = None,
+    instruments: Optional[Instruments] = None,
+) -> None:
+    """Make one digest per window of years, like `group_files.py window` would.
+
+    The same `pseudonym` is used for all windows, so an author gets the same
+    pseudonym everywhere.
+
+    The output pattern is formatted with:
+        - {n}: the number of the window, starting from 1;
+        - {minyear}, {maxyear}: the first and last year in the window.
+
+    With a `cache`, only the windows that are not in it are made.
+
+    The metrics of the `instruments` have one record per window that is made.
+    """
+    instruments = instruments or Instruments("iris_to_json")
+    keys = {}
+    todo = None
+    if cache:
+        todo = set()
+        for window in plan_windows(metadata, width, sliding):
+            output_path = format_window_path(output_pattern, window)
+            keys[window.n] = digest_cache_key(
+                window.files, output_path, format, fuzzy_threshold, pseudonym
+            )
+            if not keys[window.n] or cache.restore(keys[window.n]) is None:
+                todo.add(window.n)
+
+    windows = parse_windows(
+        metadata,
+        width,
+        sliding,
+        engine=engine,
+        compact=compact,
+        fuzzy_threshold=fuzzy_threshold,
+        jobs=jobs,
+        only=todo,
+        instruments=instruments,
+    )
+    for window in windows:
+        output_path = format_window_path(output_pattern, window)
+        log.info(f"Writing window {window.n} to {output_path}")
+        with instruments.stage("write") as stage:
+            write_digest(window.gobbler, window.papers, output_path, format, pseudonym)
+            stage.count(authors=len(window.gobbler.authors), papers=len(window.papers))
+
+        if keys.get(window.n):
+            cache.store(keys[window.n], [output_path])
+
+        instruments.flush(n=window.n, minyear=window.minyear, maxyear=window.maxyear)
+
+    return None
+
+
+def cli(argv: Optional[list[str]] = None) -> None:
+    """Run the script with these command line arguments (or sys.argv)"""
     import argparse
 
     parser = argparse.ArgumentParser()
@@ -278,19 +910,94 @@ if __name__ == "__main__":
         help="File(s) to use as input. Space-delimited.",
         type=argparse.FileType("r"),
         default=[sys.stdin],
-        nargs="+",
+        nargs="*",
     )
     parser.add_argument(
         "--output_file",
-        help="Output file",
-        type=argparse.FileType("w"),
-        default=sys.stdout,
+        help="Output file (or folder, for columnar digests)",
+        type=Path,
+        default=None,
+    )
+    parser.add_argument(
+        "--format",
+        help="Format of the output digest",
+        choices=[x.value for x in DigestFormat],
+        default="json",
+    )
+    parser.add_argument(
+        "--metadata",
+        help=(
+            "Metadata file with the input files by year. If given, make one "
+            "digest per window of --window years instead of reading the files"
+        ),
+        type=argparse.FileType("r"),
+        default=None,
+    )
+    parser.add_argument(
+        "--window", help="Size of the windows, in files", type=int, default=None
+    )
+    parser.add_argument(
+        "--sliding",
+        action="store_true",
+        help="If specified, makes the window a sliding window",
+    )
+    parser.add_argument(
+        "--output_pattern",
+        help=(
+            "Output path for each window. {n} is the window number, {minyear} "
+            "and {maxyear} are the years of the window"
+        ),
+        default=None,
     )
+    parser.add_argument(
+        "--csv_engine",
+        help="Pandas engine to read the IRIS files with",
+        choices=["c", "pyarrow"],
+        default="c",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Only load the columns that are used, with compact types",
+    )
+    parser.add_argument(
+        "--fuzzy_threshold",
+        help=(
+            "If given, authors without a CRIS ID are matched to similar authors "
+            "with at least this similarity (0 to 1), instead of being dropped"
+        ),
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of processes to parse the input files with",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--anonymize",
+        action="store_true",
+        help="Replace the author IDs with pseudonyms, like anonimize_CRIS.py",
+    )
+    parser.add_argument(
+        "--secret_file",
+        type=Path,
+        default=None,
+        help=(
+            "File with a secret key, to make stable pseudonyms with --anonymize. "
+            f"Defaults to the {SECRET_ENV_VAR} environment variable. If neither "
+            "is given, the pseudonyms are random."
+        ),
+    )
+    add_cache_arguments(parser)
+    add_instrumentation_arguments(parser)
     parser.add_argument(
         "-v", "--verbose", action="count", default=0, help="Increase verbosity"
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     verbosity_levels = {
         0: logging.WARNING,
@@ -302,4 +1009,50 @@ if __name__ == "__main__":
         if args.verbose >= i:
             log.setLevel(level)
 
-    main(args.files, args.output_file)
+    # The files were opened by argparse, so we close them when done
+    try:
+        if args.format == "columnar" and args.output_file is None:
+            parser.error("Columnar output needs an --output_file folder")
+        if args.jobs > 1 and not args.metadata and sys.stdin in args.files:
+            parser.error("Can't read from stdin with more than one job")
+
+        pseudonym = make_pseudonyms(args.secret_file) if args.anonymize else None
+
+        if args.metadata:
+            if args.window is None or args.output_pattern is None:
+                parser.error("--metadata needs both --window and --output_pattern")
+            main_windowed(
+                json.load(args.metadata),
+                width=args.window,
+                sliding=args.sliding,
+                output_pattern=args.output_pattern,
+                format=DigestFormat(args.format),
+                engine=args.csv_engine,
+                compact=args.compact,
+                fuzzy_threshold=args.fuzzy_threshold,
+                jobs=args.jobs,
+                pseudonym=pseudonym,
+                cache=cache_from_args(args),
+                instruments=instruments_from_args(args, "iris_to_json"),
+            )
+        else:
+            main(
+                args.files,
+                args.output_file,
+                DigestFormat(args.format),
+                engine=args.csv_engine,
+                compact=args.compact,
+                fuzzy_threshold=args.fuzzy_threshold,
+                jobs=args.jobs,
+                pseudonym=pseudonym,
+                cache=cache_from_args(args),
+                instruments=instruments_from_args(args, "iris_to_json"),
+            )
+    finally:
+        for stream in [*args.files, args.metadata]:
+            if stream is not None:
+                stream.close()
+
+
+if __name__ == "__main__":
+    cli()
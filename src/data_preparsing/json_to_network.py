@@ -1,12 +1,27 @@
 #!/usr/bin/env python
 
-import json
+from __future__ import annotations
+
 from pathlib import Path
-from io import IOBase
 import sys
 from enum import Enum
-from itertools import combinations
 from dataclasses import dataclass
+from typing import Generator, Iterable, Optional, Union
+
+from more_itertools import batched, windowed
+
+from cache import ResultCache, add_cache_arguments, cache_from_args, cache_key
+from digest import open_digest_reader, paper_year
+from instrumentation import (
+    Instruments,
+    add_instrumentation_arguments,
+    counted,
+    instruments_from_args,
+)
+from lazy import lazy_import
+
+np = lazy_import("numpy")
+sparse = lazy_import("scipy.sparse")
 
 HELP = """Convert JSON digests of IRIS files to an edgelist and authorlist
 
@@ -25,11 +40,34 @@ E.g. edgelist_{minyear}-{maxyear}.csv is converted to edgelist_2012-2015.csv
 # i'm not copying the classes here, I'm not sure they are super necessary
 # And in any case, they would be just for typing...
 class WeightStrategy(Enum):
-    UNWEIGTHED = "unweigthed"
+    UNWEIGTHED = "unweighted"
     LINEAR = "linear"
     PAPER_SIZE_MODERATED = "paper_size_moderated"
 
 
+class EdgelistFormat(Enum):
+    CSV = "csv"
+    # A .npy structured array of (node_1, node_2, weight), with the nodes as
+    # int32 codes, and the ID of each code in a .ids.csv file next to it
+    BINARY = "npy"
+
+
+class NetworkLevel(Enum):
+    # The co-authorship network of the authors
+    AUTHOR = "author"
+    # The authors aggregated by department, see `build_department_network`
+    DEPARTMENT = "department"
+
+
+# Authors without a department, like in the R analysis
+UNKNOWN_DEPARTMENT = "unknown"
+
+# The record of the binary edgelists. The weights are always floats, so all
+# strategies have the same layout. It's a numpy dtype spec, so that numpy is
+# only imported when it's used.
+BINARY_EDGE_DTYPE = [("node_1", "<i4"), ("node_2", "<i4"), ("weight", "<f8")]
+
+
 @dataclass
 class JsonStats:
     minyear: int
@@ -38,36 +76,534 @@ class JsonStats:
     numedges: int
 
 
-def make_edgelist(papers: list[dict], strategy: WeightStrategy) -> list[str]:
-    # TODO: This is very slow - please make me faster.
-    # But it seems I'm fast enough for most networks.
-    edges = {}
+@dataclass
+class EdgeTable:
+    """An integer-indexed edgelist. `source` and `sink` index into `ids`"""
+
+    ids: list[str]
+    source: np.ndarray
+    sink: np.ndarray
+    weight: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.source)
+
+
+def make_edge_table(
+    strategy: WeightStrategy,
+    ids: list[str],
+    keys: np.ndarray,
+    weights: np.ndarray,
+    counts: np.ndarray,
+) -> EdgeTable:
+    """Make the edge table of packed (source << 32 | sink) keys"""
+    if strategy == WeightStrategy.UNWEIGTHED:
+        weights = np.ones(len(keys), dtype=np.int64)
+    elif strategy == WeightStrategy.LINEAR:
+        weights = counts
+
+    return EdgeTable(
+        ids=ids,
+        source=(keys >> 32).astype(np.int32),
+        sink=(keys & 0xFFFFFFFF).astype(np.int32),
+        weight=weights,
+    )
+
+
+@dataclass
+class EdgeTotals:
+    """The reduced edges of an `EdgeBuilder`, with their summed paper weights
+    and number of papers"""
+
+    keys: np.ndarray
+    weights: np.ndarray
+    counts: np.ndarray
+
+
+class EdgeBuilder:
+    """Accumulate co-authorship edges from papers, one paper at a time.
+
+    Authors are mapped to dense integer codes the first time we see them,
+    and each paper is turned into two arrays of (sorted) code pairs with
+    numpy. Pairs are only reduced to unique edges when the buffer gets big
+    (or when we are done), so the per-pair work never touches Python strings.
+
+    The reduction keeps edges in order of first appearance, and sums the
+    weights in the same order as the old dict-based loop did, so the output
+    is byte-identical to it.
+    """
+
+    # How many pending pairs to keep around before reducing them
+    BUFFER_SIZE = 2**22
+
+    def __init__(
+        self,
+        strategy: WeightStrategy,
+        index: Optional[dict[str, int]] = None,
+        ids: Optional[list[str]] = None,
+    ) -> None:
+        """Make a new builder.
+
+        Builders can share the same `index` and `ids`, so that their author
+        codes (and so their edge keys) are the same.
+        """
+        self.strategy = strategy
+        self.index: dict[str, int] = {} if index is None else index
+        self.ids: list[str] = [] if ids is None else ids
+
+        # These are the already-reduced edges, in order of first appearance
+        self._keys = np.empty(0, dtype=np.int64)
+        self._weights = np.empty(0, dtype=np.float64)
+        self._counts = np.empty(0, dtype=np.int64)
+
+        self._pending_keys = []
+        self._pending_weights = []
+        self._pending_size = 0
+
+    def _code(self, author_id: str) -> int:
+        code = self.index.get(author_id)
+        if code is None:
+            code = len(self.ids)
+            self.index[author_id] = code
+            self.ids.append(author_id)
+        return code
+
+    def add_paper(self, authors: list[str], size: Optional[int] = None) -> None:
+        """Add the pairs of authors of one paper.
+
+        `size` is the number of authors to moderate the weights with, if it's
+        not just the number of authors given (e.g. for capped papers).
+        """
+        size = size or len(authors)
+        # We sort the authors so that each pair has a unique orientation.
+        # This is the same thing that the old `combinations` loop did, so
+        # duplicated authors in a paper still produce the same (self) edges
+        authors = sorted(authors)
+        if len(authors) < 2:
+            return
+
+        codes = np.fromiter(
+            (self._code(x) for x in authors), dtype=np.int64, count=len(authors)
+        )
+        left, right = np.triu_indices(len(authors), k=1)
+        # Pack the two codes in one integer, so that we can reduce on it
+        keys = (codes[left] << 32) | codes[right]
+
+        self._pending_keys.append(keys)
+        self._pending_weights.append(np.full(len(keys), 1 / size, dtype=np.float64))
+        self._pending_size += len(keys)
+
+        if self._pending_size >= self.BUFFER_SIZE:
+            self._reduce()
+
+    def _reduce(self) -> None:
+        if not self._pending_keys:
+            return
+
+        # The old edges go first: this keeps both the first-appearance order
+        # and the order in which the weights are summed.
+        keys = np.concatenate([self._keys, *self._pending_keys])
+        weights = np.concatenate([self._weights, *self._pending_weights])
+        counts = np.concatenate(
+            [self._counts, np.ones(self._pending_size, dtype=np.int64)]
+        )
+
+        unique, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        # `bincount` adds up the weights in input order, like the old loop
+        summed_weights = np.bincount(inverse, weights=weights, minlength=len(unique))
+        summed_counts = np.bincount(inverse, weights=counts, minlength=len(unique))
+
+        order = np.argsort(first, kind="stable")
+        self._keys = unique[order]
+        self._weights = summed_weights[order]
+        self._counts = summed_counts[order].astype(np.int64)
+
+        self._pending_keys = []
+        self._pending_weights = []
+        self._pending_size = 0
+
+    def totals(self) -> EdgeTotals:
+        self._reduce()
+        return EdgeTotals(self._keys, self._weights, self._counts)
+
+    def build(self) -> EdgeTable:
+        self._reduce()
+        return make_edge_table(
+            self.strategy, self.ids, self._keys, self._weights, self._counts
+        )
+
+
+class SlidingEdges:
+    """The edges of a window of years, as the sum of the edges of each year.
+
+    Moving the window adds the totals of the incoming years and subtracts
+    the ones of the outgoing years, so each year is only built once, and each
+    window costs as much as the years that change.
+
+    Edges are dropped when their paper count goes back to zero, so the
+    leftovers of subtracting floating point weights never make ghost edges.
+    The moderated weights can still differ from a fresh sum in the last
+    digit, since they are summed in a different order.
+    """
+
+    def __init__(self, strategy: WeightStrategy, ids: list[str]) -> None:
+        self.strategy = strategy
+        self.ids = ids
+        self._keys = np.empty(0, dtype=np.int64)
+        self._weights = np.empty(0, dtype=np.float64)
+        self._counts = np.empty(0, dtype=np.int64)
+
+    def add(self, totals: EdgeTotals, sign: int = 1) -> None:
+        """Add (or, with a negative sign, subtract) the totals of a year"""
+        keys = np.concatenate([self._keys, totals.keys])
+        weights = np.concatenate([self._weights, sign * totals.weights])
+        counts = np.concatenate([self._counts, sign * totals.counts])
 
+        unique, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        summed_weights = np.bincount(inverse, weights=weights, minlength=len(unique))
+        # Counts are small integers, so the float sums are exact
+        summed_counts = np.bincount(inverse, weights=counts, minlength=len(unique))
+        summed_counts = np.rint(summed_counts).astype(np.int64)
+
+        # The edges that we already had keep their place
+        order = np.argsort(first, kind="stable")
+        order = order[summed_counts[order] > 0]
+        self._keys = unique[order]
+        self._weights = summed_weights[order]
+        self._counts = summed_counts[order]
+
+    def subtract(self, totals: EdgeTotals) -> None:
+        self.add(totals, sign=-1)
+
+    def build(self) -> EdgeTable:
+        return make_edge_table(
+            self.strategy, self.ids, self._keys, self._weights, self._counts
+        )
+
+
+def build_edges(papers: Iterable[dict], strategy: WeightStrategy) -> EdgeTable:
+    builder = EdgeBuilder(strategy)
+    for paper in papers:
+        builder.add_paper(paper["authors"], paper.get("size"))
+
+    return builder.build()
+
+
+def project_edges(papers: Iterable[dict], strategy: WeightStrategy) -> EdgeTable:
+    """Build the edges as the projection of the paper x author incidence matrix.
+
+    With A the (papers x authors) incidence matrix and W the diagonal matrix
+    of paper weights, the co-authorship weights are the upper triangle of
+    A^T W A. This needs memory proportional to the number of authorships and
+    edges, never to the number of pairs of authors in each paper.
+
+    The weights are the same as the ones from `build_edges` (up to floating
+    point summation order), self edges from duplicated authors included.
+    Edges are sorted by author ID, not by order of appearance.
+    """
+    index: dict[str, int] = {}
+    ids: list[str] = []
+    rows = []
+    cols = []
+    paper_weights = []
+
+    for paper in papers:
+        authors = paper["authors"]
+        if len(authors) < 2:
+            continue
+        for author in authors:
+            code = index.get(author)
+            if code is None:
+                code = len(ids)
+                index[author] = code
+                ids.append(author)
+            cols.append(code)
+        rows.extend([len(paper_weights)] * len(authors))
+        paper_weights.append(1 / (paper.get("size") or len(authors)))
+
+    # We relabel the authors by ID order, so that the upper triangle of the
+    # projection has the same edge orientation as `build_edges`
+    order = sorted(range(len(ids)), key=ids.__getitem__)
+    rank = np.empty(len(ids), dtype=np.int64)
+    rank[order] = np.arange(len(ids))
+    ids = [ids[i] for i in order]
+
+    if strategy == WeightStrategy.PAPER_SIZE_MODERATED:
+        paper_weights = np.array(paper_weights, dtype=np.float64)
+    else:
+        paper_weights = np.ones(len(paper_weights), dtype=np.float64)
+
+    # Duplicated authors in a paper are summed, so A holds authorship counts
+    incidence = sparse.csr_matrix(
+        (
+            np.ones(len(cols), dtype=np.float64),
+            (np.array(rows, dtype=np.int64), rank[np.array(cols, dtype=np.int64)]),
+        ),
+        shape=(len(paper_weights), len(ids)),
+    )
+    weighted = sparse.diags(paper_weights) @ incidence
+    projection = (incidence.T @ weighted).tocsr()
+
+    # The off-diagonal is sum(w * c_a * c_b), just like the pairs. On the
+    # diagonal we have sum(w * c^2), but the pairs would give sum(w * c(c-1)/2)
+    self_weights = (projection.diagonal() - incidence.T @ paper_weights) / 2
+    projection = sparse.triu(projection, k=1).tocoo()
+
+    self_codes = np.flatnonzero(self_weights > 0)
+    source = np.concatenate([projection.row, self_codes])
+    sink = np.concatenate([projection.col, self_codes])
+    weight = np.concatenate([projection.data, self_weights[self_codes]])
+
+    order = np.lexsort((sink, source))
+    source, sink, weight = source[order], sink[order], weight[order]
+
+    if strategy == WeightStrategy.UNWEIGTHED:
+        weight = np.ones(len(weight), dtype=np.int64)
+    elif strategy == WeightStrategy.LINEAR:
+        weight = np.rint(weight).astype(np.int64)
+
+    return EdgeTable(
+        ids=ids,
+        source=source.astype(np.int32),
+        sink=sink.astype(np.int32),
+        weight=weight,
+    )
+
+
+class LargePaperPolicy(Enum):
+    KEEP = "keep"
+    SKIP = "skip"
+    CAP = "cap"
+    HYPEREDGE = "hyperedge"
+
+
+def moderate_large_papers(
+    papers: Iterable[dict],
+    max_authors: Optional[int],
+    policy: LargePaperPolicy,
+    hyperedges: Optional[list] = None,
+) -> Generator[dict, None, None]:
+    """Handle papers with more than `max_authors` authors.
+
+    Consortium papers with thousands of authors make millions of edges, so
+    we can choose to:
+        - KEEP them as they are;
+        - SKIP them altogether;
+        - CAP them to their first `max_authors` authors. The weights are
+          still moderated on the full number of authors;
+        - keep them as HYPEREDGEs: they are not projected, but put in the
+          `hyperedges` list to be written out as bipartite records.
+    """
     for paper in papers:
-        # We sort this as `combinations` will produce ordered tuples
-        # if the input is sorted, and we want unique indexes for each
-        # pair of author (edge). Having the sorted indexes be their new ID
-        # should ensure this is the case
-        authors = sorted(paper["authors"])
-        for combo in combinations(authors, 2):
-            # I use this ID format so its easy to pass it to .csv
-            id = f'"{combo[0]}","{combo[1]}"'
-            old_value = edges.get(id, 0)
-
-            if strategy == WeightStrategy.UNWEIGTHED:
-                edges[id] = 1
-            elif strategy == WeightStrategy.LINEAR:
-                edges[id] = old_value + 1
-            elif strategy == WeightStrategy.PAPER_SIZE_MODERATED:
-                edges[id] = old_value + (1 / len(authors))
-    edgelist = []
-    for key, value in edges.items():
-        edgelist.append(f"{key},{value}")
-
-    return edgelist
-
-
-def make_authorlist(authors: list[dict]) -> list[str]:
+        if (
+            max_authors is None
+            or policy == LargePaperPolicy.KEEP
+            or len(paper["authors"]) <= max_authors
+        ):
+            yield paper
+            continue
+
+        if policy == LargePaperPolicy.CAP:
+            yield {
+                **paper,
+                "authors": paper["authors"][:max_authors],
+                "size": len(paper["authors"]),
+            }
+        elif policy == LargePaperPolicy.HYPEREDGE and hyperedges is not None:
+            hyperedges.append(paper)
+
+
+def format_hyperedges(papers: list[dict]) -> Generator[str, None, None]:
+    """Format papers as paper -> author .csv lines, weighted by paper size"""
+    for paper in papers:
+        weight = 1 / len(paper["authors"])
+        for author in paper["authors"]:
+            yield f'"{paper["id"]}","{author}",{weight}'
+
+
+def format_edges(edges: EdgeTable) -> Generator[str, None, None]:
+    """Format the edges as .csv lines. This is the only place we make strings"""
+    ids = edges.ids
+    # `tolist` gives us python ints and floats, so the formatting is the same
+    # as it always was
+    for source, sink, weight in zip(
+        edges.source.tolist(), edges.sink.tolist(), edges.weight.tolist()
+    ):
+        yield f'"{ids[source]}","{ids[sink]}",{weight}'
+
+
+def binary_ids_path(edgelist_path: Path) -> Path:
+    """Where the IDs of the nodes of a binary edgelist are"""
+    return Path(edgelist_path).with_suffix(".ids.csv")
+
+
+def write_binary_edges(edges: EdgeTable, path: Path) -> list[Path]:
+    """Write the edges as a .npy file, and the IDs of the nodes next to it.
+
+    The edges are written in one go, straight from the arrays, and can be
+    read back without a copy with `numpy.load(path, mmap_mode="r")`.
+    Row i of the .ids.csv file (not counting the header) is the ID of node i.
+    """
+    records = np.empty(len(edges), dtype=BINARY_EDGE_DTYPE)
+    records["node_1"] = edges.source
+    records["node_2"] = edges.sink
+    records["weight"] = edges.weight
+
+    path = Path(path)
+    with path.open("wb") as stream:
+        np.save(stream, records)
+
+    ids_path = binary_ids_path(path)
+    with ids_path.open("w+") as stream:
+        stream.write("id\n")
+        stream.writelines(f'"{x}"\n' for x in edges.ids)
+
+    return [path, ids_path]
+
+
+@dataclass
+class DepartmentTable:
+    """The co-authorship weights between and within departments.
+
+    `source` and `sink` index into `departments`, with source <= sink. The
+    edges with source == sink are the totals within a department. `papers`
+    is the number of papers that make each edge.
+    """
+
+    departments: list[str]
+    source: np.ndarray
+    sink: np.ndarray
+    weight: np.ndarray
+    papers: np.ndarray
+    # The number of authors and of papers of each department
+    department_authors: np.ndarray
+    department_papers: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.source)
+
+
+def build_department_network(
+    authors: Iterable[dict], papers: Iterable[dict], strategy: WeightStrategy
+) -> DepartmentTable:
+    """Sum the co-authorship weights of the authors by their departments.
+
+    The weights are the same as summing the author edges of `build_edges`
+    by department, but they are computed straight from the papers, without
+    ever making the pairs of authors. With C the (papers x departments)
+    matrix of how many authors of each department wrote each paper, and W
+    the diagonal matrix of paper weights, the weights between departments
+    are the off-diagonal of C^T W C, and the ones within a department are
+    sum(w * c(c-1)/2), like the self edges in `project_edges`.
+
+    Unweighted author edges count each pair of authors once, however many
+    papers they share, so they can't be summed up without the pairs.
+    """
+    if strategy == WeightStrategy.UNWEIGTHED:
+        raise ValueError(
+            "Unweighted department networks would need the pairs of authors: "
+            "use the linear or paper_size_moderated weights"
+        )
+
+    author_departments = {
+        x["id"]: x["department"] or UNKNOWN_DEPARTMENT for x in authors
+    }
+    departments = sorted(set(author_departments.values()) | {UNKNOWN_DEPARTMENT})
+    codes = {name: i for i, name in enumerate(departments)}
+    department_authors = np.bincount(
+        [codes[x] for x in author_departments.values()], minlength=len(codes)
+    )
+
+    rows = []
+    cols = []
+    paper_weights = []
+    for paper in papers:
+        authors = paper["authors"]
+        if len(authors) < 2:
+            continue
+        cols.extend(
+            codes[author_departments.get(x, UNKNOWN_DEPARTMENT)] for x in authors
+        )
+        rows.extend([len(paper_weights)] * len(authors))
+        paper_weights.append(1 / (paper.get("size") or len(authors)))
+
+    if strategy == WeightStrategy.PAPER_SIZE_MODERATED:
+        paper_weights = np.array(paper_weights, dtype=np.float64)
+    else:
+        paper_weights = np.ones(len(paper_weights), dtype=np.float64)
+
+    # The duplicates are summed, so this holds the counts of authors
+    counts = sparse.csr_matrix(
+        (
+            np.ones(len(cols), dtype=np.float64),
+            (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)),
+        ),
+        shape=(len(paper_weights), len(departments)),
+    )
+    # There are few departments, so the results can be dense
+    weights = (counts.T @ (sparse.diags(paper_weights) @ counts)).toarray()
+    np.fill_diagonal(weights, (weights.diagonal() - counts.T @ paper_weights) / 2)
+
+    present = (counts > 0).astype(np.int64)
+    papers = (present.T @ present).toarray()
+    np.fill_diagonal(papers, (counts >= 2).astype(np.int64).sum(axis=0))
+
+    source, sink = np.triu_indices(len(departments))
+    keep = papers[source, sink] > 0
+    source, sink = source[keep], sink[keep]
+    weight = weights[source, sink]
+    if strategy == WeightStrategy.LINEAR:
+        weight = np.rint(weight).astype(np.int64)
+
+    return DepartmentTable(
+        departments=departments,
+        source=source,
+        sink=sink,
+        weight=weight,
+        papers=papers[source, sink],
+        department_authors=department_authors,
+        department_papers=np.asarray(present.sum(axis=0)).ravel(),
+    )
+
+
+def write_department_network(
+    table: DepartmentTable,
+    output_edgelist_path: Path,
+    output_departments_path: Path,
+) -> list[Path]:
+    """Write the weights between departments, and the departments, as .csv"""
+    names = table.departments
+    with Path(output_edgelist_path).open("w+") as stream:
+        stream.write("node_1,node_2,weight,papers\n")
+        stream.writelines(
+            f'"{names[source]}","{names[sink]}",{weight},{papers}\n'
+            for source, sink, weight, papers in zip(
+                table.source.tolist(),
+                table.sink.tolist(),
+                table.weight.tolist(),
+                table.papers.tolist(),
+            )
+        )
+
+    with Path(output_departments_path).open("w+") as stream:
+        stream.write("department,authors,papers\n")
+        stream.writelines(
+            f'"{name}",{authors},{papers}\n'
+            for name, authors, papers in zip(
+                names,
+                table.department_authors.tolist(),
+                table.department_papers.tolist(),
+            )
+        )
+
+    return [Path(output_edgelist_path), Path(output_departments_path)]
+
+
+def make_edgelist(papers: list[dict], strategy: WeightStrategy) -> list[str]:
+    return list(format_edges(build_edges(papers, strategy)))
+
+
+def make_authorlist(authors: Iterable[dict]) -> list[str]:
     authors_list = []
     for a in authors:
         authors_list.append(
@@ -76,43 +612,327 @@ def make_authorlist(authors: list[dict]) -> list[str]:
     return authors_list
 
 
-def main(
-    input_path: Path,
-    output_edgelist_path: Path,
-    output_authors_path: Path,
+@dataclass
+class Network:
+    """The edges and nodes of a network, ready to be written out"""
+
+    stats: JsonStats
+    edges: Union[EdgeTable, DepartmentTable]
+    authors: list[str]
+    hyperedges: list[dict]
+
+
+def build_network(
+    authors: Iterable[dict],
+    papers: Iterable[dict],
     weigth_strategy: WeightStrategy,
-) -> None:
-    data = json.load(input_stream)
+    projection: bool = False,
+    max_authors: Optional[int] = None,
+    large_paper_policy: LargePaperPolicy = LargePaperPolicy.KEEP,
+    level: NetworkLevel = NetworkLevel.AUTHOR,
+) -> Network:
+    """Build the network of some authors and their papers.
+
+    At the DEPARTMENT level, the edges are a `DepartmentTable`, and the nodes
+    are the departments.
+    """
+    # The authors come first, and they are few, so we can keep them around.
+    # The papers are streamed right into the edge builders.
+    authors = list(authors)
+    authors_list = make_authorlist(authors)
+
+    all_years = []
 
-    edgelist = make_edgelist(data["papers"], weigth_strategy)
-    authors_list = make_authorlist(data["authors"])
+    def track_years(papers: Iterable[dict]) -> Generator[dict, None, None]:
+        for paper in papers:
+            all_years.append(paper["year"])
+            yield paper
+
+    hyperedges = []
+    papers = moderate_large_papers(
+        track_years(papers), max_authors, large_paper_policy, hyperedges
+    )
+    if level == NetworkLevel.DEPARTMENT:
+        edges = build_department_network(authors, papers, weigth_strategy)
+        numnodes = len(edges.departments)
+    elif projection:
+        edges = project_edges(papers, weigth_strategy)
+        numnodes = len(authors_list)
+    else:
+        edges = build_edges(papers, weigth_strategy)
+        numnodes = len(authors_list)
 
-    all_years = [x["year"] for x in data["papers"]]
     stats = JsonStats(
         minyear=int(min(all_years)),
         maxyear=int(max(all_years)),
-        numedges=len(edgelist),
-        numnodes=len(authors_list),
+        numedges=len(edges),
+        numnodes=numnodes,
     )
 
-    print(stats.__dict__)
+    return Network(stats, edges, authors_list, hyperedges)
 
-    output_authors_path = Path(str(output_authors_path).format_map(stats.__dict__))
-    output_edgelist_path = Path(str(output_edgelist_path).format_map(stats.__dict__))
 
-    output_edgelist_stream = output_edgelist_path.open("w+")
-    output_authors_stream = output_authors_path.open("w+")
+def write_network(
+    network: Network,
+    output_edgelist_path: Path,
+    output_authors_path: Path,
+    output_hyperedges_path: Optional[Path] = None,
+    fields: Optional[dict] = None,
+    format: EdgelistFormat = EdgelistFormat.CSV,
+) -> list[Path]:
+    """Write the network out, and return the paths that were written.
+
+    The paths are formatted with the network stats, and any other `fields`.
+    """
+    stats = {**network.stats.__dict__, **(fields or {})}
+    output_authors_path = Path(str(output_authors_path).format_map(stats))
+    output_edgelist_path = Path(str(output_edgelist_path).format_map(stats))
+
+    if isinstance(network.edges, DepartmentTable):
+        # The departments take the place of the authors
+        paths = write_department_network(
+            network.edges, output_edgelist_path, output_authors_path
+        )
+    elif format == EdgelistFormat.BINARY:
+        paths = write_binary_edges(network.edges, output_edgelist_path)
+    else:
+        with output_edgelist_path.open("w+") as output_edgelist_stream:
+            output_edgelist_stream.write("node_1,node_2,weight\n")
+            output_edgelist_stream.writelines(
+                f"{x}\n" for x in format_edges(network.edges)
+            )
+        paths = [output_edgelist_path]
 
-    output_edgelist_stream.writelines("node_1,node_2,weight\n")
-    output_edgelist_stream.writelines([f"{x}\n" for x in edgelist])
+    if not isinstance(network.edges, DepartmentTable):
+        with output_authors_path.open("w+") as output_authors_stream:
+            output_authors_stream.write("name,surname,affiliation,department,id\n")
+            output_authors_stream.writelines([f"{x}\n" for x in network.authors])
 
-    output_authors_stream.writelines("name,surname,affiliation,department,id\n")
-    output_authors_stream.writelines([f"{x}\n" for x in authors_list])
+        paths.append(output_authors_path)
+
+    if not output_hyperedges_path:
+        return paths
+
+    output_hyperedges_path = Path(str(output_hyperedges_path).format_map(stats))
+    with output_hyperedges_path.open("w+") as output_hyperedges_stream:
+        output_hyperedges_stream.write("paper,author,weight\n")
+        output_hyperedges_stream.writelines(
+            f"{x}\n" for x in format_hyperedges(network.hyperedges)
+        )
+
+    return paths + [output_hyperedges_path]
+
+
+def main(
+    input_path: Optional[Path],
+    output_edgelist_path: Path,
+    output_authors_path: Path,
+    weigth_strategy: WeightStrategy,
+    projection: bool = False,
+    max_authors: Optional[int] = None,
+    large_paper_policy: LargePaperPolicy = LargePaperPolicy.KEEP,
+    output_hyperedges_path: Optional[Path] = None,
+    cache: Optional[ResultCache] = None,
+    format: EdgelistFormat = EdgelistFormat.CSV,
+    instruments: Optional[Instruments] = None,
+    level: NetworkLevel = NetworkLevel.AUTHOR,
+) -> None:
+    """Make the network of a digest.
+
+    At the DEPARTMENT level, the edgelist has the weights between (and
+    within) departments, and the departments are written instead of the
+    authors.
+    """
+    instruments = instruments or Instruments("json_to_network")
+    key = None
+    if cache and input_path:
+        params = {
+            "output_paths": [
+                str(output_edgelist_path),
+                str(output_authors_path),
+                str(output_hyperedges_path),
+            ],
+            "strategy": weigth_strategy.value,
+            "projection": projection,
+            "max_authors": max_authors,
+            "large_paper_policy": large_paper_policy.value,
+            "format": format.value,
+            "level": level.value,
+        }
+        key = cache_key(
+            "json_to_network",
+            params,
+            inputs=[input_path],
+            code=(main, open_digest_reader),
+        )
+        if (stats := cache.restore(key)) is not None:
+            print(stats)
+            return None
 
+    # The papers are streamed from the digest into the edges, so reading
+    # them is part of building the network
+    with instruments.stage("build") as stage, open_digest_reader(input_path) as reader:
+        network = build_network(
+            reader.authors(),
+            counted(reader.papers(), stage, "papers"),
+            weigth_strategy,
+            projection=projection,
+            max_authors=max_authors,
+            large_paper_policy=large_paper_policy,
+            level=level,
+        )
+        stage.count(nodes=network.stats.numnodes, edges=network.stats.numedges)
+
+    print(network.stats.__dict__)
+
+    with instruments.stage("write") as stage:
+        paths = write_network(
+            network,
+            output_edgelist_path,
+            output_authors_path,
+            output_hyperedges_path,
+            format=format,
+        )
+        stage.count(edges=network.stats.numedges)
+
+    if key:
+        cache.store(key, paths, info=network.stats.__dict__)
+
+    instruments.flush()
     return None
 
 
-if __name__ == "__main__":
+def year_windows(years: Iterable[int], width: int, sliding: bool) -> list[list[int]]:
+    """Group the years in windows, like `group_files.window` does with files"""
+    years = sorted(set(years))
+    windows = windowed(years, width) if sliding else batched(years, width)
+    return [[x for x in window if x is not None] for window in windows]
+
+
+def main_windowed(
+    input_path: Optional[Path],
+    output_edgelist_path: Path,
+    output_authors_path: Path,
+    weigth_strategy: WeightStrategy,
+    width: int,
+    sliding: bool = False,
+    max_authors: Optional[int] = None,
+    large_paper_policy: LargePaperPolicy = LargePaperPolicy.KEEP,
+    cache: Optional[ResultCache] = None,
+    format: EdgelistFormat = EdgelistFormat.CSV,
+    instruments: Optional[Instruments] = None,
+) -> None:
+    """Make the networks of all windows of years of a single digest.
+
+    The edges of each year are built once, and the windows are made by
+    adding and subtracting whole years with `SlidingEdges`. The authors of a
+    window are the ones with at least one paper in it.
+
+    The output paths are formatted with the network stats, and with {n}, the
+    number of the window.
+
+    The metrics of the `instruments` have a record for the edges of the years,
+    and then one record per window.
+    """
+    instruments = instruments or Instruments("json_to_network")
+    key = None
+    if cache and input_path:
+        params = {
+            "output_paths": [str(output_edgelist_path), str(output_authors_path)],
+            "strategy": weigth_strategy.value,
+            "window": width,
+            "sliding": sliding,
+            "max_authors": max_authors,
+            "large_paper_policy": large_paper_policy.value,
+            "format": format.value,
+        }
+        key = cache_key(
+            "json_to_network_windowed",
+            params,
+            inputs=[input_path],
+            code=(main, open_digest_reader),
+        )
+        if (info := cache.restore(key)) is not None:
+            for stats in info["windows"]:
+                print(stats)
+            return None
+
+    with instruments.stage("build_years") as stage, open_digest_reader(
+        input_path
+    ) as reader:
+        authors = list(reader.authors())
+
+        # All years share the same author codes, so that their edges line up
+        index: dict[str, int] = {}
+        ids: list[str] = []
+        builders: dict[int, EdgeBuilder] = {}
+        year_authors: dict[int, set[str]] = {}
+        for paper in moderate_large_papers(
+            counted(reader.papers(), stage, "papers"), max_authors, large_paper_policy
+        ):
+            year = paper_year(paper["year"])
+            if year is None:
+                continue
+            if year not in builders:
+                builders[year] = EdgeBuilder(weigth_strategy, index, ids)
+                year_authors[year] = set()
+            builders[year].add_paper(paper["authors"], paper.get("size"))
+            year_authors[year].update(paper["authors"])
+
+        totals = {year: builder.totals() for year, builder in builders.items()}
+        del builders
+        stage.count(authors=len(authors), years=len(totals))
+    instruments.flush()
+
+    edges = SlidingEdges(weigth_strategy, ids)
+    current: list[int] = []
+    all_paths = []
+    all_stats = []
+    for i, years in enumerate(year_windows(totals, width, sliding)):
+        with instruments.stage("slide") as stage:
+            for year in current:
+                if year not in years:
+                    edges.subtract(totals[year])
+            for year in years:
+                if year not in current:
+                    edges.add(totals[year])
+            current = years
+
+            window_authors = set().union(*(year_authors[x] for x in years))
+            authors_list = make_authorlist(
+                x for x in authors if x["id"] in window_authors
+            )
+            table = edges.build()
+            stage.count(nodes=len(authors_list), edges=len(table))
+
+        stats = JsonStats(
+            minyear=int(min(years)),
+            maxyear=int(max(years)),
+            numedges=len(table),
+            numnodes=len(authors_list),
+        )
+        print(stats.__dict__)
+
+        with instruments.stage("write") as stage:
+            all_paths += write_network(
+                Network(stats, table, authors_list, []),
+                output_edgelist_path,
+                output_authors_path,
+                fields={"n": i + 1},
+                format=format,
+            )
+            stage.count(edges=len(table))
+        all_stats.append(stats.__dict__)
+        instruments.flush(n=i + 1, minyear=stats.minyear, maxyear=stats.maxyear)
+
+    if key:
+        cache.store(key, all_paths, info={"windows": all_stats})
+
+    return None
+
+
+def cli(argv: Optional[list[str]] = None) -> None:
+    """Run the script with these command line arguments (or sys.argv)"""
     import argparse
 
     parser = argparse.ArgumentParser()
@@ -128,14 +948,115 @@ if __name__ == "__main__":
     parser.add_argument(
         "--input_file", help="Input file to process", type=Path, default=None
     )
+    parser.add_argument(
+        "--projection",
+        help="Compute the edges as a sparse paper x author projection",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--max_authors",
+        help="Papers with more authors than this are handled by --large_papers",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--large_papers",
+        help="What to do with papers with more than --max_authors authors",
+        choices=[x.value for x in LargePaperPolicy],
+        default="keep",
+    )
+    parser.add_argument(
+        "--output_hyperedges",
+        help="Output file for the papers kept as hyperedges (paper, author, weight)",
+        type=Path,
+        default=None,
+    )
+    parser.add_argument(
+        "--window",
+        help=(
+            "If given, make one network per window of this many years, with "
+            "{n} the number of the window in the output paths"
+        ),
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--sliding",
+        action="store_true",
+        help="If specified, makes the window a sliding window",
+    )
+    parser.add_argument(
+        "--edgelist_format",
+        help=(
+            "Format of the edgelist. With 'npy', the edges are a numpy array that "
+            "can be memory-mapped, and the node IDs are in a .ids.csv file next "
+            "to it"
+        ),
+        choices=[x.value for x in EdgelistFormat],
+        default="csv",
+    )
+    parser.add_argument(
+        "--level",
+        help=(
+            "Make the network of the authors, or of their departments. With "
+            "'department', the edgelist has the summed weights between and "
+            "within departments, and the departments are written instead of "
+            "the authors. It needs linear or paper_size_moderated weights"
+        ),
+        choices=[x.value for x in NetworkLevel],
+        default="author",
+    )
+    add_cache_arguments(parser)
+    add_instrumentation_arguments(parser)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
-    input_stream = args.input_file.open("r") if args.input_file else sys.stdin
+    if args.large_papers == "hyperedge":
+        # The hyperedges would be silently dropped otherwise
+        if args.output_hyperedges is None or args.window is not None:
+            parser.error(
+                "--large_papers hyperedge needs --output_hyperedges, "
+                "and can't be used with --window"
+            )
 
-    main(
-        input_stream,
-        output_edgelist_path=args.output_edgelist,
-        output_authors_path=args.output_authors,
-        weigth_strategy=WeightStrategy(args.weight_strategy),
-    )
+    if args.level == "department":
+        if args.weight_strategy == "unweighted":
+            parser.error("--level department needs weights")
+        if args.window is not None or args.edgelist_format != "csv":
+            parser.error("--level department can't be used with --window or npy")
+
+    if args.window is not None:
+        if args.projection or args.output_hyperedges:
+            parser.error("--window can't be used with --projection or hyperedges")
+        main_windowed(
+            args.input_file,
+            output_edgelist_path=args.output_edgelist,
+            output_authors_path=args.output_authors,
+            weigth_strategy=WeightStrategy(args.weight_strategy),
+            width=args.window,
+            sliding=args.sliding,
+            max_authors=args.max_authors,
+            large_paper_policy=LargePaperPolicy(args.large_papers),
+            cache=cache_from_args(args),
+            format=EdgelistFormat(args.edgelist_format),
+            instruments=instruments_from_args(args, "json_to_network"),
+        )
+    else:
+        main(
+            args.input_file,
+            output_edgelist_path=args.output_edgelist,
+            output_authors_path=args.output_authors,
+            weigth_strategy=WeightStrategy(args.weight_strategy),
+            projection=args.projection,
+            max_authors=args.max_authors,
+            large_paper_policy=LargePaperPolicy(args.large_papers),
+            output_hyperedges_path=args.output_hyperedges,
+            cache=cache_from_args(args),
+            format=EdgelistFormat(args.edgelist_format),
+            instruments=instruments_from_args(args, "json_to_network"),
+            level=NetworkLevel(args.level),
+        )
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,50 @@
+"""Import the heavy modules (numpy, pandas, scipy, ...) only when used.
+
+Most runs of the scripts only need some of them: filtering a JSON digest
+needs no numpy, and a run that is restored from the cache needs nothing at
+all. So they are imported as
+
+    np = lazy_import("numpy")
+
+and `np` stands in for the module until an attribute is looked up, which
+imports it. After that, lookups go straight to the module's attributes.
+
+`preload` imports all the lazy modules at once, for the processes that run
+many jobs and would rather pay for the imports only once (see `serve.py`).
+"""
+
+from types import ModuleType
+import importlib
+
+_lazy_modules: dict[str, "LazyModule"] = {}
+
+
+class LazyModule:
+    """A stand-in for a module, that imports it on first use"""
+
+    def __init__(self, name: str) -> None:
+        self.__name = name
+
+    def _load(self) -> ModuleType:
+        module = importlib.import_module(self.__name)
+        # Copy the module's attributes over, so __getattr__ is not called
+        # again for them
+        self.__dict__.update(vars(module))
+        return module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self) -> str:
+        return f"<lazy module '{self.__name}'>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    """Import a module by name, lazily. The same name gives the same stand-in"""
+    return _lazy_modules.setdefault(name, LazyModule(name))
+
+
+def preload() -> None:
+    """Import all the lazy modules now"""
+    for module in list(_lazy_modules.values()):
+        module._load()
@@ -0,0 +1,414 @@
+#!/usr/bin/env python
+
+"""Run the whole preparsing in one go: from the IRIS tables to the edgelists.
+
+This does what `iris_to_json.py`, `filter_json.py` and `json_to_network.py`
+do when chained together, for every window of years, but the records are
+passed along in memory instead of being written to JSON and parsed back in.
+"""
+from pathlib import Path
+from typing import Callable, Optional
+import json
+import logging
+import sys
+
+from cache import ResultCache, add_cache_arguments, cache_from_args, cache_key
+from digest import DigestFormat
+from filter_json import DEFAULT_FILTERS, PAPER_FILTERS, filter_records
+from instrumentation import (
+    Instruments,
+    add_instrumentation_arguments,
+    counted,
+    instruments_from_args,
+)
+from iris_to_json import (
+    DIGEST_CODE,
+    digest_records,
+    format_window_path,
+    parse_windows,
+    plan_windows,
+    write_digest,
+)
+from json_to_network import (
+    EdgelistFormat,
+    LargePaperPolicy,
+    WeightStrategy,
+    build_network,
+    write_network,
+)
+from lazy import lazy_import
+from pseudonyms import SECRET_ENV_VAR, make_pseudonyms
+
+# The python analysis lives with the R one
+sys.path.append(str(Path(__file__).parent.parent / "network_analysis"))
+
+# It needs pandas and scipy, and it's only used with --analysis_dir
+graph_analysis = lazy_import("graph_analysis")
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+def main(
+    metadata: dict,
+    width: int,
+    sliding: bool,
+    output_edgelist_path: Path,
+    output_authors_path: Path,
+    weigth_strategy: WeightStrategy,
+    filters: dict = DEFAULT_FILTERS,
+    drop_orphans: bool = False,
+    projection: bool = False,
+    max_authors: Optional[int] = None,
+    large_paper_policy: LargePaperPolicy = LargePaperPolicy.KEEP,
+    output_hyperedges_path: Optional[Path] = None,
+    digest_pattern: Optional[str] = None,
+    digest_format: DigestFormat = DigestFormat.JSONL,
+    engine: str = "c",
+    compact: bool = False,
+    fuzzy_threshold: Optional[float] = None,
+    jobs: int = 1,
+    pseudonym: Optional[Callable[[str], str]] = None,
+    cache: Optional[ResultCache] = None,
+    analysis_dir: Optional[Path] = None,
+    edgelist_format: EdgelistFormat = EdgelistFormat.CSV,
+    instruments: Optional[Instruments] = None,
+) -> None:
+    """Make the networks of all windows of years.
+
+    The output paths are formatted with {n}, the number of the window, and
+    with the stats of the network, like in `json_to_network.py`.
+
+    If `digest_pattern` is given, the (unfiltered) digest of each window is
+    also written there, like `iris_to_json.py --output_pattern` would.
+
+    If `analysis_dir` is given, the networks are also analysed there with
+    `graph_analysis.py`, straight from the edges in memory.
+
+    With a `cache`, only the windows that are not in it are made.
+
+    The metrics of the `instruments` have one record per window that is made.
+    """
+    instruments = instruments or Instruments("pipeline")
+    keys = {}
+    todo = None
+    fingerprint = getattr(pseudonym, "fingerprint", None)
+    if cache and not (pseudonym and not fingerprint):
+        todo = set()
+        # The engine, compact reading and jobs don't change the output
+        params = {
+            "output_paths": [
+                str(output_edgelist_path),
+                str(output_authors_path),
+                str(output_hyperedges_path),
+            ],
+            "strategy": weigth_strategy.value,
+            "filters": filters,
+            "drop_orphans": drop_orphans,
+            "projection": projection,
+            "max_authors": max_authors,
+            "large_paper_policy": large_paper_policy.value,
+            "digest_pattern": digest_pattern,
+            "digest_format": digest_format.value,
+            "fuzzy_threshold": fuzzy_threshold,
+            "pseudonym": fingerprint,
+            "edgelist_format": edgelist_format.value,
+        }
+        code = (*DIGEST_CODE, filter_records, build_network, main)
+        if analysis_dir:
+            # Looking up analyse_network imports graph_analysis (and with it
+            # pandas and scipy), so only do it if we need it
+            params["analysis_dir"] = str(analysis_dir)
+            code = (*code, graph_analysis.analyse_network)
+        for window in plan_windows(metadata, width, sliding):
+            keys[window.n] = cache_key(
+                "pipeline",
+                {**params, "n": window.n},
+                inputs=window.files,
+                code=code,
+            )
+            if cache.restore(keys[window.n]) is None:
+                todo.add(window.n)
+
+    windows = parse_windows(
+        metadata,
+        width,
+        sliding,
+        engine=engine,
+        compact=compact,
+        fuzzy_threshold=fuzzy_threshold,
+        jobs=jobs,
+        only=todo,
+        instruments=instruments,
+    )
+    for window in windows:
+        paths = []
+        if digest_pattern:
+            digest_path = format_window_path(digest_pattern, window)
+            log.info(f"Writing the digest of window {window.n} to {digest_path}")
+            with instruments.stage("write_digest"):
+                write_digest(
+                    window.gobbler, window.papers, digest_path, digest_format, pseudonym
+                )
+            paths.append(digest_path)
+
+        # The records are streamed from the filters into the edges, so
+        # filtering them is part of building the network
+        with instruments.stage("filter_and_build") as stage:
+            authors, papers = digest_records(window.gobbler, window.papers, pseudonym)
+            authors, papers = filter_records(
+                authors, counted(papers, stage, "papers_in"), filters, drop_orphans
+            )
+            if analysis_dir:
+                # We need the departments later, and the authors are few
+                authors = list(authors)
+            network = build_network(
+                authors,
+                counted(papers, stage, "papers_out"),
+                weigth_strategy,
+                projection=projection,
+                max_authors=max_authors,
+                large_paper_policy=large_paper_policy,
+            )
+            stage.count(nodes=network.stats.numnodes, edges=network.stats.numedges)
+        log.info(f"Window {window.n}: {network.stats.__dict__}")
+
+        with instruments.stage("write") as stage:
+            paths += write_network(
+                network,
+                output_edgelist_path,
+                output_authors_path,
+                output_hyperedges_path,
+                fields={"n": window.n},
+                format=edgelist_format,
+            )
+            stage.count(edges=network.stats.numedges)
+
+        if analysis_dir:
+            prefix = f"{network.stats.minyear}-{network.stats.maxyear}"
+            log.info(f"Analysing window {window.n} in {analysis_dir}/{prefix}")
+            with instruments.stage("analyse"):
+                graph = graph_analysis.graph_from_edges(
+                    network.edges.ids,
+                    network.edges.source,
+                    network.edges.sink,
+                    network.edges.weight,
+                    {x["id"]: x["department"] for x in authors},
+                )
+                graph_analysis.analyse_network(graph, analysis_dir, prefix)
+            paths.append(Path(analysis_dir) / prefix / "data")
+
+        if keys:
+            cache.store(keys[window.n], paths)
+
+        instruments.flush(n=window.n, minyear=window.minyear, maxyear=window.maxyear)
+
+    return None
+
+
+def cli(argv: Optional[list[str]] = None) -> None:
+    """Run the script with these command line arguments (or sys.argv)"""
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "output_edgelist",
+        help="Output network edgelist, formatted with {n}, {minyear}, {maxyear}",
+    )
+    parser.add_argument(
+        "output_authors",
+        help="Output author list, formatted with {n}, {minyear}, {maxyear}",
+    )
+    parser.add_argument(
+        "--metadata",
+        help="Metadata file with the input files by year",
+        type=argparse.FileType("r"),
+        required=True,
+    )
+    parser.add_argument(
+        "--window", help="Size of the windows, in files", type=int, required=True
+    )
+    parser.add_argument(
+        "--sliding",
+        action="store_true",
+        help="If specified, makes the window a sliding window",
+    )
+    parser.add_argument(
+        "--weight_strategy",
+        help="How should weights be calculated?",
+        choices=[x.value for x in WeightStrategy],
+        default="unweighted",
+    )
+    for name, filter in PAPER_FILTERS.items():
+        parser.add_argument(
+            f"--{name}",
+            help=filter.help,
+            type=filter.type,
+            nargs=filter.nargs,
+            default=DEFAULT_FILTERS.get(name),
+        )
+    parser.add_argument(
+        "--drop_orphan_authors",
+        action="store_true",
+        help="Also drop the authors that are left without any paper",
+    )
+    parser.add_argument(
+        "--projection",
+        help="Compute the edges as a sparse paper x author projection",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--large_paper_size",
+        help=(
+            "Papers with more authors than this are handled by --large_papers "
+            "(like --max_authors of json_to_network.py)"
+        ),
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--large_papers",
+        help="What to do with papers with more than --large_paper_size authors",
+        choices=[x.value for x in LargePaperPolicy],
+        default="keep",
+    )
+    parser.add_argument(
+        "--output_hyperedges",
+        help="Output file for the papers kept as hyperedges (paper, author, weight)",
+        default=None,
+    )
+    parser.add_argument(
+        "--edgelist_format",
+        help="Format of the edgelists, like in json_to_network.py",
+        choices=[x.value for x in EdgelistFormat],
+        default="csv",
+    )
+    parser.add_argument(
+        "--digest_pattern",
+        help=(
+            "If given, also write the digest of each window here. {n} is the "
+            "window number, {minyear} and {maxyear} are the years of the window"
+        ),
+        default=None,
+    )
+    parser.add_argument(
+        "--digest_format",
+        help="Format of the digests written with --digest_pattern",
+        choices=[x.value for x in DigestFormat],
+        default="jsonl",
+    )
+    parser.add_argument(
+        "--csv_engine",
+        help="Pandas engine to read the IRIS files with",
+        choices=["c", "pyarrow"],
+        default="c",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Only load the columns that are used, with compact types",
+    )
+    parser.add_argument(
+        "--fuzzy_threshold",
+        help=(
+            "If given, authors without a CRIS ID are matched to similar authors "
+            "with at least this similarity (0 to 1), instead of being dropped"
+        ),
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of processes to parse the input files with",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--anonymize",
+        action="store_true",
+        help="Replace the author IDs with pseudonyms, like anonimize_CRIS.py",
+    )
+    parser.add_argument(
+        "--secret_file",
+        type=Path,
+        default=None,
+        help=(
+            "File with a secret key, to make stable pseudonyms with --anonymize. "
+            f"Defaults to the {SECRET_ENV_VAR} environment variable. If neither "
+            "is given, the pseudonyms are random."
+        ),
+    )
+    parser.add_argument(
+        "--analysis_dir",
+        help="If given, also analyse the networks with graph_analysis.py, here",
+        type=Path,
+        default=None,
+    )
+    add_cache_arguments(parser)
+    add_instrumentation_arguments(parser)
+    parser.add_argument(
+        "-v", "--verbose", action="count", default=0, help="Increase verbosity"
+    )
+
+    args = parser.parse_args(argv)
+
+    with args.metadata:
+        metadata = json.load(args.metadata)
+
+    if args.large_papers == "hyperedge" and args.output_hyperedges is None:
+        parser.error("--large_papers hyperedge needs --output_hyperedges")
+
+    verbosity_levels = {
+        0: logging.WARNING,
+        1: logging.INFO,
+        2: logging.DEBUG,
+    }
+
+    for i, level in verbosity_levels.items():
+        if args.verbose >= i:
+            for name in (
+                __name__,
+                "iris_to_json",
+                "filter_json",
+                "cache",
+                "graph_analysis",
+            ):
+                logging.getLogger(name).setLevel(level)
+
+    filters = {
+        name: getattr(args, name)
+        for name in PAPER_FILTERS
+        if getattr(args, name) is not None
+    }
+
+    main(
+        metadata,
+        width=args.window,
+        sliding=args.sliding,
+        output_edgelist_path=args.output_edgelist,
+        output_authors_path=args.output_authors,
+        weigth_strategy=WeightStrategy(args.weight_strategy),
+        filters=filters,
+        drop_orphans=args.drop_orphan_authors,
+        projection=args.projection,
+        max_authors=args.large_paper_size,
+        large_paper_policy=LargePaperPolicy(args.large_papers),
+        output_hyperedges_path=args.output_hyperedges,
+        digest_pattern=args.digest_pattern,
+        digest_format=DigestFormat(args.digest_format),
+        engine=args.csv_engine,
+        compact=args.compact,
+        fuzzy_threshold=args.fuzzy_threshold,
+        jobs=args.jobs,
+        pseudonym=make_pseudonyms(args.secret_file) if args.anonymize else None,
+        cache=cache_from_args(args),
+        analysis_dir=args.analysis_dir,
+        edgelist_format=EdgelistFormat(args.edgelist_format),
+        instruments=instruments_from_args(args, "pipeline"),
+    )
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,71 @@
+"""Replace author IDs with pseudonyms, to anonymize the digests.
+
+There are two ways to make pseudonyms:
+    - At random (`RandomPseudonyms`): each ID gets a new random UUID. We have
+      to remember all of them, and they change from one run to the next;
+    - With a secret key (`KeyedPseudonyms`): each ID gets the HMAC of the ID
+      with the key, formatted as a UUID. They are the same in every run with
+      the same key, and we don't have to remember anything. Without the
+      key, the pseudonyms can't be linked back to the IDs.
+"""
+
+import hashlib
+import hmac
+import os
+from pathlib import Path
+from typing import Optional, Union
+from uuid import UUID, uuid4
+
+# Environment variable with the secret key for the keyed pseudonyms
+SECRET_ENV_VAR = "ANONYMIZATION_SECRET"
+
+
+class RandomPseudonyms:
+    # Random pseudonyms are different every time, so results made with them
+    # can't be cached
+    fingerprint = None
+
+    def __init__(self) -> None:
+        self.pseudonyms: dict[str, str] = {}
+        self._used: set[str] = set()
+
+    def __call__(self, id: str) -> str:
+        if pseudonym := self.pseudonyms.get(id):
+            return pseudonym
+
+        pseudonym = str(uuid4())
+        while pseudonym in self._used:
+            pseudonym = str(uuid4())
+        self._used.add(pseudonym)
+        self.pseudonyms[id] = pseudonym
+
+        return pseudonym
+
+
+class KeyedPseudonyms:
+    def __init__(self, secret: bytes) -> None:
+        if not secret:
+            raise ValueError("The secret key for pseudonyms can't be empty")
+        self.secret = secret
+        # This tells keys apart (e.g. for caching) without giving them away
+        self.fingerprint = self("fingerprint")
+
+    def __call__(self, id: str) -> str:
+        digest = hmac.new(self.secret, str(id).encode("utf-8"), hashlib.sha256)
+        return str(UUID(bytes=digest.digest()[:16], version=4))
+
+
+def make_pseudonyms(
+    secret_file: Optional[Path] = None,
+) -> Union[RandomPseudonyms, KeyedPseudonyms]:
+    """Make keyed pseudonyms if we have a secret key, random ones otherwise.
+
+    The key is read from `secret_file`, or else from the environment variable
+    in SECRET_ENV_VAR. We don't take it from the command line, since that
+    ends up in the shell history and in the process list.
+    """
+    if secret_file:
+        return KeyedPseudonyms(Path(secret_file).read_bytes().strip())
+    if secret := os.environ.get(SECRET_ENV_VAR):
+        return KeyedPseudonyms(secret.encode("utf-8"))
+    return RandomPseudonyms()
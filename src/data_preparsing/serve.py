@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+"""Run many jobs of the preparsing scripts in the same (warm) processes.
+
+Starting the scripts is slow: the interpreter starts, and numpy, pandas and
+scipy are imported again for every job. Instead of starting a script for
+every job, e.g. with GNU parallel, write the jobs one per line, as they would
+be given on the command line, and pipe them in here:
+
+    parallel --dry-run ./src/data_preparsing/json_to_network.py \\
+        --input_file {} ... ::: data/years/*.jsonl \\
+        | ./src/data_preparsing/serve.py -j 4
+
+Each line is a script (by name or path) followed by its arguments. Empty
+lines and lines starting with # are skipped. The scripts and the modules
+they need are imported once, before the jobs start, and every job runs the
+`cli` of its script in one of the worker processes.
+
+The jobs share the standard output, so they should write to files. The
+standard input is where the jobs come from, so they get an empty one
+instead: give them their inputs as files too.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from time import perf_counter
+from typing import Iterable, TextIO
+import importlib
+import logging
+import os
+import shlex
+import sys
+
+# anonimize_CRIS.py lives one folder up
+sys.path.append(str(Path(__file__).parent.parent))
+
+import lazy
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+SCRIPTS = (
+    "anonimize_CRIS",
+    "digest_index",
+    "filter_json",
+    "group_files",
+    "iris_to_json",
+    "json_to_network",
+    "pipeline",
+    "temporal_edges",
+)
+
+
+def parse_job(line: str) -> tuple[str, list[str]]:
+    """Split a job line in the script name and its arguments"""
+    words = shlex.split(line)
+    script = Path(words[0]).stem
+    if script not in SCRIPTS:
+        raise ValueError(f"Unknown script {words[0]}, expected one of {SCRIPTS}")
+    return script, words[1:]
+
+
+def preload(scripts: Iterable[str] = SCRIPTS) -> None:
+    """Import the scripts, and all the heavy modules that they use"""
+    for script in scripts:
+        importlib.import_module(script)
+    lazy.preload()
+
+
+def run_job(line: str) -> int:
+    """Run the job of a line. Returns its exit status"""
+    try:
+        script, argv = parse_job(line)
+    except ValueError as e:
+        log.error(e)
+        return 2
+
+    # Jobs that would read stdin would eat the jobs that come after them
+    stdin, sys.stdin = sys.stdin, open(os.devnull, "r")
+    try:
+        importlib.import_module(script).cli(argv)
+    except SystemExit as e:
+        # argparse exits on bad arguments, and so may the scripts
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        log.error(e.code)
+        return 1
+    except Exception:
+        log.exception(f"Job failed: {line}")
+        return 1
+    finally:
+        sys.stdin.close()
+        sys.stdin = stdin
+    return 0
+
+
+def main(jobs_stream: TextIO, jobs: int = 1) -> int:
+    """Run the jobs in the stream, as they come. Returns 1 if any failed"""
+    preload()
+    start = perf_counter()
+    failed = 0
+
+    def report(n: int, line: str, status: int) -> None:
+        nonlocal failed
+        if status:
+            failed += 1
+            log.error(f"Job {n} exited with status {status}: {line}")
+        else:
+            log.info(f"Job {n} done: {line}")
+
+    lines = ((n, x.strip()) for n, x in enumerate(jobs_stream, start=1))
+    lines = ((n, x) for n, x in lines if x and not x.startswith("#"))
+
+    if jobs == 1:
+        for n, line in lines:
+            report(n, line, run_job(line))
+    else:
+        # The workers are forked after the preload, so they start warm
+        with ProcessPoolExecutor(jobs, initializer=preload) as pool:
+            futures = [(n, line, pool.submit(run_job, line)) for n, line in lines]
+            for n, line, future in futures:
+                report(n, line, future.result())
+
+    log.info(f"Ran the jobs in {perf_counter() - start:.2f}s, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "jobs_file",
+        help="File with one job per line. Defaults to stdin",
+        type=argparse.FileType("r"),
+        nargs="?",
+        default=sys.stdin,
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of jobs to run at the same time",
+        type=int,
+        default=1,
+    )
+
+    args = parser.parse_args()
+
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    sys.exit(main(args.jobs_file, args.jobs))
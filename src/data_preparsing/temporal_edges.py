@@ -0,0 +1,410 @@
+#!/usr/bin/env python
+
+"""Store the co-authorship edges of every year once, and query any years.
+
+Instead of making one edgelist per window of years, the edges of each year
+are built once from the digest and saved in a folder of .npy files:
+    - `years.npy` and `year_offsets.npy`: the years, and where the edges of
+      each year start in the other arrays;
+    - `keys.npy`: the (author << 32 | author) keys of the edges, sorted
+      within each year;
+    - `weights.npy` and `counts.npy`: the summed paper-size-moderated
+      weights and the number of papers of each edge in each year;
+    - `author_year_offsets.npy` and `author_rows.npy`: the authors with at
+      least one paper in each year, as rows in the author list;
+    - `ids.*` and `authors.*` string columns (see `digest.py`): the ID of
+      each author code in the keys, and the author list lines;
+    - `meta.json`, with how the large papers were handled.
+
+The edges of any range of years are then the sum of a contiguous slice of
+the arrays, so a query costs as much as the edges of the years it covers.
+Edges can also be weighted with an exponential decay in time, so that the
+older papers count less.
+
+    python temporal_edges.py build --input_file digest.jsonl data/temporal
+    python temporal_edges.py query data/temporal --years 2012-2014 \
+        --weight_strategy linear edges.csv authors.csv
+    python temporal_edges.py query data/temporal --window 3 --sliding \
+        edgelist_{minyear}-{maxyear}.csv authors_{minyear}-{maxyear}.csv
+
+The edges are sorted by author code, not by order of first appearance like
+in `json_to_network.py`, and the moderated weights can differ from it in the
+last digit, since they are summed in a different order.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Iterable, Optional
+import json
+import logging
+
+from digest import StringColumn, _save_strings, open_digest_reader, paper_year
+from group_files import parse_slice
+from json_to_network import (
+    EdgeBuilder,
+    EdgelistFormat,
+    EdgeTable,
+    JsonStats,
+    LargePaperPolicy,
+    Network,
+    WeightStrategy,
+    make_authorlist,
+    make_edge_table,
+    moderate_large_papers,
+    write_network,
+    year_windows,
+)
+from lazy import lazy_import
+
+np = lazy_import("numpy")
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+STORE_VERSION = 1
+
+
+def build_store(
+    authors: Iterable[dict],
+    papers: Iterable[dict],
+    folder: Path,
+    max_authors: Optional[int] = None,
+    large_paper_policy: LargePaperPolicy = LargePaperPolicy.KEEP,
+) -> None:
+    """Build the edges of each year of the papers, and save them in `folder`"""
+    folder = Path(folder)
+    authors = list(authors)
+
+    # All years share the same author codes, so that their edges line up
+    index: dict[str, int] = {}
+    ids: list[str] = []
+    builders: dict[int, EdgeBuilder] = {}
+    year_authors: dict[int, set[str]] = {}
+    for paper in moderate_large_papers(papers, max_authors, large_paper_policy):
+        year = paper_year(paper["year"])
+        if year is None:
+            continue
+        if year not in builders:
+            builders[year] = EdgeBuilder(
+                WeightStrategy.PAPER_SIZE_MODERATED, index, ids
+            )
+            year_authors[year] = set()
+        builders[year].add_paper(paper["authors"], paper.get("size"))
+        year_authors[year].update(paper["authors"])
+
+    years = sorted(builders)
+    keys, weights, counts = [], [], []
+    for year in years:
+        totals = builders.pop(year).totals()
+        order = np.argsort(totals.keys)
+        keys.append(totals.keys[order])
+        weights.append(totals.weights[order])
+        counts.append(totals.counts[order])
+
+    rows = {x["id"]: i for i, x in enumerate(authors)}
+    author_rows = [
+        np.array(sorted(rows[x] for x in year_authors[year] if x in rows), np.int64)
+        for year in years
+    ]
+
+    def offsets(arrays: list) -> np.ndarray:
+        result = np.zeros(len(arrays) + 1, dtype=np.int64)
+        np.cumsum([len(x) for x in arrays], out=result[1:])
+        return result
+
+    def concatenate(arrays: list, dtype) -> np.ndarray:
+        return np.concatenate(arrays).astype(dtype) if arrays else np.empty(0, dtype)
+
+    folder.mkdir(parents=True, exist_ok=True)
+    np.save(folder / "years.npy", np.array(years, dtype=np.int64))
+    np.save(folder / "year_offsets.npy", offsets(keys))
+    np.save(folder / "keys.npy", concatenate(keys, np.int64))
+    np.save(folder / "weights.npy", concatenate(weights, np.float64))
+    np.save(folder / "counts.npy", concatenate(counts, np.int64))
+    np.save(folder / "author_year_offsets.npy", offsets(author_rows))
+    np.save(folder / "author_rows.npy", concatenate(author_rows, np.int64))
+    _save_strings(folder, "ids", ids)
+    _save_strings(folder, "authors", make_authorlist(authors))
+
+    with (folder / "meta.json").open("w+") as stream:
+        json.dump(
+            {
+                "version": STORE_VERSION,
+                "max_authors": max_authors,
+                "large_paper_policy": large_paper_policy.value,
+            },
+            stream,
+            indent=4,
+        )
+
+    log.info(f"Stored {len(ids)} authors and {len(years)} years in {folder}")
+
+
+def decay_factors(
+    years: np.ndarray, half_life: float, reference_year: int
+) -> np.ndarray:
+    """How much the papers of each year count, halving every `half_life` years
+    before the reference year"""
+    return 0.5 ** ((reference_year - years) / half_life)
+
+
+class TemporalEdges:
+    """A (memory-mapped) store of the edges of each year"""
+
+    def __init__(self, folder: Path) -> None:
+        self.folder = Path(folder)
+        with (self.folder / "meta.json").open("r") as stream:
+            self.meta = json.load(stream)
+
+        if self.meta["version"] != STORE_VERSION:
+            raise ValueError(f"Unsupported store version {self.meta['version']}")
+
+        def load(name: str) -> np.ndarray:
+            return np.load(self.folder / f"{name}.npy", mmap_mode="r")
+
+        self.years = load("years")
+        self.year_offsets = load("year_offsets")
+        self.keys = load("keys")
+        self.weights = load("weights")
+        self.counts = load("counts")
+        self.author_year_offsets = load("author_year_offsets")
+        self.author_rows = load("author_rows")
+        self.ids = StringColumn(self.folder, "ids").tolist()
+        self.author_lines = StringColumn(self.folder, "authors")
+
+    def _year_range(self, start: Optional[int], end: Optional[int]) -> tuple:
+        """The first and last (excluded) index of the years from start to end"""
+        first = 0 if start is None else np.searchsorted(self.years, start, "left")
+        last = (
+            len(self.years)
+            if end is None
+            else np.searchsorted(self.years, end, "right")
+        )
+        return int(first), int(max(first, last))
+
+    def edges(
+        self,
+        strategy: WeightStrategy,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        half_life: Optional[float] = None,
+        reference_year: Optional[int] = None,
+    ) -> EdgeTable:
+        """The edges of the papers from `start` to `end`, both inclusive.
+
+        With a `half_life`, the weights of each year are multiplied by their
+        `decay_factors`. The reference year defaults to the last year.
+        """
+        first, last = self._year_range(start, end)
+        lo, hi = self.year_offsets[first], self.year_offsets[last]
+        keys = self.keys[lo:hi]
+        weights = np.asarray(self.weights[lo:hi])
+        counts = np.asarray(self.counts[lo:hi])
+
+        if half_life is not None:
+            if strategy == WeightStrategy.UNWEIGTHED:
+                raise ValueError("Unweighted edges can't be decayed")
+            if reference_year is None:
+                reference_year = int(self.years[last - 1]) if last > first else 0
+            factors = np.repeat(
+                decay_factors(self.years[first:last], half_life, reference_year),
+                np.diff(self.year_offsets[first : last + 1]),
+            )
+            weights = weights * factors
+            counts = counts * factors
+
+        unique, inverse = np.unique(keys, return_inverse=True)
+        summed_weights = np.bincount(inverse, weights=weights, minlength=len(unique))
+        summed_counts = np.bincount(inverse, weights=counts, minlength=len(unique))
+        if half_life is None:
+            # Counts are small integers, so the float sums are exact
+            summed_counts = np.rint(summed_counts).astype(np.int64)
+
+        return make_edge_table(
+            strategy, self.ids, unique, summed_weights, summed_counts
+        )
+
+    def authors(
+        self, start: Optional[int] = None, end: Optional[int] = None
+    ) -> list[str]:
+        """The author list lines of the authors with papers in these years"""
+        first, last = self._year_range(start, end)
+        rows = self.author_rows[
+            self.author_year_offsets[first] : self.author_year_offsets[last]
+        ]
+        return [self.author_lines[i] for i in np.unique(rows)]
+
+    def network(
+        self,
+        strategy: WeightStrategy,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        half_life: Optional[float] = None,
+        reference_year: Optional[int] = None,
+    ) -> Network:
+        """The network of the years from `start` to `end`, ready to be written"""
+        first, last = self._year_range(start, end)
+        if last == first:
+            raise ValueError(f"There are no papers from {start} to {end}")
+
+        edges = self.edges(strategy, start, end, half_life, reference_year)
+        authors = self.authors(start, end)
+        stats = JsonStats(
+            minyear=int(self.years[first]),
+            maxyear=int(self.years[last - 1]),
+            numnodes=len(authors),
+            numedges=len(edges),
+        )
+        return Network(stats, edges, authors, [])
+
+
+def query(
+    folder: Path,
+    output_edgelist_path: Path,
+    output_authors_path: Path,
+    strategy: WeightStrategy,
+    years: Optional[tuple[Optional[int], Optional[int]]] = None,
+    width: Optional[int] = None,
+    sliding: bool = False,
+    half_life: Optional[float] = None,
+    reference_year: Optional[int] = None,
+    format: EdgelistFormat = EdgelistFormat.CSV,
+) -> None:
+    """Write the network of a range of years, or of every window of years.
+
+    The output paths are formatted with the network stats, and with {n}, the
+    number of the window. Without a reference year, each window is decayed
+    from its own last year.
+    """
+    store = TemporalEdges(folder)
+    if width is None:
+        windows = [list(years or (None, None))]
+    else:
+        windows = [[min(x), max(x)] for x in year_windows(store.years, width, sliding)]
+
+    for i, (start, end) in enumerate(windows):
+        network = store.network(strategy, start, end, half_life, reference_year)
+        print(network.stats.__dict__)
+        write_network(
+            network,
+            output_edgelist_path,
+            output_authors_path,
+            fields={"n": i + 1},
+            format=format,
+        )
+
+
+def cli(argv: Optional[list[str]] = None) -> None:
+    """Run the script with these command line arguments (or sys.argv)"""
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    subparsers = parser.add_subparsers(
+        help="What to do with the store", required=True, dest="method"
+    )
+
+    parser_build = subparsers.add_parser(
+        "build", help="Build the store of the edges of each year of a digest"
+    )
+    parser_build.add_argument("store", help="Folder to save the store in", type=Path)
+    parser_build.add_argument(
+        "--input_file", help="Input digest to process", type=Path, default=None
+    )
+    parser_build.add_argument(
+        "--max_authors",
+        help="Papers with more authors than this are handled by --large_papers",
+        type=int,
+        default=None,
+    )
+    parser_build.add_argument(
+        "--large_papers",
+        help="What to do with papers with more than --max_authors authors",
+        choices=[x.value for x in LargePaperPolicy if x != LargePaperPolicy.HYPEREDGE],
+        default="keep",
+    )
+
+    parser_query = subparsers.add_parser(
+        "query", help="Write the network of some years from the store"
+    )
+    parser_query.add_argument("store", help="Folder of the store", type=Path)
+    parser_query.add_argument(
+        "output_edgelist",
+        help="Output network edgelist, formatted with {n}, {minyear}, {maxyear}",
+    )
+    parser_query.add_argument(
+        "output_authors",
+        help="Output author list, formatted with {n}, {minyear}, {maxyear}",
+    )
+    parser_query.add_argument(
+        "--weight_strategy",
+        help="How should weights be calculated?",
+        choices=[x.value for x in WeightStrategy],
+        default="unweighted",
+    )
+    parser_query.add_argument(
+        "--years", help="Years to query, e.g. 2012-2015. Use - as a separator."
+    )
+    parser_query.add_argument(
+        "--window",
+        help="Write one network per window of this many years",
+        type=int,
+        default=None,
+    )
+    parser_query.add_argument(
+        "--sliding",
+        action="store_true",
+        help="If specified, makes the window a sliding window",
+    )
+    parser_query.add_argument(
+        "--half_life",
+        help="Decay the weights of the papers, halving them every this many years",
+        type=float,
+        default=None,
+    )
+    parser_query.add_argument(
+        "--reference_year",
+        help="Year the decay is counted from. Defaults to the last year queried",
+        type=int,
+        default=None,
+    )
+    parser_query.add_argument(
+        "--edgelist_format",
+        help="Format of the edgelist, like in json_to_network.py",
+        choices=[x.value for x in EdgelistFormat],
+        default="csv",
+    )
+
+    args = parser.parse_args(argv)
+
+    match args.method:
+        case "build":
+            with open_digest_reader(args.input_file) as reader:
+                build_store(
+                    reader.authors(),
+                    reader.papers(),
+                    args.store,
+                    max_authors=args.max_authors,
+                    large_paper_policy=LargePaperPolicy(args.large_papers),
+                )
+        case "query":
+            if args.years is not None and args.window is not None:
+                parser.error("--years and --window cannot be used together")
+            if args.half_life is not None and args.weight_strategy == "unweighted":
+                parser.error("--half_life needs weights")
+            query(
+                args.store,
+                args.output_edgelist,
+                args.output_authors,
+                WeightStrategy(args.weight_strategy),
+                years=parse_slice(args.years) if args.years else None,
+                width=args.window,
+                sliding=args.sliding,
+                half_life=args.half_life,
+                reference_year=args.reference_year,
+                format=EdgelistFormat(args.edgelist_format),
+            )
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,883 @@
+#!/usr/bin/env python
+
+"""Network analysis of the author networks, in Python.
+
+This does what the R functions in `iris_network_analysis_functions.R` do for
+the numbers (not the plots), straight on the integer-indexed edges:
+    - `Graph` is the CSR adjacency, like `graph_from_edgelist` (simplified);
+    - `filter_graph` keeps some departments and the major component;
+    - `basic_statistics` and `degree_distribution`, like
+      `get_basic_statistics` and `plot_degree_distribution`;
+    - `louvain` finds communities (instead of spinglass, which is too slow);
+    - `community_purity` makes the same table as `get_community_purity`.
+
+Since a single run of the community detection depends on its seed, the
+communities can also be found by an ensemble of seeded runs, which are put
+together in consensus communities (`summarise_ensemble`), with confidence
+intervals on how much each department sticks together (`department_purity`).
+
+`analyse_network` runs all of them for a network, and writes the purity
+tables where `purity_overall_plot.R` looks for them. The pipeline can call
+it for every window, so the networks never go through CSV files.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Optional
+import json
+import logging
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse import csgraph
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+# Authors with no department are put in here, like in the R code
+UNKNOWN_DEPARTMENT = "unknown"
+
+# The departments of the sub-networks, from the analysis markdown.
+# The names are the ones that the purity files are saved with.
+SELECTED_DEPARTMENTS = {
+    "hard": [
+        "biotecnologie molecolari e scienze per la salute",
+        "chimica",
+        "fisica",
+        "informatica",
+        "matematica giuseppe peano",
+        "neuroscienze rita levi montalcini",
+        "oncologia",
+        "psicologia",
+        "scienza e tecnologia del farmaco",
+        "scienze cliniche e biologiche",
+        "scienze della vita e biologia dei sistemi",
+        "scienze mediche",
+    ],
+    "biological": [
+        "biotecnologie molecolari e scienze per la salute",
+        "centro interdipartimentale di ricerca per le biotecnologie molecolari - mbc",
+        "neuroscienze rita levi montalcini",
+        "oncologia",
+        "psicologia",
+        "scienze agrarie, forestali e alimentari",
+        "scienze cliniche e biologiche",
+        "scienze della terra",
+        "scienze della vita e biologia dei sistemi",
+        "scienze veterinarie",
+    ],
+}
+
+
+@dataclass
+class Graph:
+    """An undirected, simple, weighted graph.
+
+    `adjacency` is a symmetric CSR matrix with the edge weights, and
+    `departments` has the department of each node.
+    """
+
+    adjacency: sparse.csr_matrix
+    ids: np.ndarray
+    departments: np.ndarray
+
+    @property
+    def num_nodes(self) -> int:
+        return self.adjacency.shape[0]
+
+    @property
+    def num_edges(self) -> int:
+        return self.adjacency.nnz // 2
+
+    def degree(self) -> np.ndarray:
+        return np.diff(self.adjacency.indptr)
+
+    def subgraph(self, nodes: np.ndarray) -> "Graph":
+        """The graph induced by some nodes (an index or boolean mask)"""
+        return Graph(
+            adjacency=self.adjacency[nodes][:, nodes].tocsr(),
+            ids=self.ids[nodes],
+            departments=self.departments[nodes],
+        )
+
+
+def graph_from_edges(
+    ids: list[str],
+    source: np.ndarray,
+    sink: np.ndarray,
+    weight: np.ndarray,
+    departments: dict[str, Optional[str]],
+) -> Graph:
+    """Make a graph from an integer-indexed edgelist.
+
+    Like `igraph::graph_from_data_frame`, only the nodes with an edge are in
+    the graph. Like `igraph::simplify`, self edges are dropped.
+
+    The nodes are sorted by ID, so that the graph (and so the communities
+    found with a seed) does not depend on the order of the edges.
+    """
+    source = np.asarray(source, dtype=np.int64)
+    sink = np.asarray(sink, dtype=np.int64)
+    weight = np.asarray(weight, dtype=np.float64)
+
+    keep = source != sink
+    source, sink, weight = source[keep], sink[keep], weight[keep]
+
+    nodes = np.unique(np.concatenate([source, sink]))
+    nodes = nodes[np.argsort(np.array([ids[x] for x in nodes], dtype=object))]
+    codes = np.empty(max(len(ids), 1), dtype=np.int64)
+    codes[nodes] = np.arange(len(nodes))
+    source, sink = codes[source], codes[sink]
+
+    # Both orientations; duplicated edges (if any) are summed
+    adjacency = sparse.csr_matrix(
+        (
+            np.concatenate([weight, weight]),
+            (np.concatenate([source, sink]), np.concatenate([sink, source])),
+        ),
+        shape=(len(nodes), len(nodes)),
+    )
+    adjacency.sum_duplicates()
+
+    ids = np.array([ids[x] for x in nodes], dtype=object)
+    node_departments = np.array(
+        [departments.get(x) or UNKNOWN_DEPARTMENT for x in ids], dtype=object
+    )
+
+    return Graph(adjacency, ids, node_departments)
+
+
+def read_binary_edges(
+    edgelist_path: Path,
+) -> tuple[list[str], np.ndarray, np.ndarray, np.ndarray]:
+    """Read a binary (.npy) edgelist of `json_to_network.py`, memory-mapped.
+
+    Returns the node IDs, and the source, sink and weight of the edges.
+    """
+    edgelist_path = Path(edgelist_path)
+    edges = np.load(edgelist_path, mmap_mode="r")
+    ids = pd.read_csv(
+        edgelist_path.with_suffix(".ids.csv"), dtype=str, keep_default_na=False
+    )
+    return list(ids["id"]), edges["node_1"], edges["node_2"], edges["weight"]
+
+
+def read_graph(edgelist_path: Path, authors_path: Path) -> Graph:
+    """Read a graph from the .csv (or .npy) files of `json_to_network.py`"""
+    authors = pd.read_csv(
+        authors_path,
+        dtype=str,
+        keep_default_na=False,
+        na_values=["Null", "null", "na", "NA", "None", "none"],
+    )
+    departments = {
+        id: None if pd.isna(department) else department
+        for id, department in zip(authors["id"], authors["department"])
+    }
+
+    if Path(edgelist_path).suffix == ".npy":
+        return graph_from_edges(*read_binary_edges(edgelist_path), departments)
+
+    edgelist = pd.read_csv(edgelist_path, dtype={"node_1": str, "node_2": str})
+    codes, ids = pd.factorize(
+        pd.concat([edgelist["node_1"], edgelist["node_2"]], ignore_index=True)
+    )
+
+    return graph_from_edges(
+        list(ids),
+        codes[: len(edgelist)],
+        codes[len(edgelist) :],
+        edgelist["weight"].to_numpy(),
+        departments,
+    )
+
+
+def components(graph: Graph) -> np.ndarray:
+    """The component of each node"""
+    _, labels = csgraph.connected_components(graph.adjacency, directed=False)
+    return labels
+
+
+def filter_graph(
+    graph: Graph, departments: list[str], keep_only_major: bool = True
+) -> Graph:
+    """Keep only the nodes of some departments, and (optionally) the major
+    component of what is left"""
+    graph = graph.subgraph(np.isin(graph.departments, departments))
+
+    if keep_only_major and graph.num_nodes:
+        labels = components(graph)
+        largest = np.argmax(np.bincount(labels))
+        graph = graph.subgraph(labels == largest)
+
+    return graph
+
+
+def degree_distribution(graph: Graph) -> np.ndarray:
+    """The fraction of nodes with each degree, from zero up"""
+    counts = np.bincount(graph.degree())
+    return counts / max(graph.num_nodes, 1)
+
+
+def degree_assortativity(graph: Graph) -> Optional[float]:
+    """The correlation of the degrees at the two ends of the edges.
+
+    This is None if it's not defined (e.g. if all degrees are the same).
+    """
+    degree = graph.degree().astype(np.float64)
+    coo = graph.adjacency.tocoo()
+    # Both orientations are in the matrix, so this is already symmetric
+    x, y = degree[coo.row], degree[coo.col]
+    if len(x) == 0 or x.std() == 0:
+        return None
+    return float(np.corrcoef(x, y)[0, 1])
+
+
+def basic_statistics(graph: Graph) -> dict:
+    sizes = np.bincount(components(graph)) if graph.num_nodes else np.array([])
+    size_counts = np.unique(sizes, return_counts=True)
+    return {
+        "num_nodes": graph.num_nodes,
+        "num_edges": graph.num_edges,
+        "assortativity": degree_assortativity(graph),
+        "num_components": len(sizes),
+        "component_sizes": {int(size): int(count) for size, count in zip(*size_counts)},
+    }
+
+
+def modularity(
+    adjacency: sparse.csr_matrix, membership: np.ndarray, resolution: float = 1.0
+) -> float:
+    total = adjacency.sum()
+    if total == 0:
+        return 0.0
+    coo = adjacency.tocoo()
+    same = membership[coo.row] == membership[coo.col]
+    inside = np.bincount(membership[coo.row[same]], weights=coo.data[same])
+    strength = np.asarray(adjacency.sum(axis=1)).ravel()
+    totals = np.bincount(membership, weights=strength)
+    inside = np.pad(inside, (0, len(totals) - len(inside)))
+    return float(np.sum(inside / total - resolution * (totals / total) ** 2))
+
+
+def _move_nodes(
+    adjacency: sparse.csr_matrix, resolution: float, rng: np.random.Generator
+) -> np.ndarray:
+    """The local moving phase of Louvain: move each node to the neighbouring
+    community with the best modularity gain, until nothing moves.
+
+    Like in Leiden, after the first sweep we only look again at the
+    neighbours of the nodes that moved. Nodes have few neighbours, so plain
+    Python lists are faster here than lots of tiny numpy calls.
+    """
+    n = adjacency.shape[0]
+    indptr = adjacency.indptr.tolist()
+    indices = adjacency.indices.tolist()
+    data = adjacency.data.tolist()
+    strength = np.asarray(adjacency.sum(axis=1)).ravel().tolist()
+    scale = resolution / sum(strength)
+
+    membership = list(range(n))
+    totals = list(strength)
+
+    queue = deque(rng.permutation(n).tolist())
+    queued = [True] * n
+    while queue:
+        node = queue.popleft()
+        queued[node] = False
+
+        current = membership[node]
+        node_strength = strength[node]
+        totals[current] -= node_strength
+
+        links = {current: 0.0}
+        for i in range(indptr[node], indptr[node + 1]):
+            neighbour = indices[i]
+            if neighbour != node:
+                community = membership[neighbour]
+                links[community] = links.get(community, 0.0) + data[i]
+
+        best = current
+        best_gain = links[current] - scale * node_strength * totals[current]
+        for community, weight in links.items():
+            gain = weight - scale * node_strength * totals[community]
+            if gain > best_gain + 1e-12:
+                best, best_gain = community, gain
+
+        totals[best] += node_strength
+        if best == current:
+            continue
+
+        membership[node] = best
+        for i in range(indptr[node], indptr[node + 1]):
+            neighbour = indices[i]
+            if not queued[neighbour] and membership[neighbour] != best:
+                queued[neighbour] = True
+                queue.append(neighbour)
+
+    return np.unique(membership, return_inverse=True)[1]
+
+
+def louvain(
+    graph: Graph, resolution: float = 1.0, seed: Optional[int] = None
+) -> np.ndarray:
+    """Find communities with the Louvain method.
+
+    Returns the community of each node, numbered from zero by size.
+    """
+    rng = np.random.default_rng(seed)
+    adjacency = graph.adjacency
+    membership = np.arange(graph.num_nodes)
+
+    while adjacency.nnz:
+        communities = _move_nodes(adjacency, resolution, rng)
+        if communities.max(initial=-1) + 1 == adjacency.shape[0]:
+            break
+        membership = communities[membership]
+        # Each community becomes a node, with the internal weight on the
+        # diagonal, and we start over
+        merge = sparse.csr_matrix(
+            (np.ones(len(communities)), (np.arange(len(communities)), communities))
+        )
+        adjacency = (merge.T @ adjacency @ merge).tocsr()
+
+    # Number the communities by size, so that the output is stable
+    sizes = np.bincount(membership)
+    rank = np.empty(len(sizes), dtype=np.int64)
+    rank[np.argsort(-sizes, kind="stable")] = np.arange(len(sizes))
+    return rank[membership]
+
+
+def community_purity(graph: Graph, membership: np.ndarray) -> pd.DataFrame:
+    """How many authors of each department fall in each community.
+
+    The table has the 'community' (from 1), 'department' and 'n' columns, like
+    the one of `get_community_purity` in R.
+    """
+    table = pd.DataFrame({"community": membership + 1, "department": graph.departments})
+    return table.groupby(["community", "department"]).size().rename("n").reset_index()
+
+
+def ensemble_seeds(seed: Optional[int], runs: int) -> list[Optional[int]]:
+    """The seeds of the runs of an ensemble. The first one is `seed`, so an
+    ensemble of one run is the same as a single run"""
+    return [None if seed is None else seed + i for i in range(runs)]
+
+
+def coassignment_matrix(
+    adjacency: sparse.csr_matrix, memberships: list[np.ndarray]
+) -> sparse.csr_matrix:
+    """The fraction of runs in which the two ends of each edge are put in the
+    same community.
+
+    Only linked pairs are kept, so this has the same shape and nonzeros as the
+    adjacency: the full co-assignment matrix would be dense inside of each
+    community, and Louvain only ever puts linked nodes together anyway.
+    """
+    coo = adjacency.tocoo()
+    together = np.zeros(len(coo.data))
+    for membership in memberships:
+        together += membership[coo.row] == membership[coo.col]
+
+    coassignment = sparse.csr_matrix(
+        (together / max(len(memberships), 1), (coo.row, coo.col)),
+        shape=adjacency.shape,
+    )
+    coassignment.eliminate_zeros()
+    return coassignment
+
+
+def consensus_communities(
+    graph: Graph,
+    coassignment: sparse.csr_matrix,
+    threshold: float = 0.5,
+    seed: Optional[int] = None,
+) -> np.ndarray:
+    """The communities of the co-assignment graph, like in consensus clustering
+    (Lancichinetti & Fortunato, 2012).
+
+    Edges that are in the same community in less than `threshold` of the
+    runs are dropped, and Louvain is run on what is left, weighted by the
+    co-assignment. The stable communities are almost disconnected there, so
+    this is much less sensitive to the seed than a single run.
+    """
+    consensus = coassignment.copy()
+    consensus.data[consensus.data < threshold] = 0
+    consensus.eliminate_zeros()
+    return louvain(Graph(consensus, graph.ids, graph.departments), seed=seed)
+
+
+def compactness(n: pd.Series) -> float:
+    """The sum of the squared percentages of a department in each community,
+    like `spread` in `plot_purity_dots2`. It's 10000 if the department is in a
+    single community, and goes down the more it is split up."""
+    return float(((n / n.sum() * 100) ** 2).sum())
+
+
+def department_purity(
+    graph: Graph, memberships: list[np.ndarray], confidence: float = 0.95
+) -> pd.DataFrame:
+    """How much each department sticks together, with its variability across
+    the runs of an ensemble.
+
+    For every run we take the compactness of each department, and the share
+    of its authors in its largest community. The table has the 'department',
+    its number of authors 'n', and the mean and the `confidence` percentile
+    interval over the runs of both ('compactness_mean', 'compactness_low',
+    'compactness_high', 'top_share_mean', ...).
+    """
+    runs = []
+    for membership in memberships:
+        purity = community_purity(graph, membership)
+        purity = purity[purity["department"] != UNKNOWN_DEPARTMENT]
+        runs.append(
+            purity.groupby("department")["n"].agg(
+                n="sum",
+                compactness=compactness,
+                top_share=lambda n: n.max() / n.sum(),
+            )
+        )
+    runs = pd.concat(runs)
+
+    tail = (1 - confidence) / 2
+    grouped = runs.groupby(level="department")
+    table = pd.DataFrame({"n": grouped["n"].first()})
+    for metric in ("compactness", "top_share"):
+        table[f"{metric}_mean"] = grouped[metric].mean()
+        table[f"{metric}_low"] = grouped[metric].quantile(tail)
+        table[f"{metric}_high"] = grouped[metric].quantile(1 - tail)
+
+    return table.reset_index()
+
+
+@dataclass
+class Ensemble:
+    """The consensus of many seeded runs of the community detection"""
+
+    membership: np.ndarray
+    coassignment: sparse.csr_matrix
+    department_purity: pd.DataFrame
+    modularity: list[float]
+
+
+def summarise_ensemble(
+    graph: Graph,
+    memberships: list[np.ndarray],
+    seed: Optional[int] = 0,
+    confidence: float = 0.95,
+    threshold: float = 0.5,
+) -> Ensemble:
+    coassignment = coassignment_matrix(graph.adjacency, memberships)
+    return Ensemble(
+        membership=consensus_communities(graph, coassignment, threshold, seed),
+        coassignment=coassignment,
+        department_purity=department_purity(graph, memberships, confidence),
+        modularity=[modularity(graph.adjacency, x) for x in memberships],
+    )
+
+
+@dataclass
+class AreaAnalysis:
+    """The analysis of the network of one area (a set of departments)"""
+
+    statistics: dict
+    degree_distribution: np.ndarray
+    purity: Optional[pd.DataFrame] = None
+    ensemble: Optional[Ensemble] = None
+    # The major component, that the communities are of
+    graph: Optional[Graph] = None
+
+
+def summarise_area(
+    graph: Graph,
+    departments: Optional[list[str]],
+    memberships: list[np.ndarray] = (),
+    seed: Optional[int] = 0,
+    confidence: float = 0.95,
+) -> AreaAnalysis:
+    """Put together the analysis of an area, from the communities that were
+    found in it (one membership per run, none for the whole network).
+
+    With more than one run, the purity is that of the consensus communities.
+    """
+    if departments is None:
+        return AreaAnalysis(basic_statistics(graph), degree_distribution(graph))
+
+    statistics = basic_statistics(
+        filter_graph(graph, departments, keep_only_major=False)
+    )
+    subgraph = filter_graph(graph, departments)
+
+    ensemble = None
+    if len(memberships) > 1:
+        ensemble = summarise_ensemble(subgraph, memberships, seed, confidence)
+        membership = ensemble.membership
+        statistics["num_runs"] = len(memberships)
+        statistics["run_modularity"] = ensemble.modularity
+    else:
+        membership = memberships[0]
+
+    statistics["num_communities"] = int(membership.max(initial=-1) + 1)
+    statistics["modularity"] = modularity(subgraph.adjacency, membership)
+
+    return AreaAnalysis(
+        statistics,
+        degree_distribution(subgraph),
+        community_purity(subgraph, membership),
+        ensemble,
+        subgraph if ensemble else None,
+    )
+
+
+def analyse_area(
+    graph: Graph,
+    departments: Optional[list[str]],
+    seed: Optional[int] = 0,
+    runs: int = 1,
+    confidence: float = 0.95,
+) -> AreaAnalysis:
+    """Analyse the network of some departments, or all of it if None.
+
+    The statistics are on the whole area, the rest on its major component.
+    Communities are only found in the areas, not in the whole network, with
+    an ensemble of `runs` seeded runs if more than one.
+    """
+    memberships = []
+    if departments is not None:
+        subgraph = filter_graph(graph, departments)
+        memberships = [louvain(subgraph, seed=x) for x in ensemble_seeds(seed, runs)]
+    return summarise_area(graph, departments, memberships, seed, confidence)
+
+
+def write_ensemble(data_dir: Path, prefix: str, analysis: AreaAnalysis) -> None:
+    """Write the consensus of an ensemble:
+    - `{prefix}_consensus.csv` with the consensus community of each author;
+    - `{prefix}_coassignment.csv` with the co-assignment of each edge;
+    - `{prefix}_department_purity.csv` with the confidence intervals.
+    """
+    graph, ensemble = analysis.graph, analysis.ensemble
+    pd.DataFrame(
+        {
+            "id": graph.ids,
+            "department": graph.departments,
+            "community": ensemble.membership + 1,
+        }
+    ).to_csv(data_dir / f"{prefix}_consensus.csv", index=False)
+
+    # Each edge once, like in the edgelists
+    coassignment = sparse.triu(ensemble.coassignment, k=1).tocoo()
+    pd.DataFrame(
+        {
+            "node_1": graph.ids[coassignment.row],
+            "node_2": graph.ids[coassignment.col],
+            "coassignment": coassignment.data,
+        }
+    ).to_csv(data_dir / f"{prefix}_coassignment.csv", index=False)
+
+    ensemble.department_purity.to_csv(
+        data_dir / f"{prefix}_department_purity.csv", index=False
+    )
+
+
+def write_analysis(
+    output_dir: Path, prefix: str, areas: dict[str, AreaAnalysis]
+) -> Path:
+    """Write the analysis of a network, laid out like the R markdown does.
+
+    The files go in `output_dir/prefix/data/`, which is returned:
+        - `{prefix}_{area}_purity.csv` with the community purity of each area;
+        - `{prefix}_{area}_degree_distribution.csv`;
+        - for ensembles, the files of `write_ensemble`;
+        - `{prefix}_statistics.json` with the basic statistics.
+    """
+    data_dir = Path(output_dir) / prefix / "data"
+    data_dir.mkdir(parents=True, exist_ok=True)
+
+    for area, analysis in areas.items():
+        distribution = analysis.degree_distribution
+        pd.DataFrame(
+            {"degree": np.arange(len(distribution)), "probability": distribution}
+        ).to_csv(data_dir / f"{prefix}_{area}_degree_distribution.csv", index=False)
+
+        if analysis.purity is not None:
+            analysis.purity.to_csv(
+                data_dir / f"{prefix}_{area}_purity.csv", index=False
+            )
+
+        if analysis.ensemble is not None:
+            write_ensemble(data_dir, f"{prefix}_{area}", analysis)
+
+    with (data_dir / f"{prefix}_statistics.json").open("w+") as stream:
+        json.dump({k: v.statistics for k, v in areas.items()}, stream, indent=4)
+
+    return data_dir
+
+
+# The areas that we analyse, with None for the whole network
+AREAS = {"general": None, **SELECTED_DEPARTMENTS}
+
+
+def analyse_network(
+    graph: Graph,
+    output_dir: Path,
+    prefix: str,
+    seed: Optional[int] = 0,
+    runs: int = 1,
+    confidence: float = 0.95,
+) -> dict[str, AreaAnalysis]:
+    """Run the analysis of one network, and write out its tables"""
+    areas = {
+        area: analyse_area(graph, departments, seed, runs, confidence)
+        for area, departments in AREAS.items()
+    }
+    write_analysis(output_dir, prefix, areas)
+
+    return areas
+
+
+@dataclass
+class SharedGraph:
+    """A graph with its adjacency in shared memory, to send to other processes
+    without copying (or pickling) the edges"""
+
+    names: tuple[str, str, str]
+    dtypes: tuple[str, str, str]
+    sizes: tuple[int, int, int]
+    num_nodes: int
+    ids: np.ndarray
+    departments: np.ndarray
+
+
+def share_graph(graph: Graph) -> tuple[SharedGraph, list[SharedMemory]]:
+    """Copy the adjacency of a graph to shared memory.
+
+    The caller has to close and unlink the returned blocks when done.
+    """
+    arrays = (
+        graph.adjacency.indptr,
+        graph.adjacency.indices,
+        graph.adjacency.data,
+    )
+    blocks = []
+    for array in arrays:
+        block = SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+        blocks.append(block)
+
+    shared = SharedGraph(
+        names=tuple(x.name for x in blocks),
+        dtypes=tuple(x.dtype.str for x in arrays),
+        sizes=tuple(len(x) for x in arrays),
+        num_nodes=graph.num_nodes,
+        ids=graph.ids,
+        departments=graph.departments,
+    )
+    return shared, blocks
+
+
+def _louvain_shared_area(
+    shared: SharedGraph, departments: list[str], seed: Optional[int]
+) -> np.ndarray:
+    """Find the communities of an area of a shared graph, in a worker process"""
+    blocks = [SharedMemory(name=x) for x in shared.names]
+    try:
+        indptr, indices, data = (
+            np.ndarray((size,), dtype=dtype, buffer=block.buf)
+            for block, dtype, size in zip(blocks, shared.dtypes, shared.sizes)
+        )
+        adjacency = sparse.csr_matrix(
+            (data, indices, indptr), shape=(shared.num_nodes, shared.num_nodes)
+        )
+        graph = Graph(adjacency, shared.ids, shared.departments)
+        membership = louvain(filter_graph(graph, departments), seed=seed)
+        # Nothing can point to the shared buffers when we close them
+        del graph, adjacency, indptr, indices, data
+    finally:
+        for block in blocks:
+            block.close()
+
+    return membership
+
+
+def find_networks(networks_dir: Path) -> list[tuple[str, Path, Path]]:
+    """Find the (window, edgelist, authors) files made by json_to_network.py.
+
+    The edgelists can be .csv or binary .npy files.
+    """
+    networks = []
+    for edgelist_path in sorted(Path(networks_dir).glob("edgelist_*")):
+        if edgelist_path.suffix not in (".csv", ".npy"):
+            continue
+        if edgelist_path.name.endswith(".ids.csv"):
+            continue
+        prefix = edgelist_path.stem.removeprefix("edgelist_")
+        authors_path = edgelist_path.with_name(f"authors_{prefix}.csv")
+        networks.append((prefix, edgelist_path, authors_path))
+    return networks
+
+
+def consolidate_purity(results: dict[str, dict[str, AreaAnalysis]]) -> pd.DataFrame:
+    """Put the purity tables of all windows and areas in a single table"""
+    tables = []
+    for prefix, areas in results.items():
+        for area, analysis in areas.items():
+            if analysis.purity is not None:
+                tables.append(analysis.purity.assign(window=prefix, area=area))
+
+    columns = ["window", "area", "community", "department", "n"]
+    if not tables:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(tables, ignore_index=True)[columns]
+
+
+def consolidate_department_purity(
+    results: dict[str, dict[str, AreaAnalysis]]
+) -> Optional[pd.DataFrame]:
+    """Put the department purity of all ensembles in a single table, or None
+    if there are no ensembles"""
+    tables = []
+    for prefix, areas in results.items():
+        for area, analysis in areas.items():
+            if analysis.ensemble is not None:
+                table = analysis.ensemble.department_purity
+                tables.append(table.assign(window=prefix, area=area))
+
+    if not tables:
+        return None
+    table = pd.concat(tables, ignore_index=True)
+    columns = ["window", "area"]
+    return table[columns + [x for x in table.columns if x not in columns]]
+
+
+def main(
+    networks_dir: Path,
+    output_dir: Path,
+    seed: Optional[int] = 0,
+    jobs: int = 1,
+    runs: int = 1,
+    confidence: float = 0.95,
+) -> None:
+    """Analyse all edgelist_*.csv (and authors_*.csv) pairs in a folder.
+
+    With more than one run, the communities of each area are found `runs`
+    times with different seeds, and put together in consensus communities
+    (see `summarise_ensemble`).
+
+    With more than one job, each run of each area of each window is done in
+    its own process. The graphs are read here, and shared with the workers
+    through shared memory as soon as they are read.
+
+    Besides the tables of each window, all purity tables are put together in
+    `output_dir/purity.csv`, and those of the ensembles in
+    `output_dir/department_purity.csv`.
+    """
+    results: dict[str, dict[str, AreaAnalysis]] = {}
+    seeds = ensemble_seeds(seed, runs)
+
+    if jobs > 1:
+        blocks = []
+        graphs = {}
+        futures = {}
+        try:
+            with ProcessPoolExecutor(jobs) as pool:
+                for prefix, edgelist_path, authors_path in find_networks(networks_dir):
+                    log.info(f"Reading {prefix}...")
+                    graphs[prefix] = read_graph(edgelist_path, authors_path)
+                    shared, graph_blocks = share_graph(graphs[prefix])
+                    blocks += graph_blocks
+                    for area, departments in AREAS.items():
+                        futures[prefix, area] = [
+                            pool.submit(_louvain_shared_area, shared, departments, x)
+                            for x in (seeds if departments is not None else [])
+                        ]
+
+                for (prefix, area), area_futures in futures.items():
+                    results.setdefault(prefix, {})[area] = summarise_area(
+                        graphs[prefix],
+                        AREAS[area],
+                        [x.result() for x in area_futures],
+                        seed,
+                        confidence,
+                    )
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+    else:
+        for prefix, edgelist_path, authors_path in find_networks(networks_dir):
+            log.info(f"Analysing {prefix}...")
+            graph = read_graph(edgelist_path, authors_path)
+            results[prefix] = {
+                area: analyse_area(graph, departments, seed, runs, confidence)
+                for area, departments in AREAS.items()
+            }
+
+    for prefix, areas in results.items():
+        write_analysis(output_dir, prefix, areas)
+
+    consolidate_purity(results).to_csv(Path(output_dir) / "purity.csv", index=False)
+    department_purity = consolidate_department_purity(results)
+    if department_purity is not None:
+        department_purity.to_csv(
+            Path(output_dir) / "department_purity.csv", index=False
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "networks_dir",
+        help="Folder with the edgelist_*.csv (or .npy) and authors_*.csv files",
+        type=Path,
+    )
+    parser.add_argument(
+        "output_dir", help="Folder to write the analysis tables in", type=Path
+    )
+    parser.add_argument(
+        "--seed", help="Seed for the community detection", type=int, default=0
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of processes to analyse the networks with",
+        type=int,
+        default=1,
+    )
+
+    parser.add_argument(
+        "--runs",
+        help=(
+            "Number of seeded runs of the community detection. With more than "
+            "one, the consensus communities are reported"
+        ),
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--confidence",
+        help="Confidence level of the department purity intervals of --runs",
+        type=float,
+        default=0.95,
+    )
+
+    args = parser.parse_args()
+
+    if args.runs < 1:
+        parser.error("--runs must be at least 1")
+    if not 0 < args.confidence < 1:
+        parser.error("--confidence must be between 0 and 1")
+
+    main(
+        args.networks_dir,
+        args.output_dir,
+        seed=args.seed,
+        jobs=args.jobs,
+        runs=args.runs,
+        confidence=args.confidence,
+    )
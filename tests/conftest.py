@@ -0,0 +1,61 @@
+"""Shared fixtures of the tests of the preparsing scripts.
+
+The scripts import each other by name, so their folders go in the path, like
+when they are run.
+"""
+
+from pathlib import Path
+import sys
+
+import pytest
+
+SRC = Path(__file__).parent.parent / "src"
+sys.path.append(str(SRC / "data_preparsing"))
+sys.path.append(str(SRC))
+
+from digest import DigestFormat, open_digest_writer
+
+UNITO = "university of turin"
+AUTHORS = [
+    {
+        "name": "ada",
+        "surname": "rossi",
+        "affiliation": UNITO,
+        "department": "biologia",
+        "id": "rp1",
+    },
+    {
+        "name": "bea",
+        "surname": "bianchi",
+        "affiliation": UNITO,
+        "department": "chimica",
+        "id": "rp2",
+    },
+    {
+        "name": "cleo",
+        "surname": "verdi",
+        "affiliation": UNITO,
+        "department": None,
+        "id": "rp3",
+    },
+]
+
+# Missing years come out of the IRIS files as NaN
+PAPERS = [
+    {"id": "2318/1", "title": "One", "year": 2012.0, "authors": ["rp1", "rp2"]},
+    {"id": "2318/2", "title": "Two", "year": float("nan"), "authors": ["rp2", "rp3"]},
+    {"id": "2318/3", "title": "Three", "year": 2013.0, "authors": ["rp1", "rp3"]},
+]
+
+
+@pytest.fixture
+def write_digest():
+    """Write the test digest (the AUTHORS and PAPERS) to a path"""
+
+    def write(path: Path, format: DigestFormat = DigestFormat.JSONL) -> Path:
+        with open_digest_writer(path, format) as writer:
+            writer.write_authors(dict(x) for x in AUTHORS)
+            writer.write_papers(dict(x) for x in PAPERS)
+        return path
+
+    return write
@@ -0,0 +1,13 @@
+from cache import cache_key
+from digest import DigestFormat
+from digest_index import build_index
+
+
+def test_building_the_index_keeps_the_digest_key(tmp_path, write_digest):
+    folder = write_digest(tmp_path / "digest", DigestFormat.COLUMNAR)
+    before = cache_key("json_to_network", {}, inputs=[folder])
+
+    build_index(folder)
+
+    assert any(folder.glob("index.*"))
+    assert cache_key("json_to_network", {}, inputs=[folder]) == before
@@ -0,0 +1,30 @@
+import pytest
+
+from conftest import AUTHORS, PAPERS
+from digest import DigestFormat, open_digest_reader, open_digest_writer
+
+
+@pytest.mark.parametrize(
+    "format, indent",
+    [
+        (DigestFormat.JSON, None),
+        (DigestFormat.JSON, 4),
+        (DigestFormat.JSONL, None),
+        (DigestFormat.COLUMNAR, None),
+    ],
+)
+def test_read_back(tmp_path, format, indent):
+    path = tmp_path / "digest"
+    with open_digest_writer(path, format, indent=indent) as writer:
+        writer.write_authors(dict(x) for x in AUTHORS)
+        writer.write_papers(dict(x) for x in PAPERS)
+
+    with open_digest_reader(path) as reader:
+        authors = list(reader.authors())
+        papers = list(reader.papers())
+
+    assert authors == AUTHORS
+    # NaN != NaN, so the years are compared as strings
+    assert [{**x, "year": str(x["year"])} for x in papers] == [
+        {**x, "year": str(x["year"])} for x in PAPERS
+    ]
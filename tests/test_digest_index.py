@@ -0,0 +1,13 @@
+from digest import DigestFormat
+from digest_index import DigestIndex, build_index
+
+
+def test_build_skips_papers_without_a_year(tmp_path, write_digest):
+    folder = write_digest(tmp_path / "digest", DigestFormat.COLUMNAR)
+
+    build_index(folder)
+
+    index = DigestIndex(folder)
+    assert index.years.tolist() == [2012, 2013]
+    assert index.papers_in_years().tolist() == [0, 2]
+    assert index.papers_in_years(2013, 2013).tolist() == [2]
@@ -0,0 +1,26 @@
+import csv
+
+from json_to_network import WeightStrategy, main_windowed
+
+
+def read_edges(path):
+    with path.open() as stream:
+        return {(x["node_1"], x["node_2"]) for x in csv.DictReader(stream)}
+
+
+def test_windows_skip_papers_without_a_year(tmp_path, write_digest):
+    digest = write_digest(tmp_path / "digest.jsonl")
+
+    main_windowed(
+        digest,
+        tmp_path / "edges_{minyear}-{maxyear}.csv",
+        tmp_path / "authors_{minyear}-{maxyear}.csv",
+        WeightStrategy("unweighted"),
+        width=2,
+    )
+
+    # The paper with a NaN year (rp2, rp3) is in no window
+    assert read_edges(tmp_path / "edges_2012-2013.csv") == {
+        ("rp1", "rp2"),
+        ("rp1", "rp3"),
+    }
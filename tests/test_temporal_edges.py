@@ -0,0 +1,20 @@
+from digest import open_digest_reader
+from json_to_network import WeightStrategy
+from temporal_edges import TemporalEdges, build_store
+
+
+def test_build_skips_papers_without_a_year(tmp_path, write_digest):
+    digest = write_digest(tmp_path / "digest.jsonl")
+    with open_digest_reader(digest) as reader:
+        build_store(reader.authors(), reader.papers(), tmp_path / "store")
+
+    store = TemporalEdges(tmp_path / "store")
+    assert store.years.tolist() == [2012, 2013]
+
+    # The paper with a NaN year (rp2, rp3) has no edges
+    edges = store.edges(WeightStrategy.LINEAR)
+    pairs = {
+        tuple(sorted((edges.ids[x], edges.ids[y])))
+        for x, y in zip(edges.source, edges.sink)
+    }
+    assert pairs == {("rp1", "rp2"), ("rp1", "rp3")}